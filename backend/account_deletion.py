@@ -0,0 +1,127 @@
+"""Cascading account deletion, run as a background job in batches.
+
+``request_deletion`` marks the user deleted (they stop authenticating and
+drop out of discovery and other users' match lists) and records a progress
+document in ``account_deletions``. ``run_deletion`` then removes the user's
+data phase by phase, ``BATCH_SIZE`` documents at a time:
+
+    matches   each batch of matches plus every message in those threads
+    swipes    swipes made by or on the user
+    sessions  login sessions
+    user      the user document itself
+
+Every batch deletes what it has just read, so the database itself is the
+cursor: a run that dies part way (or is retried by the job queue) picks up
+where it stopped. The progress document records the current phase and the
+running counts for ``GET /api/users/me/deletion-status``. If the job queue
+gives up on the job, ``mark_failed`` records a terminal ``failed`` status;
+requesting the deletion again starts it over.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+PHASES = ("matches", "swipes", "sessions", "user")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def request_deletion(db, user_id: str) -> Dict[str, Any]:
+    """Mark ``user_id`` deleted and create (or reset) its progress document."""
+    now = _now()
+    await db.users.update_one(
+        {"user_id": user_id},
+        {
+            "$set": {"deleted": True, "deleted_at": now, "is_active": False, "profile_complete": False},
+            "$inc": {"profile_version": 1},
+        },
+    )
+    progress = {
+        "user_id": user_id,
+        "status": "pending",
+        "phase": PHASES[0],
+        "deleted": {"messages": 0, "matches": 0, "swipes": 0, "sessions": 0, "user": 0},
+        "requested_at": now,
+        "updated_at": now,
+        "finished_at": None,
+    }
+    await db.account_deletions.replace_one({"user_id": user_id}, progress, upsert=True)
+    return progress
+
+
+async def get_progress(db, user_id: str) -> Optional[Dict[str, Any]]:
+    return await db.account_deletions.find_one({"user_id": user_id}, {"_id": 0})
+
+
+async def _advance(db, user_id: str, update: Dict[str, Any]) -> None:
+    update.setdefault("$set", {})["updated_at"] = _now()
+    await db.account_deletions.update_one({"user_id": user_id}, update)
+
+
+async def _delete_batch(collection, query: Dict[str, Any], batch_size: int) -> int:
+    """Delete up to ``batch_size`` documents matching ``query``."""
+    docs = await collection.find(query, {"_id": 1}).limit(batch_size).to_list(batch_size)
+    if not docs:
+        return 0
+    result = await collection.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+    return result.deleted_count
+
+
+async def _delete_matches(db, user_id: str, batch_size: int) -> None:
+    involving = {"$or": [{"user1_id": user_id}, {"user2_id": user_id}]}
+    while True:
+        matches = await db.matches.find(involving, {"_id": 1, "match_id": 1}).limit(batch_size).to_list(batch_size)
+        if not matches:
+            return
+        # Messages first: if we stop here the matches are still there to find them again
+        thread = {"match_id": {"$in": [m["match_id"] for m in matches]}}
+        while True:
+            removed = await _delete_batch(db.messages, thread, batch_size)
+            if not removed:
+                break
+            await _advance(db, user_id, {"$inc": {"deleted.messages": removed}})
+        result = await db.matches.delete_many({"_id": {"$in": [m["_id"] for m in matches]}})
+        await _advance(db, user_id, {"$inc": {"deleted.matches": result.deleted_count}})
+
+
+async def _delete_all(db, user_id: str, collection: str, query: Dict[str, Any], batch_size: int) -> None:
+    while True:
+        removed = await _delete_batch(db[collection], query, batch_size)
+        if not removed:
+            return
+        await _advance(db, user_id, {"$inc": {f"deleted.{collection.removeprefix('user_')}": removed}})
+
+
+async def run_deletion(db, user_id: str, batch_size: int = BATCH_SIZE) -> None:
+    """Delete everything belonging to ``user_id``, resuming from the recorded phase."""
+    progress = await get_progress(db, user_id)
+    if progress is None or progress["status"] == "done":
+        return
+    await _advance(db, user_id, {"$set": {"status": "running"}})
+
+    for phase in PHASES[PHASES.index(progress["phase"]):]:
+        await _advance(db, user_id, {"$set": {"phase": phase}})
+        if phase == "matches":
+            await _delete_matches(db, user_id, batch_size)
+        elif phase == "swipes":
+            await _delete_all(db, user_id, "swipes", {"$or": [{"swiper_id": user_id}, {"target_id": user_id}]}, batch_size)
+        elif phase == "sessions":
+            await _delete_all(db, user_id, "user_sessions", {"user_id": user_id}, batch_size)
+        elif phase == "user":
+            result = await db.users.delete_one({"user_id": user_id, "deleted": True})
+            await _advance(db, user_id, {"$inc": {"deleted.user": result.deleted_count}})
+
+    await _advance(db, user_id, {"$set": {"status": "done", "finished_at": _now()}})
+    logger.info("Account %s deleted", user_id)
+
+
+async def mark_failed(db, user_id: str, error: str) -> None:
+    """Record that the deletion stopped for good (the job ran out of attempts)."""
+    await _advance(db, user_id, {"$set": {"status": "failed", "error": error, "finished_at": _now()}})
+    logger.error("Deletion of account %s failed: %s", user_id, error)
@@ -0,0 +1,195 @@
+"""Priority-aware admission control: per-class concurrency with queue deadlines.
+
+Each request is put in a class by path prefix (auth, interactive swipe/chat,
+discover, ai, admin). A class admits up to ``max_concurrency`` requests at a
+time and queues at most ``max_queue`` more; a request that can't get a slot
+within the class's ``deadline`` (or finds the queue full) is shed at once
+with 503 and Retry-After, instead of timing out later. Classes don't share
+capacity, so an AI pileup or a login storm can't starve chat and swipes.
+
+Every limit can be set per class from the environment, e.g.
+``ADMISSION_AI_CONCURRENCY``, ``ADMISSION_AI_QUEUE``,
+``ADMISSION_AI_DEADLINE_SECONDS``; ``ADMISSION_ENABLED=false`` turns it off.
+Health checks and ``/metrics`` are never queued.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.responses import JSONResponse
+
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class Shed(Exception):
+    """Raised when a request is refused a slot."""
+
+    def __init__(self, cls: str, reason: str, retry_after: float):
+        super().__init__(f"{cls} request shed ({reason})")
+        self.cls = cls
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionClass:
+    name: str
+    max_concurrency: int
+    max_queue: int
+    deadline: float
+    retry_after: float = 2.0
+
+    @classmethod
+    def from_env(cls, name: str, max_concurrency: int, max_queue: int, deadline: float, retry_after: float = 2.0) -> "AdmissionClass":
+        prefix = f"ADMISSION_{name.upper()}_"
+        return cls(
+            name,
+            int(os.environ.get(prefix + "CONCURRENCY", max_concurrency)),
+            int(os.environ.get(prefix + "QUEUE", max_queue)),
+            float(os.environ.get(prefix + "DEADLINE_SECONDS", deadline)),
+            float(os.environ.get(prefix + "RETRY_AFTER_SECONDS", retry_after)),
+        )
+
+
+class AdmissionGate:
+    """Slots for one class. Waiters are plain futures handed a slot in FIFO
+    order on release, so the gate isn't tied to one event loop."""
+
+    def __init__(self, config: AdmissionClass):
+        self.config = config
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "deadline": 0}
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _shed(self, reason: str) -> Shed:
+        self.shed[reason] += 1
+        ADMISSION_SHED.inc(**{"class": self.config.name, "reason": reason})
+        return Shed(self.config.name, reason, self.config.retry_after)
+
+    def _admit(self, waited: float) -> None:
+        self.admitted += 1
+        ADMISSION_WAIT_SECONDS.observe(waited, **{"class": self.config.name})
+        ADMISSION_IN_FLIGHT.set(self.active, **{"class": self.config.name})
+
+    async def acquire(self) -> None:
+        """Take a slot or raise ``Shed``."""
+        if self.active < self.config.max_concurrency and not self._waiters:
+            self.active += 1
+            self._admit(0.0)
+            return
+        if len(self._waiters) >= self.config.max_queue:
+            raise self._shed("queue_full")
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters), **{"class": self.config.name})
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.config.deadline)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                raise self._shed("deadline") from None
+            # Handed a slot just as the deadline hit: take it
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                self.release()
+            raise
+        finally:
+            ADMISSION_QUEUE_DEPTH.set(len(self._waiters), **{"class": self.config.name})
+        self._admit(time.monotonic() - started)
+
+    def _abandon(self, waiter: asyncio.Future) -> bool:
+        """Leave the queue; False if the waiter already owns a slot."""
+        if waiter.done() and not waiter.cancelled():
+            return False
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        return True
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot moves to the waiter
+                return
+        self.active -= 1
+        ADMISSION_IN_FLIGHT.set(self.active, **{"class": self.config.name})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.config.max_concurrency,
+            "max_queue": self.config.max_queue,
+            "deadline_seconds": self.config.deadline,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
+
+
+class AdmissionController:
+    """Routes requests to gates by the longest matching path prefix."""
+
+    def __init__(
+        self,
+        classes: Sequence[AdmissionClass],
+        routes: Sequence[Tuple[str, Optional[str]]],
+        default: str,
+        enabled: bool = True,
+    ):
+        self.gates = {c.name: AdmissionGate(c) for c in classes}
+        # (prefix, class name or None for never-queued paths), longest first
+        self.routes: List[Tuple[str, Optional[str]]] = sorted(routes, key=lambda r: len(r[0]), reverse=True)
+        self.default = default
+        self.enabled = enabled
+
+    def classify(self, path: str) -> Optional[str]:
+        for prefix, name in self.routes:
+            if path.startswith(prefix):
+                return name
+        return self.default
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "classes": {name: gate.stats() for name, gate in self.gates.items()}}
+
+
+class AdmissionMiddleware:
+    """ASGI middleware around the app: the slot is held until the response
+    (a stream included) has been sent completely."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        name = self.controller.classify(scope["path"]) if scope["type"] == "http" and self.controller.enabled else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        gate = self.controller.gates[name]
+        try:
+            await gate.acquire()
+        except Shed as exc:
+            logger.warning("Shed %s %s: %s", scope["method"], scope["path"], exc.reason)
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server busy, try again shortly"},
+                headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
@@ -0,0 +1,143 @@
+"""Content-addressed cache for AI roasts, compatibility analyses and icebreakers.
+
+Keys are a hash of the normalized inputs (red flags, negative qualities, ...),
+so two users with the same flags share entries. Each key keeps up to
+``variants`` completions: until that many exist a request generates a new one,
+after that a random stored variant is served. Entries live in an in-memory LRU
+and are written through to Mongo so they survive restarts and are shared
+between workers. Concurrent misses on the same key share one generation.
+
+With a ``refill`` callback (e.g. a background job), a partially filled entry
+is served immediately and the remaining variants are generated off the
+request path instead.
+
+Nothing is invalidated when a profile changes: new flags hash to a new key,
+and the old entry stays valid for anyone who still has those flags. Unused
+entries fall out of the LRU and expire from Mongo by TTL.
+"""
+import hashlib
+import json
+import logging
+import random
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from concurrency import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, (list, tuple, set)):
+        return sorted(_normalize(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    return value
+
+
+def cache_key(kind: str, inputs: Dict[str, Any]) -> str:
+    payload = json.dumps({"kind": kind, "inputs": _normalize(inputs)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AIResponseCache:
+    def __init__(self, collection, max_entries: int = 5000, variants: int = 3):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.variants = variants
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._flight = SingleFlight()
+
+    def _remember(self, key: str, variants: List[str]) -> None:
+        self._entries[key] = {"variants": list(variants)}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _load(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        doc = await self.collection.find_one({"_id": key}, {"variants": 1})
+        if doc is None:
+            return None
+        self._remember(key, doc.get("variants", []))
+        return self._entries[key]
+
+    async def lookup(
+        self,
+        kind: str,
+        inputs: Dict[str, Any],
+        partial: bool = False,
+    ) -> Optional[str]:
+        """A random stored variant once the key has a full set (or any, if
+        ``partial``), else None (a miss)."""
+        entry = await self._load(cache_key(kind, inputs))
+        needed = 1 if partial else self.variants
+        if entry is not None and len(entry["variants"]) >= needed:
+            self.hits += 1
+            return random.choice(entry["variants"])
+        self.misses += 1
+        return None
+
+    async def get_or_generate(
+        self,
+        kind: str,
+        inputs: Dict[str, Any],
+        generate: Callable[[], Awaitable[str]],
+        refill: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> str:
+        """Serve a cached variant, or generate (and store) a new one."""
+        cached = await self.lookup(kind, inputs, partial=refill is not None)
+        if cached is not None:
+            if refill is not None and await self.variant_count(kind, inputs) < self.variants:
+                await refill()
+            return cached
+
+        async def generate_and_store() -> str:
+            text = await generate()
+            await self.store(kind, inputs, text)
+            return text
+
+        return await self._flight.do(cache_key(kind, inputs), generate_and_store)
+
+    async def variant_count(self, kind: str, inputs: Dict[str, Any]) -> int:
+        entry = await self._load(cache_key(kind, inputs))
+        return len(entry["variants"]) if entry else 0
+
+    async def store(self, kind: str, inputs: Dict[str, Any], text: str) -> None:
+        key = cache_key(kind, inputs)
+        entry = self._entries.get(key)
+        variants = (entry["variants"] if entry else []) + [text]
+        self._remember(key, variants[-self.variants:])
+        now = datetime.now(timezone.utc)
+        await self.collection.update_one(
+            {"_id": key},
+            {
+                "$push": {"variants": {"$each": [text], "$slice": -self.variants}},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {"kind": kind, "created_at": now},
+            },
+            upsert=True,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "upstream_calls": self._flight.calls,
+            "coalesced": self._flight.coalesced,
+            "in_flight": self._flight.in_flight,
+        }
@@ -0,0 +1,201 @@
+"""AI service: prompt templates and the shared LLM provider for /api/ai/*.
+
+One ``AIService`` is created at import and started once on app startup, which
+loads the provider's client library and opens its connection pool. Prompt
+templates are parsed and checked at import, so a request only fills in values.
+Every upstream call is timed per feature (``kind``).
+"""
+import string
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from llm import LLMProvider
+
+
+class PromptTemplate:
+    """A system message plus a ``str.format`` user prompt with validated fields."""
+
+    def __init__(self, system_message: str, text: str):
+        self.system_message = system_message
+        self.text = text
+        self.fields = frozenset(name for _, name, _, _ in string.Formatter().parse(text) if name)
+
+    def render(self, **values: str) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Missing prompt values: {', '.join(sorted(missing))}")
+        return self.text.format(**values)
+
+
+ROAST = PromptTemplate(
+    "You are a witty, playful comedian who writes self-deprecating roasts.",
+    """You are a witty comedian on a dating app called "Unhinged" where people share their red flags.
+    Generate a short, funny, self-deprecating roast (2-3 sentences) based on these traits:
+    Red Flags: {red_flags}
+    Negative Qualities: {negative_qualities}
+
+    Keep it playful and not mean-spirited. Make it something the person would laugh at and want to share.""",
+)
+
+COMPATIBILITY = PromptTemplate(
+    "You are a comedic dating analyst who finds humor in human flaws.",
+    """You're an AI dating coach on "Unhinged" - a satirical app matching people by red flags.
+
+    Person A's Red Flags: {a_red_flags}
+    Person A's Negative Qualities: {a_negative_qualities}
+
+    Person B's Red Flags: {b_red_flags}
+    Person B's Negative Qualities: {b_negative_qualities}
+
+    Generate a funny "compatibility analysis" (3-4 sentences) explaining why their flaws might work together or hilariously clash.
+    Include a made-up "Chaos Compatibility Score" percentage.
+    Keep it playful and entertaining.""",
+)
+
+ICEBREAKER = PromptTemplate(
+    "You write clever, self-deprecating icebreaker messages.",
+    """Generate a funny, self-aware icebreaker message for a dating app called "Unhinged" where people embrace their flaws.
+
+    Sender's Red Flags: {sender_red_flags}
+    Recipient's Red Flags: {recipient_red_flags}
+    Recipient's Name: {recipient_name}
+
+    Create ONE short, witty opening message that acknowledges their shared chaos.
+    Keep it under 2 sentences. Make it memorable and conversation-starting.""",
+)
+
+
+@dataclass
+class AIPrompt:
+    """Everything needed to generate (or look up) one AI response"""
+    kind: str
+    inputs: Dict[str, Any]
+    system_message: str
+    prompt: str
+    session_id: str
+
+
+def roast_prompt(user: dict) -> AIPrompt:
+    red_flags = user.get("red_flags", [])
+    negative_qualities = user.get("negative_qualities", [])
+    return AIPrompt(
+        kind="roast",
+        inputs={"red_flags": red_flags, "negative_qualities": negative_qualities},
+        system_message=ROAST.system_message,
+        prompt=ROAST.render(
+            red_flags=', '.join(red_flags) if red_flags else 'None shared',
+            negative_qualities=', '.join(negative_qualities) if negative_qualities else 'None shared',
+        ),
+        session_id=f"roast_{user['user_id']}_{uuid.uuid4().hex[:8]}",
+    )
+
+
+def compatibility_prompt(user: dict, target: dict) -> AIPrompt:
+    return AIPrompt(
+        kind="compatibility",
+        inputs={
+            "a_red_flags": user.get("red_flags", []),
+            "a_negative_qualities": user.get("negative_qualities", []),
+            "b_red_flags": target.get("red_flags", []),
+            "b_negative_qualities": target.get("negative_qualities", []),
+        },
+        system_message=COMPATIBILITY.system_message,
+        prompt=COMPATIBILITY.render(
+            a_red_flags=', '.join(user.get('red_flags', ['None listed'])),
+            a_negative_qualities=', '.join(user.get('negative_qualities', ['None listed'])),
+            b_red_flags=', '.join(target.get('red_flags', ['None listed'])),
+            b_negative_qualities=', '.join(target.get('negative_qualities', ['None listed'])),
+        ),
+        session_id=f"compat_{user['user_id']}_{uuid.uuid4().hex[:8]}",
+    )
+
+
+def icebreaker_prompt(user: dict, target: dict) -> AIPrompt:
+    return AIPrompt(
+        kind="icebreaker",
+        inputs={
+            "sender_red_flags": user.get("red_flags", []),
+            "recipient_red_flags": target.get("red_flags", []),
+            "recipient_name": target.get("name", "there"),
+        },
+        system_message=ICEBREAKER.system_message,
+        prompt=ICEBREAKER.render(
+            sender_red_flags=', '.join(user.get('red_flags', ['mysterious'])),
+            recipient_red_flags=', '.join(target.get('red_flags', ['mysterious'])),
+            recipient_name=target.get('name', 'there'),
+        ),
+        session_id=f"ice_{user['user_id']}_{uuid.uuid4().hex[:8]}",
+    )
+
+
+class AIService:
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self.started = False
+        # kind -> [calls, errors, total_seconds, max_seconds, first_token_seconds_total, streams]
+        self._timings: Dict[str, List[float]] = {}
+
+    @property
+    def configured(self) -> bool:
+        return self.provider.configured
+
+    @property
+    def streams(self) -> bool:
+        return self.provider.streams
+
+    async def start(self) -> None:
+        if not self.started:
+            await self.provider.start()
+            self.started = True
+
+    async def close(self) -> None:
+        if self.started:
+            await self.provider.close()
+            self.started = False
+
+    def _record(self, kind: str, elapsed: float, error: bool, first_token: Optional[float] = None) -> None:
+        t = self._timings.setdefault(kind, [0, 0, 0.0, 0.0, 0.0, 0])
+        t[0] += 1
+        t[1] += int(error)
+        t[2] += elapsed
+        t[3] = max(t[3], elapsed)
+        if first_token is not None:
+            t[4] += first_token
+            t[5] += 1
+
+    async def complete(self, spec: AIPrompt) -> str:
+        started = time.perf_counter()
+        error = True
+        try:
+            text = await self.provider.complete(spec.system_message, spec.prompt, session_id=spec.session_id)
+            error = False
+            return text
+        finally:
+            self._record(spec.kind, time.perf_counter() - started, error)
+
+    async def stream(self, spec: AIPrompt) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        first_token = None
+        error = True
+        try:
+            async for token in self.provider.stream(spec.system_message, spec.prompt, session_id=spec.session_id):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                yield token
+            error = False
+        finally:
+            self._record(spec.kind, time.perf_counter() - started, error, first_token)
+
+    def stats(self) -> Dict[str, Any]:
+        per_kind: Dict[str, Dict[str, Any]] = {}
+        for kind, (calls, errors, total, worst, first_total, streams) in self._timings.items():
+            per_kind[kind] = {
+                "calls": calls,
+                "errors": errors,
+                "seconds_avg": round(total / calls, 4) if calls else 0.0,
+                "seconds_max": round(worst, 4),
+                "first_token_seconds_avg": round(first_total / streams, 4) if streams else None,
+            }
+        return {"provider": self.provider.name, "started": self.started, "calls": per_kind}
@@ -0,0 +1,405 @@
+"""Two-tier cache with cross-worker invalidation.
+
+``TieredCache`` reads through an in-process LRU+TTL tier (``LocalCache``) and
+an optional shared tier (``SharedTier``: ``MongoSharedTier``, or
+``MemorySharedTier`` as a local stand-in), then falls back to a loader.
+``invalidate(key)`` drops the key everywhere and publishes it on an
+``InvalidationBus`` so every other worker drops its local copy too
+(``MongoBus`` tails a capped collection; ``LocalBus`` connects caches in one
+process).
+
+Keys are versioned: the shared tier keeps a generation per key that every
+invalidation bumps, and a loaded value is only stored if the generation it
+was read under is still current. A request that read the database just
+before an invalidation therefore can't put the stale value back, and
+requests arriving after it don't join that request's load. Every entry
+also has a TTL, so a worker that misses a broadcast serves stale data for at
+most that long.
+
+Cached values are shared between requests: treat them as read-only.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import CursorType, ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+from concurrency import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== LOCAL TIER ====================
+
+class LocalCache:
+    """LRU with a per-entry deadline, plus the last generation seen per key."""
+
+    def __init__(self, max_entries: int = 10_000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        # key -> (value, expires)
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        # key -> (generation, when last invalidated), for keys invalidated recently
+        self._generations: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[1] <= self.clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[0]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (value, self.clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def generation(self, key: str) -> int:
+        return self._generations.get(key, (0, 0.0))[0]
+
+    def invalidated_within(self, key: str, seconds: float) -> bool:
+        last = self._generations.get(key)
+        return last is not None and self.clock() - last[1] < seconds
+
+    def invalidate(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._generations[key] = (self.generation(key) + 1, self.clock())
+        self._generations.move_to_end(key)
+        while len(self._generations) > self.max_entries:
+            self._generations.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ==================== SHARED TIER ====================
+
+class SharedTier:
+    """Interface for a cache all workers see."""
+
+    async def get(self, key: str) -> Tuple[Optional[Any], int]:
+        """(value or None, current generation)"""
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float, generation: int) -> bool:
+        """Store ``value`` only if ``key`` is still at ``generation``."""
+        raise NotImplementedError
+
+    async def invalidate(self, key: str) -> int:
+        """Drop the value and bump the generation; returns the new one."""
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        pass
+
+
+class MemorySharedTier(SharedTier):
+    """In-process stand-in with the same semantics (tests, single-worker dev)."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # key -> [value, generation, expires]
+        self._entries: Dict[str, list] = {}
+
+    async def get(self, key: str) -> Tuple[Optional[Any], int]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, 0
+        if entry[2] <= self.clock():
+            entry[0] = None
+        return entry[0], entry[1]
+
+    async def set(self, key: str, value: Any, ttl: float, generation: int) -> bool:
+        entry = self._entries.get(key)
+        if (entry[1] if entry else 0) != generation:
+            return False
+        self._entries[key] = [value, generation, self.clock() + ttl]
+        return True
+
+    async def invalidate(self, key: str) -> int:
+        entry = self._entries.setdefault(key, [None, 0, 0.0])
+        entry[0] = None
+        entry[1] += 1
+        return entry[1]
+
+
+class MongoSharedTier(SharedTier):
+    """One document per key: ``{_id: key, value, generation, expires_at}``.
+    Documents (tombstones included) are removed by the ``cache`` TTL index in
+    db_indexes.py after they expire; until then they keep the generation."""
+
+    # Tombstones outlive the longest TTL so a late writer still sees the bump
+    TOMBSTONE_SECONDS = 3600
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, key: str) -> Tuple[Optional[Any], int]:
+        doc = await self.collection.find_one({"_id": key})
+        if doc is None:
+            return None, 0
+        expires_at = doc.get("expires_at")
+        if expires_at is not None and expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if doc.get("value") is None or expires_at is None or expires_at <= datetime.now(timezone.utc):
+            return None, doc.get("generation", 0)
+        return doc["value"], doc.get("generation", 0)
+
+    async def set(self, key: str, value: Any, ttl: float, generation: int) -> bool:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        try:
+            result = await self.collection.update_one(
+                {"_id": key, "generation": generation} if generation else {"_id": key, "generation": {"$in": [0, None]}},
+                {"$set": {"value": value, "generation": generation, "expires_at": expires_at}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False  # the key moved to a newer generation meanwhile
+        return bool(result.matched_count or result.upserted_id is not None)
+
+    async def invalidate(self, key: str) -> int:
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            {
+                "$inc": {"generation": 1},
+                "$set": {"value": None, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.TOMBSTONE_SECONDS)},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["generation"]
+
+
+# ==================== INVALIDATION BUS ====================
+
+Subscriber = Callable[[List[str]], None]
+
+
+class InvalidationBus:
+    """Interface: deliver invalidated keys to every other worker."""
+
+    def subscribe(self, callback: Subscriber) -> None:
+        raise NotImplementedError
+
+    async def publish(self, keys: List[str]) -> None:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class LocalBus(InvalidationBus):
+    """Fan-out between caches in this process (stand-in for a shared bus)."""
+
+    def __init__(self):
+        self._subscribers: List[Subscriber] = []
+        self.published = 0
+
+    def subscribe(self, callback: Subscriber) -> None:
+        self._subscribers.append(callback)
+
+    async def publish(self, keys: List[str]) -> None:
+        self.published += 1
+        for callback in self._subscribers:
+            callback(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"published": self.published}
+
+
+class MongoBus(InvalidationBus):
+    """Invalidations as documents in a capped collection, read by every
+    worker through a tailable cursor (works without a replica set). A worker
+    skips its own messages; it already applied them locally."""
+
+    def __init__(self, db, name: str = "cache_invalidations", size_bytes: int = 4 * 1024 * 1024, retry_seconds: float = 1.0):
+        self.db = db
+        self.name = name
+        self.size_bytes = size_bytes
+        self.retry_seconds = retry_seconds
+        self.origin = uuid.uuid4().hex
+        self._subscribers: List[Subscriber] = []
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+
+    def subscribe(self, callback: Subscriber) -> None:
+        self._subscribers.append(callback)
+
+    async def publish(self, keys: List[str]) -> None:
+        if self._task is None:
+            return  # not started: this process isn't serving (tests, CLI tools)
+        self.published += 1
+        await self.db[self.name].insert_one({"origin": self.origin, "keys": keys, "at": datetime.now(timezone.utc)})
+
+    async def start(self) -> None:
+        try:
+            await self.db.create_collection(self.name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # already there
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _tail(self) -> None:
+        collection = self.db[self.name]
+        # Start after whatever is already there: local caches begin empty
+        last = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                async for doc in cursor:
+                    last_id = doc["_id"]
+                    if doc.get("origin") != self.origin:
+                        self.received += 1
+                        for callback in self._subscribers:
+                            callback(doc.get("keys", []))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Cache invalidation bus cursor failed: %r", exc)
+            # The cursor dies on an empty collection or a dropped connection
+            self.reconnects += 1
+            await asyncio.sleep(self.retry_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"published": self.published, "received": self.received, "reconnects": self.reconnects}
+
+
+# ==================== TIERED CACHE ====================
+
+class TieredCache:
+    def __init__(
+        self,
+        local: Optional[LocalCache] = None,
+        shared: Optional[SharedTier] = None,
+        bus: Optional[InvalidationBus] = None,
+        local_ttl: float = 30.0,
+    ):
+        self.local = local or LocalCache()
+        self.shared = shared
+        self.bus = bus
+        self.local_ttl = local_ttl
+        self._flight = SingleFlight()
+        self.hits = {"local": 0, "shared": 0}
+        self.misses = 0
+        self.stale_writes = 0
+        self.invalidations = {"sent": 0, "received": 0}
+        if bus is not None:
+            bus.subscribe(self._on_invalidation)
+
+    async def start(self) -> None:
+        if self.shared is not None:
+            await self.shared.start()
+        if self.bus is not None:
+            await self.bus.start()
+
+    async def stop(self) -> None:
+        if self.bus is not None:
+            await self.bus.stop()
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Cached value for ``key``, else ``await loader()`` (concurrent misses
+        share one load). ``None`` results are not cached."""
+        found, value = self.local.get(key)
+        if found:
+            self.hits["local"] += 1
+            return value
+        # Loads are shared per generation: a caller arriving after an
+        # invalidation starts a fresh load instead of joining one that
+        # may have read the old data
+        local_generation = self.local.generation(key)
+        return await self._flight.do(
+            (key, local_generation), lambda: self._load(key, loader, ttl or self.local_ttl, local_generation)
+        )
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float, local_generation: int) -> Any:
+        generation = 0
+        if self.shared is not None:
+            value, generation = await self.shared.get(key)
+            if value is not None:
+                self.hits["shared"] += 1
+                self._store_local(key, value, ttl, local_generation)
+                return value
+        self.misses += 1
+        value = await loader()
+        if value is None:
+            return None
+        if self.shared is not None and not await self.shared.set(key, value, ttl, generation):
+            self.stale_writes += 1
+            return value  # invalidated while loading: serve it once, don't cache it
+        self._store_local(key, value, ttl, local_generation)
+        return value
+
+    def _store_local(self, key: str, value: Any, ttl: float, generation: int) -> None:
+        if self.local.generation(key) != generation:
+            self.stale_writes += 1
+            return
+        self.local.set(key, value, min(ttl, self.local_ttl))
+
+    async def invalidate(self, *keys: str, broadcast: bool = True) -> None:
+        """Drop ``keys`` here, in the shared tier and (unless ``broadcast`` is
+        False, for events every worker sees anyway) on every other worker."""
+        keys = [k for k in keys if k]
+        if not keys:
+            return
+        for key in keys:
+            self.local.invalidate(key)
+        if self.shared is not None:
+            for key in keys:
+                await self.shared.invalidate(key)
+        if broadcast and self.bus is not None:
+            self.invalidations["sent"] += 1
+            try:
+                await self.bus.publish(keys)
+            except Exception as exc:
+                # Other workers fall back on the TTL
+                logger.warning("Cache invalidation broadcast failed: %r", exc)
+
+    def invalidated_within(self, key: str, seconds: float) -> bool:
+        """Whether ``key`` was invalidated (here or, via the bus, on another
+        worker) in the last ``seconds``."""
+        return self.local.invalidated_within(key, seconds)
+
+    def _on_invalidation(self, keys: Iterable[str]) -> None:
+        self.invalidations["received"] += 1
+        for key in keys:
+            self.local.invalidate(key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self.hits.values()) + self.misses
+        return {
+            "entries": len(self.local),
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round(sum(self.hits.values()) / lookups, 4) if lookups else 0.0,
+            "evictions": self.local.evictions,
+            "stale_writes": self.stale_writes,
+            "invalidations": dict(self.invalidations),
+            "shared": type(self.shared).__name__ if self.shared else None,
+            "bus": self.bus.stats() if self.bus else None,
+        }
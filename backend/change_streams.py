@@ -0,0 +1,213 @@
+"""Keep derived state in sync with writes from any worker or script.
+
+``ChangeConsumer`` watches ``users``, ``swipes``, ``matches`` and ``messages``
+with one database change stream and applies each event incrementally:
+
+- messages: raise the match's ``last_message_at`` (``$max``, so replays and
+  the request path's own update are harmless)
+- matches: drop both participants' cached match lists
+- users: drop the cached profile
+- swipes: drop the swiper's cached "already swiped" set used by discover
+
+Delete events only carry the ``_id``, so deletes are left to the TTL of the
+cached entries (the app's own delete paths invalidate explicitly).
+
+The resume token is saved in ``change_stream_state`` whenever the stream
+catches up (and every ``save_every`` events), so a restarted worker
+continues where it stopped; if the token has fallen off the oplog a
+reconciliation pass covers the gap. Every worker runs a consumer,
+because each has its own local cache tier; the database updates are
+idempotent. Without a replica set (change streams unavailable) the consumer
+runs ``reconcile()`` every ``reconcile_interval`` seconds instead.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = ("users", "swipes", "matches", "messages")
+
+# Server errors meaning "no change streams here" / "resume token is gone"
+_UNSUPPORTED_CODES = {40573}  # $changeStream needs a replica set
+_HISTORY_LOST_CODES = {280, 286}
+
+
+class ChangeConsumer:
+    def __init__(
+        self,
+        db,
+        cache,
+        name: str = "derived-state",
+        reconcile_interval: float = 60.0,
+        retry_seconds: float = 5.0,
+        save_every: int = 100,
+    ):
+        self.db = db
+        self.cache = cache
+        self.name = name
+        self.reconcile_interval = reconcile_interval
+        self.retry_seconds = retry_seconds
+        self.save_every = save_every
+        self.mode = "stopped"
+        self._task: Optional[asyncio.Task] = None
+        self.events = {c: 0 for c in COLLECTIONS}
+        self.errors = 0
+        self.restarts = 0
+        self.reconciles = 0
+        self.lag_seconds: Optional[float] = None
+
+    @property
+    def _state(self):
+        return self.db.change_stream_state
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.mode = "stopped"
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._watch()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                if exc.code in _UNSUPPORTED_CODES:
+                    logger.info("Change streams unavailable (%s); reconciling every %ss", exc, self.reconcile_interval)
+                    await self._reconcile_forever()
+                    return
+                if exc.code in _HISTORY_LOST_CODES:
+                    logger.warning("Change stream resume token expired; reconciling and starting fresh")
+                    await self._state.update_one({"_id": self.name}, {"$unset": {"token": ""}})
+                    await self._reconcile_logged()
+                else:
+                    logger.warning("Change stream failed: %r", exc)
+            except PyMongoError as exc:
+                logger.warning("Change stream failed: %r", exc)
+            except Exception:
+                logger.exception("Change stream consumer crashed; restarting")
+            self.restarts += 1
+            await asyncio.sleep(self.retry_seconds)
+
+    async def _watch(self) -> None:
+        state = await self._state.find_one({"_id": self.name}) or {}
+        pipeline = [{"$match": {"ns.coll": {"$in": list(COLLECTIONS)}}}]
+        async with self.db.watch(pipeline, full_document="updateLookup", resume_after=state.get("token")) as stream:
+            self.mode = "stream"
+            unsaved = 0
+            while stream.alive:
+                change = await stream.try_next()
+                if change is not None:
+                    await self._apply_logged(change)
+                    unsaved += 1
+                # Save every ``save_every`` events and whenever the stream goes idle
+                if unsaved and (change is None or unsaved >= self.save_every):
+                    await self._save_token(stream.resume_token)
+                    unsaved = 0
+
+    async def _save_token(self, token) -> None:
+        await self._state.update_one(
+            {"_id": self.name},
+            {"$set": {"token": token, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+
+    async def _apply_logged(self, change: Dict[str, Any]) -> None:
+        # Skip the event rather than fail the stream: a restart would resume
+        # before it and replay the same failure forever
+        try:
+            await self.apply(change)
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Skipped %s change %s: %r", change.get("ns", {}).get("coll"), change.get("documentKey"), exc)
+
+    async def apply(self, change: Dict[str, Any]) -> None:
+        """Update derived state for one change event."""
+        collection = change.get("ns", {}).get("coll")
+        operation = change.get("operationType")
+        doc = change.get("fullDocument") or {}
+        if collection in self.events:
+            self.events[collection] += 1
+        cluster_time = change.get("clusterTime")
+        if cluster_time is not None:
+            self.lag_seconds = max(0.0, time.time() - cluster_time.time)
+        if operation not in ("insert", "update", "replace") or not doc:
+            return  # deletes carry only the _id
+
+        if collection == "messages":
+            await self._raise_last_message_at(doc["match_id"], doc["created_at"])
+        elif collection == "matches":
+            await self._forget(f"matches:{doc['user1_id']}", f"matches:{doc['user2_id']}")
+        elif collection == "users":
+            await self._forget(f"user:{doc['user_id']}")
+        elif collection == "swipes":
+            await self._forget(f"swiped:{doc['swiper_id']}")
+
+    async def _forget(self, *keys: str) -> None:
+        # Every worker sees the event, so no need to broadcast
+        await self.cache.invalidate(*keys, broadcast=False)
+
+    async def _raise_last_message_at(self, match_id: str, at: datetime) -> bool:
+        result = await self.db.matches.update_one(
+            {"match_id": match_id, "$or": [{"last_message_at": None}, {"last_message_at": {"$lt": at}}]},
+            {"$set": {"last_message_at": at}},
+        )
+        return bool(result.modified_count)
+
+    # ==================== RECONCILIATION ====================
+
+    async def reconcile(self, since: Optional[datetime] = None) -> Dict[str, int]:
+        """Catch up on messages written since the last pass (or ``since``)
+        and refresh whatever derived state they affect."""
+        state = await self._state.find_one({"_id": self.name}) or {}
+        started = datetime.now(timezone.utc)
+        since = since or state.get("reconciled_at") or started - timedelta(days=1)
+        latest = self.db.messages.aggregate([
+            {"$match": {"created_at": {"$gte": since}}},
+            {"$group": {"_id": "$match_id", "at": {"$max": "$created_at"}}},
+        ])
+        updated = 0
+        async for row in latest:
+            if await self._raise_last_message_at(row["_id"], row["at"]):
+                updated += 1
+                match = await self.db.matches.find_one({"match_id": row["_id"]}, {"_id": 0, "user1_id": 1, "user2_id": 1})
+                if match:
+                    await self._forget(f"matches:{match['user1_id']}", f"matches:{match['user2_id']}")
+        await self._state.update_one({"_id": self.name}, {"$set": {"reconciled_at": started}}, upsert=True)
+        self.reconciles += 1
+        return {"matches_updated": updated}
+
+    async def _reconcile_logged(self) -> None:
+        try:
+            result = await self.reconcile()
+            if result["matches_updated"]:
+                logger.info("Reconciled last_message_at on %d matches", result["matches_updated"])
+        except PyMongoError as exc:
+            self.errors += 1
+            logger.warning("Reconciliation failed: %r", exc)
+
+    async def _reconcile_forever(self) -> None:
+        self.mode = "reconcile"
+        while True:
+            await self._reconcile_logged()
+            await asyncio.sleep(self.reconcile_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "events": dict(self.events),
+            "errors": self.errors,
+            "restarts": self.restarts,
+            "reconciles": self.reconciles,
+            "lag_seconds": round(self.lag_seconds, 3) if self.lag_seconds is not None else None,
+        }
@@ -0,0 +1,171 @@
+"""Request coalescing and concurrency limits for slow upstream calls (LLM)."""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    The call runs as its own task, so a caller that disconnects does not
+    cancel the work the other callers are waiting on.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every caller went away
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class QueueTimeout(Exception):
+    """Raised when a caller waited longer than the limiter's queue timeout."""
+
+    def __init__(self, scope: str, waited: float):
+        super().__init__(f"Timed out after {waited:.2f}s waiting for a {scope} slot")
+        self.scope = scope
+        self.waited = waited
+
+
+class ConcurrencyLimiter:
+    """Global plus per-key semaphores with a bounded wait for a slot."""
+
+    def __init__(self, max_concurrency: int, max_per_key: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_per_key = max_per_key
+        self.queue_timeout = queue_timeout
+        self._global = asyncio.Semaphore(max_concurrency)
+        # key -> [semaphore, holders + waiters]; dropped when unused
+        self._per_key: Dict[Hashable, list] = {}
+        self.waiting = 0
+        self.active = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def _acquire(self, sem: asyncio.Semaphore, scope: str, started: float) -> None:
+        remaining = started + self.queue_timeout - time.monotonic()
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout=max(remaining, 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise QueueTimeout(scope, time.monotonic() - started) from None
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable):
+        entry = self._per_key.setdefault(key, [asyncio.Semaphore(self.max_per_key), 0])
+        entry[1] += 1
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            try:
+                await self._acquire(entry[0], "per-user", started)
+                try:
+                    await self._acquire(self._global, "global", started)
+                except BaseException:
+                    entry[0].release()
+                    raise
+            finally:
+                self.waiting -= 1
+            waited = time.monotonic() - started
+            self.acquired += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            self.active += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+                self._global.release()
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._per_key.get(key) is entry:
+                del self._per_key[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.waiting,
+            "active": self.active,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.acquired, 4) if self.acquired else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 4),
+            "tracked_keys": len(self._per_key),
+        }
+
+
+class Hedge:
+    """Race a slow primary call against a fallback started after ``delay`` seconds.
+
+    The primary gets a head start; if it hasn't answered by then (or fails),
+    the fallback runs and whichever finishes first wins. The loser is
+    cancelled, so work that must finish anyway (e.g. a cache fill) should be
+    shielded inside ``primary``.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+        self.primary_wins = 0
+        self.fallback_wins = 0
+        self.primary_errors = 0
+
+    async def run(self, primary: Callable[[], Awaitable[Any]], fallback: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        first = asyncio.ensure_future(primary())
+        second = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.delay)
+            if not done:
+                second = asyncio.ensure_future(fallback())
+                done, _ = await asyncio.wait({first, second}, return_when=asyncio.FIRST_COMPLETED)
+            if first in done and first.exception() is None:
+                self.primary_wins += 1
+                return first.result()
+            if first in done:
+                self.primary_errors += 1
+                logger.warning("Hedged call failed, using fallback: %r", first.exception())
+            if second is None:
+                second = asyncio.ensure_future(fallback())
+            result = await second
+            self.fallback_wins += 1
+            return result
+        finally:
+            for task in (first, second):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "delay_seconds": self.delay,
+            "calls": self.calls,
+            "primary_wins": self.primary_wins,
+            "fallback_wins": self.fallback_wins,
+            "primary_errors": self.primary_errors,
+        }
@@ -0,0 +1,217 @@
+"""Index definitions for the Unhinged MongoDB collections.
+
+Run on app startup via ``ensure_indexes`` and usable standalone:
+
+    python db_indexes.py            # create all indexes
+    python db_indexes.py --verify   # create, then explain() every known query shape
+"""
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# ==================== INDEX SET ====================
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # Discovery candidate scan
+        IndexModel(
+            [("profile_complete", ASCENDING), ("is_active", ASCENDING)],
+            name="discoverable",
+        ),
+    ],
+    "swipes": [
+        # Discovery exclusions and reverse-like lookup
+        IndexModel(
+            [("swiper_id", ASCENDING), ("target_id", ASCENDING), ("action", ASCENDING)],
+            name="swiper_target_action",
+        ),
+        # Account deletion ($or on target_id)
+        IndexModel([("target_id", ASCENDING)], name="target_id"),
+    ],
+    "matches": [
+        IndexModel([("match_id", ASCENDING)], name="match_id_unique", unique=True),
+        # Each branch of the {"$or": [{"user1_id"}, {"user2_id"}]} queries
+        IndexModel([("user1_id", ASCENDING)], name="user1_id"),
+        IndexModel([("user2_id", ASCENDING)], name="user2_id"),
+    ],
+    "messages": [
+        # Chat history (ascending) and last message (descending)
+        IndexModel(
+            [("match_id", ASCENDING), ("created_at", ASCENDING)],
+            name="match_created_at",
+        ),
+        # Change-consumer reconciliation: messages written since the last pass
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        # Sessions expire at their own expires_at (must be a BSON date)
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "ai_cache": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    "jobs": [
+        # Worker claim: next queued job by run_at
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+        # At most one queued/running job per dedupe_key
+        IndexModel(
+            [("dedupe_key", ASCENDING)],
+            name="dedupe_key_active_unique",
+            unique=True,
+            partialFilterExpression={"active": True},
+        ),
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "account_deletions": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        # Progress is kept for a while after the account is gone
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    "cache": [
+        # Shared cache tier (CACHE_SHARED_TIER=mongo); tombstones expire too
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Query shapes the app issues (server.py, the job handlers, the change
+# consumer and maintenance), used by --verify to check index coverage.
+# tests/test_db_indexes.py drives the app and fails on a shape missing here.
+# Lookups by _id are left out: every collection has that index.
+# (collection, filter, sort)
+QUERY_SHAPES: List[Tuple[str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    ("users", {"user_id": "x"}, None),
+    ("users", {"user_id": "x", "deleted": {"$ne": True}}, None),
+    ("users", {"user_id": "x", "deleted": True}, None),
+    ("users", {"email": "x"}, None),
+    ("users", {"user_id": {"$in": ["x"]}}, None),
+    ("users", {"user_id": {"$in": ["x"]}, "deleted": {"$ne": True}}, None),
+    ("users", {"user_id": {"$nin": ["x"]}, "profile_complete": True, "is_active": True}, None),
+    ("swipes", {"swiper_id": "x"}, None),
+    ("swipes", {"swiper_id": "x", "target_id": "y", "action": "like"}, None),
+    ("swipes", {"$or": [{"swiper_id": "x"}, {"target_id": "x"}]}, None),
+    # Orphan scan, paged along _id
+    ("swipes", {}, [("_id", ASCENDING)]),
+    ("matches", {"$or": [{"user1_id": "x"}, {"user2_id": "x"}]}, None),
+    ("matches", {"match_id": "x", "$or": [{"user1_id": "x"}, {"user2_id": "x"}]}, None),
+    ("matches", {"match_id": "x"}, None),
+    ("matches", {"match_id": "x", "$or": [{"last_message_at": None}, {"last_message_at": {"$lt": 0}}]}, None),
+    ("matches", {}, [("_id", ASCENDING)]),
+    ("messages", {"match_id": "x"}, [("created_at", ASCENDING)]),
+    ("messages", {"match_id": "x"}, [("created_at", DESCENDING)]),
+    ("messages", {"match_id": {"$in": ["x"]}}, None),
+    ("messages", {"match_id": {"$in": ["x"]}, "created_at": {"$type": "date"}}, None),
+    ("messages", {"created_at": {"$gte": 0}}, None),
+    # Session sign-in, including unmigrated string expiries
+    ("user_sessions", {
+        "session_token": "x",
+        "$or": [{"expires_at": {"$gt": 0}}, {"expires_at": {"$type": "string", "$gt": "x"}}],
+    }, None),
+    ("user_sessions", {"$or": [{"expires_at": {"$lt": 0}}, {"expires_at": {"$type": "string", "$lt": "x"}}]}, None),
+    ("user_sessions", {"user_id": "x"}, None),
+    # Worker claim: due jobs, or running ones whose lease expired
+    ("jobs", {
+        "type": {"$in": ["x"]},
+        "$or": [{"status": "queued", "run_at": {"$lte": 0}}, {"status": "running", "locked_until": {"$lt": 0}}],
+    }, [("run_at", ASCENDING)]),
+    ("jobs", {"status": "queued"}, None),
+    ("jobs", {"dedupe_key": "x", "active": True}, None),
+    ("jobs", {"dedupe_key": {"$in": ["x"]}, "active": True}, None),
+    ("account_deletions", {"user_id": "x"}, None),
+]
+
+
+async def ensure_indexes(db) -> None:
+    """Create the declared index set. Existing indexes are left untouched."""
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                # e.g. duplicate emails in legacy data block a unique index;
+                # keep the app booting and surface it in the logs.
+                logger.error(
+                    "Failed to create index %s.%s: %s",
+                    collection, model.document["name"], e,
+                )
+
+
+# ==================== VERIFICATION ====================
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of an explain() query plan."""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return stages
+
+
+def is_covered(explain: Dict[str, Any]) -> bool:
+    """True when the winning plan avoids collection scans and in-memory sorts."""
+    winning = explain["queryPlanner"]["winningPlan"]
+    stages = plan_stages(winning)
+    return "COLLSCAN" not in stages and "SORT" not in stages
+
+
+async def uncovered_queries(db) -> List[Dict[str, Any]]:
+    """Explain every known query shape and return the ones not served by an index."""
+    uncovered = []
+    for collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        if not is_covered(explain):
+            uncovered.append({
+                "collection": collection,
+                "filter": query,
+                "sort": sort,
+                "stages": plan_stages(explain["queryPlanner"]["winningPlan"]),
+            })
+    return uncovered
+
+
+async def _main(verify: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await ensure_indexes(db)
+        logger.info("Indexes ensured on %s", os.environ['DB_NAME'])
+        if not verify:
+            return 0
+        uncovered = await uncovered_queries(db)
+        for q in uncovered:
+            logger.warning(
+                "Uncovered query on %s: filter=%s sort=%s plan=%s",
+                q["collection"], q["filter"], q["sort"], " <- ".join(q["stages"]),
+            )
+        logger.info("%d/%d query shapes covered", len(QUERY_SHAPES) - len(uncovered), len(QUERY_SHAPES))
+        return 1 if uncovered else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Create and verify Unhinged MongoDB indexes")
+    parser.add_argument("--verify", action="store_true", help="explain() known queries and report uncovered ones")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.verify)))
@@ -0,0 +1,92 @@
+"""Conditional GET support: ETags, If-None-Match and 304 accounting.
+
+Handlers derive an ETag from data they already hold (e.g. ``profile_version``)
+and call ``not_modified`` before querying further or serializing a body.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+# Body sizes of recently served ETags, so 304s can report the bytes they saved
+_MAX_TRACKED_ETAGS = 10_000
+_etag_sizes: "OrderedDict[str, int]" = OrderedDict()
+
+ETAG_STATS: Dict[str, int] = {
+    "responses_200": 0,
+    "responses_304": 0,
+    "bytes_sent": 0,
+    "bytes_saved": 0,
+}
+
+
+def make_etag(*parts: Any, weak: bool = True) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison of ``etag`` against the request's If-None-Match header."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = _strip_weak(etag)
+    return any(_strip_weak(t.strip()) == wanted for t in header.split(","))
+
+
+def not_modified(request: Request, etag: str, headers: Optional[Dict[str, str]] = None) -> Optional[Response]:
+    """Return a 304 response if the client already holds ``etag``, else None."""
+    if not etag_matches(request, etag):
+        return None
+    return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
+
+
+def _remember_size(etag: str, size: int) -> None:
+    _etag_sizes[etag] = size
+    _etag_sizes.move_to_end(etag)
+    if len(_etag_sizes) > _MAX_TRACKED_ETAGS:
+        _etag_sizes.popitem(last=False)
+
+
+def record_response(status_code: int, etag: Optional[str], size: int) -> None:
+    if status_code == 304:
+        ETAG_STATS["responses_304"] += 1
+        if etag:
+            ETAG_STATS["bytes_saved"] += _etag_sizes.get(etag, 0)
+    elif status_code == 200 and etag:
+        ETAG_STATS["responses_200"] += 1
+        ETAG_STATS["bytes_sent"] += size
+        _remember_size(etag, size)
+
+
+class PrecomputedJSON:
+    """A constant JSON body serialized once, with a strong ETag and long-lived caching."""
+
+    def __init__(self, content: Any, max_age: int = 86400):
+        self.content = content
+        self.body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = make_etag(hashlib.sha1(self.body).hexdigest(), weak=False)
+        self.headers = {"ETag": self.etag, "Cache-Control": f"public, max-age={max_age}"}
+        _remember_size(self.etag, len(self.body))
+
+    def respond(self, request: Request) -> Response:
+        return not_modified(request, self.etag, self.headers) or Response(
+            content=self.body, media_type="application/json", headers=self.headers,
+        )
+
+
+async def conditional_get_middleware(request: Request, call_next):
+    """Account for bytes sent and saved on GET responses that carry an ETag."""
+    response = await call_next(request)
+    if request.method == "GET":
+        size = int(response.headers.get("content-length") or 0)
+        record_response(response.status_code, response.headers.get("etag"), size)
+    return response
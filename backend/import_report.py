@@ -0,0 +1,70 @@
+"""Cold import time of the backend, broken down by module.
+
+Runs ``python -X importtime -c "import server"`` in a fresh interpreter and
+sums the self time per top-level package, so a regression (a new eager
+import, a heavy module-level computation) shows up by name:
+
+    python import_report.py             # top 20 packages
+    python import_report.py --top 50 --module server
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+class ImportTiming(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def measure(module: str = "server") -> List[ImportTiming]:
+    """Import ``module`` in a fresh interpreter and parse its importtime log."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "unhinged")
+    env.setdefault("JWT_SECRET", "import-report")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings.append(ImportTiming(
+            name.strip(), int(self_us), int(cumulative_us), (len(name) - len(name.lstrip())) // 2,
+        ))
+    return timings
+
+
+def total_seconds(timings: List[ImportTiming], module: str = "server") -> float:
+    """Cumulative import time of ``module`` itself (its whole import tree)."""
+    return max((t.cumulative_us for t in timings if t.module == module), default=0) / 1e6
+
+
+def by_package(timings: List[ImportTiming]) -> Dict[str, int]:
+    """Self time in microseconds per top-level package, largest first."""
+    totals: Dict[str, int] = defaultdict(int)
+    for t in timings:
+        totals[t.module.split(".")[0]] += t.self_us
+    return dict(sorted(totals.items(), key=lambda kv: kv[1], reverse=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import time by package")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+    timings = measure(args.module)
+    print(f"import {args.module}: {total_seconds(timings, args.module) * 1000:.1f} ms")
+    for package, us in list(by_package(timings).items())[:args.top]:
+        print(f"{us / 1000:8.1f} ms  {package}")
@@ -0,0 +1,316 @@
+"""Durable background jobs stored in Mongo, run by an asyncio worker pool.
+
+Jobs are documents in the ``jobs`` collection. Workers claim them with an
+atomic ``find_one_and_update`` and a lease, so several app workers can share
+the queue and a crashed worker's jobs are picked up again once the lease
+expires. The lease is renewed every ``lease_seconds / 3`` while the handler
+runs, so a long job isn't claimed a second time; a worker that loses its
+lease anyway stops the handler and leaves the job to the new owner. Failed
+jobs (crashed workers included) are retried with exponential backoff up to
+``max_attempts``; a job type's ``on_failure`` hook then runs once with the
+last error. A ``dedupe_key`` keeps at most one queued/running job per
+key (enforced by a partial unique index on ``active``).
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+# Called with the payload and the last error once a job has failed for good
+FailureHandler = Callable[[Dict[str, Any], Exception], Awaitable[None]]
+
+
+class LeaseLost(Exception):
+    """Another worker reclaimed the job while this one was running it."""
+
+
+class JobQueue:
+    def __init__(
+        self,
+        collection,
+        workers: int = 2,
+        max_attempts: int = 5,
+        backoff_seconds: float = 2.0,
+        lease_seconds: float = 300.0,
+        poll_interval: float = 2.0,
+    ):
+        self.collection = collection
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, JobHandler] = {}
+        self._on_failure: Dict[str, FailureHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.counters = {
+            "enqueued": 0,
+            "deduplicated": 0,
+            "completed": 0,
+            "retried": 0,
+            "failed": 0,
+            "lease_lost": 0,
+        }
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+
+    def register(self, job_type: str, handler: JobHandler, on_failure: Optional[FailureHandler] = None) -> None:
+        self._handlers[job_type] = handler
+        if on_failure is not None:
+            self._on_failure[job_type] = on_failure
+
+    def _job(self, job_type: str, payload: Dict[str, Any], dedupe_key: Optional[str], delay_seconds: float) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        job = {
+            "job_id": f"job_{uuid.uuid4().hex[:12]}",
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "active": True,
+            "attempts": 0,
+            "created_at": now,
+            "run_at": now + timedelta(seconds=delay_seconds),
+        }
+        if dedupe_key:
+            job["dedupe_key"] = dedupe_key
+        return job
+
+    def _enqueued(self, count: int) -> None:
+        self.counters["enqueued"] += count
+        if count and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        dedupe_key: Optional[str] = None,
+        delay_seconds: float = 0,
+    ) -> Optional[str]:
+        """Queue a job. Returns its id, or None if an identical job is already pending."""
+        job = self._job(job_type, payload, dedupe_key, delay_seconds)
+        if dedupe_key:
+            if await self.collection.find_one({"dedupe_key": dedupe_key, "active": True}, {"_id": 1}):
+                self.counters["deduplicated"] += 1
+                return None
+        try:
+            await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            self.counters["deduplicated"] += 1
+            return None
+        self._enqueued(1)
+        return job["job_id"]
+
+    async def enqueue_many(
+        self,
+        job_type: str,
+        jobs: List[Tuple[Dict[str, Any], Optional[str]]],
+        delay_seconds: float = 0,
+    ) -> List[Optional[str]]:
+        """Queue several ``(payload, dedupe_key)`` jobs in one round trip.
+
+        Returns their ids in order, None for each one already pending (or
+        repeated in ``jobs``), like ``enqueue``.
+        """
+        docs = [self._job(job_type, payload, dedupe_key, delay_seconds) for payload, dedupe_key in jobs]
+        keys = [doc["dedupe_key"] for doc in docs if "dedupe_key" in doc]
+        pending = set()
+        if keys:
+            pending = {
+                job["dedupe_key"]
+                async for job in self.collection.find({"dedupe_key": {"$in": keys}, "active": True}, {"_id": 0, "dedupe_key": 1})
+            }
+        ids: List[Optional[str]] = []
+        batch = []
+        for doc in docs:
+            key = doc.get("dedupe_key")
+            if key in pending:
+                ids.append(None)
+                continue
+            if key:
+                pending.add(key)
+            ids.append(doc["job_id"])
+            batch.append(doc)
+        if batch:
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Racing enqueues on other workers hit the unique dedupe index
+                errors = e.details.get("writeErrors", [])
+                if any(error["code"] != 11000 for error in errors):
+                    raise
+                lost = {batch[error["index"]]["job_id"] for error in errors}
+                ids = [None if job_id in lost else job_id for job_id in ids]
+        self.counters["deduplicated"] += ids.count(None)
+        self._enqueued(len(ids) - ids.count(None))
+        return ids
+
+    # ==================== WORKERS ====================
+
+    def start(self) -> None:
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {
+                "type": {"$in": list(self._handlers)},
+                "$or": [
+                    {"status": "queued", "run_at": {"$lte": now}},
+                    # Lease expired: the worker that claimed it died
+                    {"status": "running", "locked_until": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "started_at": now,
+                    "locked_until": now + timedelta(seconds=self.lease_seconds),
+                    # Identifies this claim, so a worker whose lease was taken over can tell
+                    "claim_id": uuid.uuid4().hex,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def run_once(self) -> bool:
+        """Claim and run a single job. Returns False when nothing was ready."""
+        job = await self._claim()
+        if job is None:
+            return False
+
+        if job["attempts"] > self.max_attempts:
+            # Reclaimed from workers that died on every attempt
+            await self._failed(job, RuntimeError("lease expired on the final attempt"))
+            return True
+
+        started = time.monotonic()
+        try:
+            await self._run_leased(job)
+        except LeaseLost:
+            self.counters["lease_lost"] += 1
+            logger.warning("Job %s (%s) was taken over by another worker; stopped it here", job["job_id"], job["type"])
+        except Exception as e:
+            await self._failed(job, e)
+        else:
+            now = datetime.now(timezone.utc)
+            await self.collection.update_one(
+                self._claimed(job),
+                {"$set": {"status": "done", "finished_at": now}, "$unset": {"active": "", "locked_until": ""}},
+            )
+            created_at = job["created_at"]
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            latency = (now - created_at).total_seconds()
+            self.counters["completed"] += 1
+            self.latency_seconds_total += latency
+            self.latency_seconds_max = max(self.latency_seconds_max, latency)
+            logger.info("Job %s (%s) done in %.2fs", job["job_id"], job["type"], time.monotonic() - started)
+        return True
+
+    @staticmethod
+    def _claimed(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {"_id": job["_id"], "claim_id": job["claim_id"]}
+
+    async def _heartbeat(self, job: Dict[str, Any]) -> None:
+        """Extend the lease while the handler runs; returns once it is lost."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self.collection.update_one(
+                    self._claimed(job),
+                    {"$set": {"locked_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}},
+                )
+            except PyMongoError as e:
+                logger.warning("Could not renew the lease on job %s: %r", job["job_id"], e)
+                continue
+            if not renewed.matched_count:
+                return
+
+    async def _run_leased(self, job: Dict[str, Any]) -> None:
+        run = asyncio.ensure_future(self._handlers[job["type"]](job["payload"]))
+        heartbeat = asyncio.ensure_future(self._heartbeat(job))
+        try:
+            await asyncio.wait({run, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            run.cancel()
+            heartbeat.cancel()
+            await asyncio.gather(run, heartbeat, return_exceptions=True)
+        if run.cancelled():
+            raise LeaseLost(job["job_id"])
+        run.result()
+
+    async def _failed(self, job: Dict[str, Any], error: Exception) -> None:
+        now = datetime.now(timezone.utc)
+        final = job["attempts"] >= self.max_attempts
+        if final:
+            self.counters["failed"] += 1
+            logger.error("Job %s (%s) failed permanently: %s", job["job_id"], job["type"], error)
+            update = {
+                "$set": {"status": "failed", "finished_at": now, "error": repr(error)},
+                "$unset": {"active": "", "locked_until": ""},
+            }
+        else:
+            self.counters["retried"] += 1
+            delay = self.backoff_seconds * 2 ** (job["attempts"] - 1) * random.uniform(0.8, 1.2)
+            logger.warning("Job %s (%s) failed, retrying in %.1fs: %s", job["job_id"], job["type"], delay, error)
+            update = {
+                "$set": {"status": "queued", "run_at": now + timedelta(seconds=delay), "error": repr(error)},
+                "$unset": {"locked_until": ""},
+            }
+        result = await self.collection.update_one(self._claimed(job), update)
+        on_failure = self._on_failure.get(job["type"])
+        if final and on_failure is not None and result.matched_count:
+            try:
+                await on_failure(job["payload"], error)
+            except Exception:
+                logger.exception("Failure hook for job %s (%s) raised", job["job_id"], job["type"])
+
+    async def _worker(self, n: int) -> None:
+        while not self._stopping:
+            try:
+                if await self.run_once():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job worker %d crashed while claiming a job", n)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> Dict[str, Any]:
+        depth = await self.collection.count_documents({"status": "queued"})
+        running = await self.collection.count_documents({"status": "running"})
+        completed = self.counters["completed"]
+        return {
+            **self.counters,
+            "queue_depth": depth,
+            "running": running,
+            "latency_seconds_avg": round(self.latency_seconds_total / completed, 4) if completed else 0.0,
+            "latency_seconds_max": round(self.latency_seconds_max, 4),
+        }
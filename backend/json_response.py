@@ -0,0 +1,18 @@
+"""orjson-backed JSON responses.
+
+``FastJSONResponse`` is the app's default response class. Handlers that
+already hold plain JSON-ready data (lists of Mongo documents) return it
+directly, which skips FastAPI's ``jsonable_encoder`` walk; orjson serializes
+datetimes itself, treating Motor's naive datetimes as UTC.
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,193 @@
+"""LLM providers behind the /api/ai/* features.
+
+``EmergentLLMProvider`` talks to gpt-4o through emergentintegrations;
+``StubLLMProvider`` answers offline so the AI endpoints can be exercised in
+tests and local runs (set ``LLM_PROVIDER=stub``, and ``LLM_STUB_TOKEN_DELAY``
+to emit tokens on a timer).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class LLMProvider:
+    """Interface: turn a system message and prompt into completion text."""
+
+    name = "base"
+    # Whether ``stream`` yields text as the model produces it
+    streams = False
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    async def start(self) -> None:
+        """Load client libraries and open connections; called once at app startup."""
+
+    async def close(self) -> None:
+        """Release connections; called at app shutdown."""
+
+    async def complete(self, system_message: str, prompt: str, session_id: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, system_message: str, prompt: str, session_id: str) -> AsyncIterator[str]:
+        """Yield the completion in chunks as they arrive; only when ``streams`` is set."""
+        raise NotImplementedError
+        yield
+
+
+class EmergentLLMProvider(LLMProvider):
+    """gpt-4o through emergentintegrations, with one keep-alive connection pool.
+
+    ``LlmChat`` keeps per-session message history, so a fresh one is still
+    built per call; it is a cheap object once the module is imported. The
+    HTTP pool is shared by installing it as litellm's async client session,
+    which emergentintegrations uses for its upstream requests.
+
+    ``LlmChat`` only returns whole completions, so ``stream`` calls litellm
+    directly with ``stream=True``. The key is for Emergent's proxy, so that
+    needs its base URL (``api_base``, LLM_API_BASE); without it, or without
+    litellm, the provider reports ``streams = False`` and ``stream`` sends
+    the whole completion as one chunk.
+    """
+
+    name = "emergent"
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        provider: str = "openai",
+        model: str = "gpt-4o",
+        max_connections: int = 32,
+        timeout: float = 60.0,
+        api_base: Optional[str] = None,
+    ):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.api_base = api_base
+        self.streams = False
+        self._litellm = None
+        self._chat_cls = None
+        self._message_cls = None
+        self._http: Optional["httpx.AsyncClient"] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    async def start(self) -> None:
+        if not self.configured:
+            return
+        import httpx
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+        self._chat_cls, self._message_cls = LlmChat, UserMessage
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=120.0,
+            ),
+        )
+        try:
+            import litellm
+
+            litellm.aclient_session = self._http
+            self._litellm = litellm
+            self.streams = bool(self.api_base)
+        except ImportError:
+            logger.warning("litellm not importable; LLM calls will not use the shared connection pool")
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def complete(self, system_message: str, prompt: str, session_id: str) -> str:
+        if self._chat_cls is None:
+            await self.start()
+        chat = self._chat_cls(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message,
+        ).with_model(self.provider, self.model)
+        return await chat.send_message(self._message_cls(text=prompt))
+
+    async def stream(self, system_message: str, prompt: str, session_id: str) -> AsyncIterator[str]:
+        if self._chat_cls is None:
+            await self.start()
+        if not self.streams:
+            # Never send the proxy key to the provider's default endpoint
+            yield await self.complete(system_message, prompt, session_id)
+            return
+        response = await self._litellm.acompletion(
+            model=f"{self.provider}/{self.model}",
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt},
+            ],
+            api_key=self.api_key,
+            api_base=self.api_base,
+            timeout=self.timeout,
+            stream=True,
+        )
+        async for chunk in response:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+
+class StubLLMProvider(LLMProvider):
+    """Deterministic offline provider; every call is counted for assertions.
+
+    With ``token_delay`` it behaves like a real model: ``stream`` emits one
+    word per delay and ``complete`` returns after the whole generation time.
+    """
+
+    name = "stub"
+    streams = True
+
+    def __init__(self, token_delay: float = 0.0):
+        self.token_delay = token_delay
+        self.calls = 0
+
+    def _tokens(self, prompt: str) -> list:
+        self.calls += 1
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        text = f"[stub {digest} #{self.calls}] Your chaos is noted and, frankly, iconic."
+        words = text.split(" ")
+        return [words[0]] + [" " + w for w in words[1:]]
+
+    async def complete(self, system_message: str, prompt: str, session_id: str) -> str:
+        tokens = self._tokens(prompt)
+        if self.token_delay:
+            await asyncio.sleep(self.token_delay * len(tokens))
+        return "".join(tokens)
+
+    async def stream(self, system_message: str, prompt: str, session_id: str) -> AsyncIterator[str]:
+        for token in self._tokens(prompt):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+
+def provider_from_env() -> LLMProvider:
+    if os.environ.get("LLM_PROVIDER", "emergent") == "stub":
+        return StubLLMProvider(float(os.environ.get("LLM_STUB_TOKEN_DELAY", "0")))
+    return EmergentLLMProvider(
+        os.environ.get("EMERGENT_LLM_KEY"),
+        max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", "32")),
+        timeout=float(os.environ.get("LLM_TIMEOUT_SECONDS", "60")),
+        api_base=os.environ.get("LLM_API_BASE") or None,
+    )
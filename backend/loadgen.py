@@ -0,0 +1,278 @@
+"""Async load generator that drives the API in-process or over HTTP.
+
+Virtual users arrive at ``--arrival-rate`` per second (a Poisson process;
+0 starts them all at once). Each one registers, fills in a complete
+profile, then runs ``--iterations`` rounds of discover → swipe → (on a
+match) chat → matches listing, pausing ``--think-ms`` between calls. Users
+like each other with ``--like-ratio``, so matches and chats happen among
+the virtual users themselves.
+
+Targets:
+
+    python loadgen.py --users 50                        # in-process app, in-memory Mongo stand-in
+    python loadgen.py --users 50 --mongo local           # in-process app, MONGO_URL / DB_NAME from .env
+    python loadgen.py --users 200 --url http://127.0.0.1:8001   # a running uvicorn
+
+The report gives throughput, latency percentiles and error rate per
+endpoint (path parameters folded into the route template). ``--json``
+prints it as JSON instead.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+import uuid
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Concrete ids back to route templates, so each endpoint is one row
+_PATH_PARAMS = [
+    (re.compile(r"/matches/[^/]+/messages"), "/matches/{match_id}/messages"),
+]
+
+RED_FLAGS = ["Always late", "Replies in 3-5 business days", "Has a podcast", "Still friends with all exes"]
+
+
+def endpoint_name(method: str, path: str) -> str:
+    for pattern, template in _PATH_PARAMS:
+        path = pattern.sub(template, path)
+    return f"{method} {path}"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(p / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class EndpointStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+
+class LoadStats:
+    def __init__(self):
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.users_started = 0
+        self.users_failed = 0
+        self.matches = 0
+
+    def record(self, name: str, seconds: float, status: int) -> None:
+        stats = self.endpoints.setdefault(name, EndpointStats())
+        stats.latencies.append(seconds)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if status == 0 or status >= 400:
+            stats.errors += 1
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rows = {}
+        for name, stats in sorted(self.endpoints.items()):
+            latencies = sorted(stats.latencies)
+            rows[name] = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+                "error_rate": round(stats.errors / len(latencies), 4),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p90_ms": round(percentile(latencies, 90) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+                "statuses": dict(sorted(stats.statuses.items())),
+            }
+        total = sum(r["requests"] for r in rows.values())
+        errors = sum(s.errors for s in self.endpoints.values())
+        return {
+            "seconds": round(elapsed, 3),
+            "users": self.users_started,
+            "users_failed": self.users_failed,
+            "matches": self.matches,
+            "requests": total,
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "endpoints": rows,
+        }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"{report['users']} users ({report['users_failed']} failed), {report['matches']} matches, "
+        f"{report['requests']} requests in {report['seconds']}s = {report['rps']} req/s, "
+        f"error rate {report['error_rate']:.2%}",
+        f"{'endpoint':<40} {'reqs':>6} {'rps':>8} {'err':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}",
+    ]
+    for name, row in report["endpoints"].items():
+        lines.append(
+            f"{name:<40} {row['requests']:>6} {row['rps']:>8} {row['error_rate']:>7.2%} "
+            f"{row['p50_ms']:>8} {row['p90_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8}"
+        )
+    return "\n".join(lines)
+
+
+class UserFailed(Exception):
+    pass
+
+
+class VirtualUser:
+    def __init__(self, http: httpx.AsyncClient, stats: LoadStats, rng: random.Random, think: float, like_ratio: float):
+        self.http = http
+        self.stats = stats
+        self.rng = rng
+        self.think = think
+        self.like_ratio = like_ratio
+        self.headers: Dict[str, str] = {}
+        self.match_ids: List[str] = []
+
+    async def call(self, method: str, path: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        status = 0
+        try:
+            response = await self.http.request(method, "/api" + path, headers=self.headers, **kwargs)
+            status = response.status_code
+            return response
+        except httpx.HTTPError as exc:
+            raise UserFailed(f"{method} {path}: {exc!r}") from exc
+        finally:
+            self.stats.record(endpoint_name(method, "/api" + path), time.perf_counter() - started, status)
+            if self.think:
+                await asyncio.sleep(self.rng.expovariate(1 / self.think))
+
+    async def expect(self, method: str, path: str, **kwargs) -> Any:
+        response = await self.call(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise UserFailed(f"{method} {path}: {response.status_code}")
+        return response.json()
+
+    async def run(self, iterations: int) -> None:
+        tag = uuid.uuid4().hex[:10]
+        registered = await self.expect("POST", "/auth/register", json={
+            "email": f"load_{tag}@example.com", "password": f"pw-{tag}", "name": f"Load {tag}",
+        })
+        self.headers = {"Authorization": f"Bearer {registered['access_token']}"}
+        await self.expect("PUT", "/profile", json={
+            "age": self.rng.randint(21, 45),
+            "bio": "Generated by loadgen",
+            "gender_identity": "non-binary",
+            "red_flags": self.rng.sample(RED_FLAGS, 2),
+            "photos": [f"https://example.com/{tag}.jpg"],
+        })
+        for _ in range(iterations):
+            candidates = await self.expect("GET", "/discover")
+            for candidate in candidates[:3]:
+                action = "like" if self.rng.random() < self.like_ratio else "pass"
+                result = await self.expect("POST", "/swipe", json={"target_user_id": candidate["user_id"], "action": action})
+                if result.get("match_created"):
+                    self.stats.matches += 1
+                    self.match_ids.append(result["match"]["match_id"])
+            # Matches the other side created show up here too
+            listing = await self.expect("GET", "/matches")
+            self.match_ids = [m["match_id"] for m in listing] or self.match_ids
+            if self.match_ids:
+                match_id = self.rng.choice(self.match_ids)
+                await self.expect("POST", f"/matches/{match_id}/messages", json={"content": "hi from loadgen"})
+                await self.expect("GET", f"/matches/{match_id}/messages")
+
+
+async def run_load(
+    http: httpx.AsyncClient,
+    users: int,
+    iterations: int = 3,
+    arrival_rate: float = 0.0,
+    think_ms: float = 0.0,
+    like_ratio: float = 0.7,
+    seed: Optional[int] = None,
+) -> LoadStats:
+    """Run ``users`` virtual users against ``http`` and return their stats."""
+    stats = LoadStats()
+    rng = random.Random(seed)
+
+    async def user(index: int) -> None:
+        stats.users_started += 1
+        vu = VirtualUser(http, stats, random.Random(rng.random()), think_ms / 1000, like_ratio)
+        try:
+            await vu.run(iterations)
+        except UserFailed as exc:
+            stats.users_failed += 1
+            logger.warning("Virtual user %d stopped: %s", index, exc)
+
+    tasks = []
+    for index in range(users):
+        if arrival_rate and index:
+            await asyncio.sleep(rng.expovariate(arrival_rate))
+        tasks.append(asyncio.create_task(user(index)))
+    await asyncio.gather(*tasks)
+    stats.finished = time.perf_counter()
+    return stats
+
+
+async def _in_process_app(stack: AsyncExitStack, mongo: str):
+    """The app with its lifespan running, on local Mongo or an in-memory stand-in."""
+    import server
+
+    if mongo == "memory":
+        from mongomock_motor import AsyncMongoMockClient
+
+        from db_indexes import ensure_indexes
+
+        client = AsyncMongoMockClient()
+        server.use_database(client, client[os.environ.get("DB_NAME", "unhinged_load")])
+        await ensure_indexes(server.db)
+    else:
+        await stack.enter_async_context(server.lifespan(server.app))
+    return server.app
+
+
+async def _main(args) -> int:
+    async with AsyncExitStack() as stack:
+        if args.url:
+            http = httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=httpx.Limits(max_connections=args.users))
+        else:
+            app = await _in_process_app(stack, args.mongo)
+            http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadgen", timeout=args.timeout)
+        await stack.enter_async_context(http)
+        stats = await run_load(http, args.users, args.iterations, args.arrival_rate, args.think_ms, args.like_ratio, args.seed)
+    report = stats.report()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 1 if report["error_rate"] > args.max_error_rate else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Load test the Unhinged API with virtual users")
+    parser.add_argument("--users", type=int, default=20, help="virtual users in total")
+    parser.add_argument("--iterations", type=int, default=3, help="discover/swipe/chat rounds per user")
+    parser.add_argument("--arrival-rate", type=float, default=0.0, help="new users per second (0: all at once)")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a user's calls")
+    parser.add_argument("--like-ratio", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--url", help="base URL of a running server; default drives the app in-process")
+    parser.add_argument("--mongo", choices=("memory", "local"), default="memory", help="in-process only")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="exit 1 above this error rate")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    if not args.url:
+        from pathlib import Path
+
+        from dotenv import load_dotenv
+
+        load_dotenv(Path(__file__).parent / '.env')
+        if args.mongo == "memory":
+            for name, value in (("MONGO_URL", "mongodb://localhost:27017"), ("DB_NAME", "unhinged_load"), ("JWT_SECRET", "loadgen")):
+                os.environ.setdefault(name, value)
+    raise SystemExit(asyncio.run(_main(args)))
@@ -0,0 +1,303 @@
+"""Periodic maintenance jobs, run by one elected worker at a time.
+
+Every worker runs a ``MaintenanceScheduler`` and polls each job, but a job
+only runs on the worker that takes its lease: a document in
+``maintenance_leases`` with an ``owner``, ``expires_at`` and
+``next_run_at``. A worker can take the lease once the job is due and the
+lease is free; it renews the lease every ``lease_seconds / 3`` while the job
+runs, then hands it back and sets ``next_run_at`` one (jittered) interval
+ahead, which every other worker honours. If the runner dies, the lease
+lapses after ``lease_seconds`` (minutes, not intervals) and the next poll on
+any worker picks the job up. Polls and intervals are spread with ``jitter``
+so workers don't wake up in lockstep.
+
+A job is ``async fn(db, state) -> {item: count}``. ``state`` is a dict kept
+on the lease document between runs (and across leaders), which lets a scan
+continue where the previous run stopped. Every job works in batches of
+``batch_size`` documents and stops after ``max_batches``, so a run is
+bounded however much there is to do.
+
+Jobs shipped here:
+
+    purge_expired_sessions   sessions past expires_at; the TTL index covers
+                             BSON dates, this also catches string-dated ones
+    remove_orphans           swipes and matches (with their messages) that
+                             point at users who no longer exist
+    rebuild_last_message_at  each match's last_message_at from its messages
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from metrics import MAINTENANCE_ITEMS, MAINTENANCE_LAST_SUCCESS, MAINTENANCE_RUNS, MAINTENANCE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+MAX_BATCHES = 20
+
+JobFn = Callable[[Any, Dict[str, Any]], Awaitable[Dict[str, int]]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ==================== JOBS ====================
+
+
+async def purge_expired_sessions(db, state: Dict[str, Any], batch_size: int = BATCH_SIZE, max_batches: int = MAX_BATCHES) -> Dict[str, int]:
+    now = _now()
+    expired = {"$or": [
+        {"expires_at": {"$lt": now}},
+        # Sessions written before expires_at was stored as a date
+        {"expires_at": {"$type": "string", "$lt": now.isoformat()}},
+    ]}
+    removed = 0
+    for _ in range(max_batches):
+        docs = await db.user_sessions.find(expired, {"_id": 1}).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        result = await db.user_sessions.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        removed += result.deleted_count
+    return {"sessions": removed}
+
+
+async def _existing_users(db, user_ids: Set[str]) -> Set[str]:
+    found = await db.users.find({"user_id": {"$in": list(user_ids)}}, {"_id": 0, "user_id": 1}).to_list(len(user_ids))
+    return {u["user_id"] for u in found}
+
+
+async def _scan(collection, state: Dict[str, Any], key: str, batch_size: int) -> List[Dict[str, Any]]:
+    """The next batch in ``_id`` order after ``state[key]``; wraps to the start
+    once the collection has been covered."""
+    query = {"_id": {"$gt": state[key]}} if state.get(key) is not None else {}
+    docs = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+    state[key] = docs[-1]["_id"] if len(docs) == batch_size else None
+    return docs
+
+
+async def remove_orphans(db, state: Dict[str, Any], batch_size: int = BATCH_SIZE, max_batches: int = MAX_BATCHES) -> Dict[str, int]:
+    counts = {"swipes": 0, "matches": 0, "messages": 0}
+    for _ in range(max_batches):
+        swipes = await _scan(db.swipes, state, "swipes_after", batch_size)
+        if swipes:
+            existing = await _existing_users(db, {s["swiper_id"] for s in swipes} | {s["target_id"] for s in swipes})
+            orphans = [s["_id"] for s in swipes if s["swiper_id"] not in existing or s["target_id"] not in existing]
+            if orphans:
+                counts["swipes"] += (await db.swipes.delete_many({"_id": {"$in": orphans}})).deleted_count
+        if state["swipes_after"] is None:
+            break
+
+    for _ in range(max_batches):
+        matches = await _scan(db.matches, state, "matches_after", batch_size)
+        if matches:
+            existing = await _existing_users(db, {m["user1_id"] for m in matches} | {m["user2_id"] for m in matches})
+            orphans = [m for m in matches if m["user1_id"] not in existing or m["user2_id"] not in existing]
+            if orphans:
+                # Messages first, as in account deletion: the match is still there to find them again
+                thread = {"match_id": {"$in": [m["match_id"] for m in orphans]}}
+                counts["messages"] += (await db.messages.delete_many(thread)).deleted_count
+                counts["matches"] += (await db.matches.delete_many({"_id": {"$in": [m["_id"] for m in orphans]}})).deleted_count
+        if state["matches_after"] is None:
+            break
+    return counts
+
+
+async def rebuild_last_message_at(db, state: Dict[str, Any], batch_size: int = BATCH_SIZE, max_batches: int = MAX_BATCHES) -> Dict[str, int]:
+    repaired = 0
+    for _ in range(max_batches):
+        matches = await _scan(db.matches, state, "matches_after", batch_size)
+        if matches:
+            latest = await db.messages.aggregate([
+                # Dates only: a thread of unmigrated string timestamps would
+                # otherwise put a string back into last_message_at
+                {"$match": {"match_id": {"$in": [m["match_id"] for m in matches]}, "created_at": {"$type": "date"}}},
+                {"$group": {"_id": "$match_id", "at": {"$max": "$created_at"}}},
+            ]).to_list(None)
+            actual = {row["_id"]: row["at"] for row in latest}
+            for match in matches:
+                at = actual.get(match["match_id"])
+                seen = match.get("last_message_at")
+                if at is None and isinstance(seen, str):
+                    continue  # left for migrate_datetimes
+                if seen != at:
+                    # Unless a new message moved it meanwhile
+                    result = await db.matches.update_one({"_id": match["_id"], "last_message_at": seen}, {"$set": {"last_message_at": at}})
+                    repaired += result.modified_count
+        if state["matches_after"] is None:
+            break
+    return {"matches": repaired}
+
+
+# ==================== SCHEDULER ====================
+
+
+@dataclass
+class PeriodicJob:
+    name: str
+    fn: JobFn
+    interval: float
+    jitter: float = 0.1
+    # How long a crashed leader blocks the job; renewed while a run is going
+    lease_seconds: float = 120.0
+    # How often each worker checks whether the job is due
+    poll_seconds: float = 60.0
+    counters: Dict[str, int] = field(default_factory=lambda: {"runs": 0, "errors": 0, "skipped": 0})
+    last: Dict[str, Any] = field(default_factory=dict)
+
+    def next_delay(self, rng: random.Random) -> float:
+        return self.interval * rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def poll_delay(self, rng: random.Random) -> float:
+        return min(self.interval, self.poll_seconds) * rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class LeaseLost(Exception):
+    """Another worker took the job's lease while this worker was running it."""
+
+
+class MaintenanceScheduler:
+    def __init__(self, db, jobs: Sequence[PeriodicJob], owner: Optional[str] = None, seed: Optional[int] = None):
+        self.db = db
+        self.jobs = {job.name: job for job in jobs}
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._rng = random.Random(seed)
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def leases(self):
+        return self.db.maintenance_leases
+
+    async def _acquire(self, job: PeriodicJob) -> Optional[Dict[str, Any]]:
+        """Take the job's lease if it is due and free; its document, or None."""
+        now = _now()
+        try:
+            return await self.leases.find_one_and_update(
+                {
+                    "_id": job.name,
+                    "expires_at": {"$lte": now},
+                    "$or": [{"next_run_at": {"$exists": False}}, {"next_run_at": {"$lte": now}}],
+                },
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=job.lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The document exists and the filter didn't match: not due, or running elsewhere
+            return None
+
+    async def _heartbeat(self, job: PeriodicJob) -> None:
+        """Keep the lease while the run goes on; returns once it is lost."""
+        while True:
+            await asyncio.sleep(job.lease_seconds / 3)
+            try:
+                renewed = await self.leases.update_one(
+                    {"_id": job.name, "owner": self.owner},
+                    {"$set": {"expires_at": _now() + timedelta(seconds=job.lease_seconds)}},
+                )
+            except PyMongoError as exc:
+                logger.warning("Could not renew the %s lease: %r", job.name, exc)
+                continue
+            if not renewed.matched_count:
+                return
+
+    async def _run_leased(self, job: PeriodicJob, state: Dict[str, Any]) -> Dict[str, int]:
+        run = asyncio.ensure_future(job.fn(self.db, state))
+        heartbeat = asyncio.ensure_future(self._heartbeat(job))
+        try:
+            await asyncio.wait({run, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            run.cancel()
+            heartbeat.cancel()
+            await asyncio.gather(run, heartbeat, return_exceptions=True)
+        if run.cancelled():
+            raise LeaseLost(f"lost the {job.name} lease mid-run")
+        return run.result()
+
+    async def run_once(self, name: str) -> bool:
+        """One tick of ``name``: run it if it is due and no other worker is
+        running it. False if skipped."""
+        job = self.jobs[name]
+        lease = await self._acquire(job)
+        if lease is None:
+            job.counters["skipped"] += 1
+            MAINTENANCE_RUNS.inc(job=name, outcome="skipped")
+            return False
+
+        state = dict(lease.get("state") or {})
+        started = time.perf_counter()
+        # Due again after the interval whatever the outcome, so a failing
+        # job isn't retried on every poll
+        finished = {"next_run_at": _now() + timedelta(seconds=job.next_delay(self._rng)), "expires_at": _now()}
+        try:
+            result = await self._run_leased(job, state)
+        except Exception as exc:
+            job.counters["errors"] += 1
+            MAINTENANCE_RUNS.inc(job=name, outcome="error")
+            job.last = {"at": _now(), "error": repr(exc)}
+            logger.exception("Maintenance job %s failed", name)
+            await self.leases.update_one({"_id": name, "owner": self.owner}, {"$set": finished})
+            return True
+        seconds = time.perf_counter() - started
+        job.counters["runs"] += 1
+        MAINTENANCE_RUNS.inc(job=name, outcome="ok")
+        MAINTENANCE_SECONDS.observe(seconds, job=name)
+        MAINTENANCE_LAST_SUCCESS.set(time.time(), job=name)
+        for item, count in result.items():
+            MAINTENANCE_ITEMS.inc(count, job=name, item=item)
+        job.last = {"at": _now(), "seconds": round(seconds, 3), "result": result}
+        # Hand the lease back along with the scan position
+        await self.leases.update_one(
+            {"_id": name, "owner": self.owner},
+            {"$set": {**finished, "state": state, "last_run_at": job.last["at"], "last_result": result}},
+        )
+        if any(result.values()):
+            logger.info("Maintenance job %s: %s in %.2fs", name, result, seconds)
+        return True
+
+    async def _loop(self, job: PeriodicJob) -> None:
+        # Staggered first tick so a fleet restart doesn't stampede
+        await asyncio.sleep(job.poll_delay(self._rng) * self._rng.random())
+        while True:
+            try:
+                await self.run_once(job.name)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Maintenance scheduler failed on %s", job.name)
+            await asyncio.sleep(job.poll_delay(self._rng))
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._tasks:
+            # A run cut short is due again at once on another worker
+            await self.leases.update_many(
+                {"_id": {"$in": list(self.jobs)}, "owner": self.owner, "expires_at": {"$gt": _now()}},
+                {"$set": {"expires_at": _now()}},
+            )
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "jobs": {
+                name: {"interval_seconds": job.interval, "lease_seconds": job.lease_seconds, **job.counters, "last": job.last}
+                for name, job in self.jobs.items()
+            },
+        }
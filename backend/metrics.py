@@ -0,0 +1,397 @@
+"""Prometheus-style metrics: request latency per route, Mongo command latency
+per route and collection, event-loop lag, and in-flight requests.
+
+Everything is labelled with the route name (the endpoint function, e.g.
+``discover_profiles``), carried in a context variable that Motor copies into
+its executor threads. That makes per-route breakdowns a simple query:
+
+    sum by (collection, command) (rate(mongo_command_duration_seconds_sum{route="discover_profiles"}[5m]))
+      / sum (rate(http_request_duration_seconds_sum{route="discover_profiles"}[5m]))
+
+Code inside a handler can time its own phases with ``timed("scoring")``.
+``render()`` produces the text exposition format served at ``/metrics``.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+current_route: contextvars.ContextVar[str] = contextvars.ContextVar("current_route", default="none")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # Mongo listeners report from executor threads
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def sum(self, **labels: str) -> float:
+        series = self._values.get(self._key(labels))
+        return series[-2] if series else 0.0
+
+    def count(self, **labels: str) -> int:
+        series = self._values.get(self._key(labels))
+        return series[-1] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until response headers", ("route", "method", "status"),
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled", ("route",),
+))
+MONGO_SECONDS = REGISTRY.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("route", "collection", "command"),
+))
+MONGO_DOCUMENTS = REGISTRY.register(Counter(
+    "mongo_documents_returned_total", "Documents returned by MongoDB commands", ("route", "collection", "command"),
+))
+MONGO_FAILURES = REGISTRY.register(Counter(
+    "mongo_command_failures_total", "MongoDB commands that failed", ("route", "collection", "command"),
+))
+POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "mongo_pool_wait_seconds", "Time spent waiting to check a connection out of the MongoDB pool", ("route",),
+))
+POOL_CHECKED_OUT = REGISTRY.register(Gauge(
+    "mongo_pool_checked_out_connections", "MongoDB connections currently checked out of the pool",
+))
+POOL_CHECKOUT_FAILURES = REGISTRY.register(Counter(
+    "mongo_pool_checkout_failures_total", "Connection checkouts that failed (timeout = pool exhausted)", ("reason",),
+))
+ADMISSION_IN_FLIGHT = REGISTRY.register(Gauge(
+    "admission_in_flight", "Requests holding an admission slot", ("class",),
+))
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot", ("class",),
+))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "admission_wait_seconds", "Time admitted requests waited for a slot", ("class",),
+))
+ADMISSION_SHED = REGISTRY.register(Counter(
+    "admission_shed_total", "Requests refused with 503 (queue_full or deadline)", ("class", "reason"),
+))
+MAINTENANCE_RUNS = REGISTRY.register(Counter(
+    "maintenance_runs_total", "Maintenance job polls by outcome (ok, error, or skipped when not due or running elsewhere)", ("job", "outcome"),
+))
+MAINTENANCE_SECONDS = REGISTRY.register(Histogram(
+    "maintenance_run_seconds", "Duration of maintenance job runs", ("job",),
+))
+MAINTENANCE_ITEMS = REGISTRY.register(Counter(
+    "maintenance_items_total", "Documents removed or repaired by maintenance jobs", ("job", "item"),
+))
+MAINTENANCE_LAST_SUCCESS = REGISTRY.register(Gauge(
+    "maintenance_last_success_timestamp_seconds", "Unix time of each job's last successful run on this worker", ("job",),
+))
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    "app_phase_duration_seconds", "Time spent in named phases of a handler", ("route", "phase"),
+))
+LOOP_LAG_SECONDS = REGISTRY.register(Gauge(
+    "event_loop_lag_seconds", "Latest delay between a scheduled wakeup and when the event loop ran it",
+))
+LOOP_LAG_MAX_SECONDS = REGISTRY.register(Gauge(
+    "event_loop_lag_max_seconds", "Largest event loop lag seen since startup",
+))
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Record the time spent in the block under the current route."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - started, route=current_route.get(), phase=phase)
+
+
+# ==================== MONGO COMMAND MONITORING ====================
+
+def _returned(command: str, reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    if command == "findAndModify":
+        return 1 if reply.get("value") is not None else 0
+    return 0
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command; pass to ``AsyncIOMotorClient(event_listeners=[...])``."""
+
+    def __init__(self):
+        # request_id -> labels, between the started and succeeded/failed events
+        self._pending: Dict[int, Dict[str, str]] = {}
+
+    def started(self, event) -> None:
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._pending[event.request_id] = {
+            "route": current_route.get(),
+            "collection": collection if isinstance(collection, str) else "",
+            "command": event.command_name,
+        }
+
+    def succeeded(self, event) -> None:
+        labels = self._pending.pop(event.request_id, None)
+        if labels is None:
+            return
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, **labels)
+        returned = _returned(event.command_name, event.reply)
+        if returned:
+            MONGO_DOCUMENTS.inc(returned, **labels)
+
+    def failed(self, event) -> None:
+        labels = self._pending.pop(event.request_id, None)
+        if labels is None:
+            return
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, **labels)
+        MONGO_FAILURES.inc(**labels)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Time spent waiting for a pooled connection, per route. A growing wait
+    with the pool fully checked out means ``MONGO_MAX_POOL_SIZE`` is too small
+    (or queries too slow); checkout timeouts are counted separately."""
+
+    def __init__(self):
+        # Checkout events for one operation fire on the thread running it
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def connection_check_out_started(self, event) -> None:
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event) -> None:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        waited = time.perf_counter() - started if started is not None else 0.0
+        POOL_WAIT_SECONDS.observe(waited, route=current_route.get())
+        POOL_CHECKED_OUT.inc()
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def connection_check_out_failed(self, event) -> None:
+        self._local.started = None
+        POOL_CHECKOUT_FAILURES.inc(reason=str(event.reason))
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            with self._lock:
+                self.timeouts += 1
+
+    def connection_checked_in(self, event) -> None:
+        POOL_CHECKED_OUT.dec()
+        with self._lock:
+            self.checked_out -= 1
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "checked_out": self.checked_out,
+            "checkouts": self.checkouts,
+            "wait_seconds_avg": round(self.wait_seconds / self.checkouts, 6) if self.checkouts else 0.0,
+            "wait_seconds_max": round(self.wait_max, 6),
+            "wait_queue_timeouts": self.timeouts,
+        }
+
+
+# ==================== HTTP AND EVENT LOOP ====================
+
+def route_name(app, scope) -> str:
+    """The matched route's name (its endpoint function), never the raw path."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "name", None) or "unnamed"
+    return "unmatched"
+
+
+async def metrics_middleware(request, call_next):
+    route = route_name(request.app, request.scope)
+    token = current_route.set(route)
+    REQUESTS_IN_FLIGHT.inc(route=route)
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=status)
+        REQUESTS_IN_FLIGHT.dec(route=route)
+        current_route.reset(token)
+
+
+class LoopLagMonitor:
+    """Sleeps ``interval`` in a loop and records how late each wakeup is."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.set(lag)
+            LOOP_LAG_MAX_SECONDS.set(self.max_lag)
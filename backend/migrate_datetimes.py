@@ -0,0 +1,104 @@
+"""Convert legacy ISO-string timestamps to native BSON dates.
+
+Older documents stored ``created_at``, ``last_message_at`` and session
+``expires_at`` as ``.isoformat()`` strings. This streams every document that
+still has a string in one of those fields and rewrites it as a date, in
+batches of bulk updates. It is idempotent and safe to run while the app is
+serving (new writes are already dates):
+
+    python migrate_datetimes.py             # convert
+    python migrate_datetimes.py --dry-run   # only count what would change
+
+Rollout: deploy the app first, then run this. The app reads both forms in
+the meantime (the session lookup accepts string ``expires_at`` values, so
+nobody is signed out), and only new writes are dates.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# (collection, field)
+DATE_FIELDS: List[Tuple[str, str]] = [
+    ("users", "created_at"),
+    ("user_sessions", "created_at"),
+    ("user_sessions", "expires_at"),
+    ("swipes", "created_at"),
+    ("matches", "created_at"),
+    ("matches", "last_message_at"),
+    ("messages", "created_at"),
+]
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def migrate_field(db, collection: str, field: str, batch_size: int = 1000, dry_run: bool = False) -> int:
+    """Rewrite string values of ``collection.field`` as dates. Returns how many changed."""
+    cursor = db[collection].find({field: {"$type": "string"}}, {field: 1}).batch_size(batch_size)
+    batch: List[UpdateOne] = []
+    converted = 0
+    async for doc in cursor:
+        try:
+            value = parse_timestamp(doc[field])
+        except ValueError:
+            logger.warning("Skipping %s %s: unparseable %s %r", collection, doc["_id"], field, doc[field])
+            continue
+        # Match the old value too, so a concurrent rewrite of the field wins
+        batch.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+        if len(batch) >= batch_size:
+            converted += await _flush(db, collection, batch, dry_run)
+            batch = []
+    if batch:
+        converted += await _flush(db, collection, batch, dry_run)
+    return converted
+
+
+async def _flush(db, collection: str, batch: List[UpdateOne], dry_run: bool) -> int:
+    if dry_run:
+        return len(batch)
+    result = await db[collection].bulk_write(batch, ordered=False)
+    return result.modified_count
+
+
+async def migrate(db, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, int]:
+    counts = {}
+    for collection, field in DATE_FIELDS:
+        counts[f"{collection}.{field}"] = await migrate_field(db, collection, field, batch_size, dry_run)
+        logger.info("%s.%s: %d converted", collection, field, counts[f"{collection}.{field}"])
+    return counts
+
+
+async def _main(batch_size: int, dry_run: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        counts = await migrate(db, batch_size, dry_run)
+        logger.info("%s %d values", "Would convert" if dry_run else "Converted", sum(counts.values()))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Convert ISO-string timestamps to BSON dates")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="count documents that would change")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.batch_size, args.dry_run)))
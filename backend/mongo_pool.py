@@ -0,0 +1,85 @@
+"""Motor client settings: connection pool, compression and read routing.
+
+Everything is read from the environment and left at the driver default when
+unset:
+
+    MONGO_MAX_POOL_SIZE            connections per host (driver default 100)
+    MONGO_MIN_POOL_SIZE            connections kept open when idle
+    MONGO_MAX_IDLE_TIME_MS         close pooled connections idle this long
+    MONGO_WAIT_QUEUE_TIMEOUT_MS    fail a checkout that waited this long
+    MONGO_COMPRESSORS              e.g. "zstd,snappy,zlib"; unavailable ones are skipped
+
+Reads that tolerate bounded staleness (discovery scans, match listings) use
+``stale_ok_read_preference()``: ``MONGO_STALE_READ_MODE`` (default
+secondaryPreferred) with ``MONGO_MAX_STALENESS_SECONDS`` (default 90, the
+driver minimum). On a standalone server that is simply the primary. Auth,
+swipes and everything that writes stay on the primary.
+"""
+import importlib.util
+import logging
+import os
+from typing import Any, Dict, Mapping, Optional
+
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+
+logger = logging.getLogger(__name__)
+
+_INT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+}
+
+# Compressor -> module it needs (zlib is always available)
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+
+_READ_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def _available_compressors(names: str) -> list:
+    available = []
+    for name in (n.strip() for n in names.split(",") if n.strip()):
+        if name not in _COMPRESSOR_MODULES:
+            logger.warning("Unknown Mongo compressor %r ignored", name)
+        elif _COMPRESSOR_MODULES[name] and importlib.util.find_spec(_COMPRESSOR_MODULES[name]) is None:
+            logger.warning("Mongo compressor %r needs the %s package; skipped", name, _COMPRESSOR_MODULES[name])
+        else:
+            available.append(name)
+    return available
+
+
+def client_options(env: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+    """Keyword arguments for ``AsyncIOMotorClient`` from the environment."""
+    env = os.environ if env is None else env
+    options: Dict[str, Any] = {}
+    for var, option in _INT_OPTIONS.items():
+        if env.get(var):
+            options[option] = int(env[var])
+    if env.get("MONGO_COMPRESSORS"):
+        compressors = _available_compressors(env["MONGO_COMPRESSORS"])
+        if compressors:
+            options["compressors"] = compressors
+    return options
+
+
+def stale_ok_read_preference(env: Optional[Mapping[str, str]] = None):
+    env = os.environ if env is None else env
+    mode = env.get("MONGO_STALE_READ_MODE", "secondaryPreferred")
+    if mode not in _READ_MODES:
+        raise ValueError(f"MONGO_STALE_READ_MODE must be one of {', '.join(_READ_MODES)}")
+    if mode == "primary":
+        return Primary()
+    return _READ_MODES[mode](max_staleness=int(env.get("MONGO_MAX_STALENESS_SECONDS", "90")))
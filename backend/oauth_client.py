@@ -0,0 +1,120 @@
+"""Emergent Auth session exchange over one shared, pooled HTTP client.
+
+``/api/auth/session`` trades the X-Session-ID from the Google OAuth redirect
+for the user's profile. The client is opened once at app startup so logins
+reuse warm keep-alive connections (HTTP/2 when the ``h2`` package is
+installed) instead of paying a TCP/TLS handshake each time.
+"""
+import asyncio
+import importlib.util
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+EMERGENT_AUTH_URL = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+
+# Upstream statuses worth one more try; anything else is the caller's answer
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class SessionExchange:
+    # What ``fetch`` raises when the auth backend can't answer
+    errors = httpx.HTTPError
+
+    def __init__(
+        self,
+        url: str = EMERGENT_AUTH_URL,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        retries: int = 2,
+        backoff_seconds: float = 0.2,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.exchanges = 0
+        self.retried = 0
+        self.failures = 0
+        self.seconds_total = 0.0
+        self.seconds_max = 0.0
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=60.0,
+        )
+        http2 = importlib.util.find_spec("h2") is not None
+        # No transport-level retries: ``fetch`` is the one retry layer
+        transport = self._transport or httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The user data for ``session_id``, or None if the session is invalid.
+
+        Connection errors, timeouts and 502/503/504 are retried up to
+        ``retries`` times with backoff. Raises ``httpx.HTTPError`` when the
+        auth backend is unreachable, keeps failing, or answers 200 with a
+        body that isn't JSON.
+        """
+        if self._client is None:
+            await self.start()
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await self._client.get(self.url, headers={"X-Session-ID": session_id})
+                except httpx.TransportError as e:
+                    if attempt == self.retries:
+                        raise
+                    logger.warning("Auth backend unreachable, retrying: %r", e)
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                        break
+                    logger.warning("Auth backend returned %d, retrying", response.status_code)
+                self.retried += 1
+                await asyncio.sleep(self.backoff_seconds * 2 ** attempt)
+            if response.status_code in RETRY_STATUSES:
+                response.raise_for_status()
+            if response.status_code != 200:
+                return None
+            try:
+                return response.json()
+            except ValueError as e:
+                raise httpx.DecodingError(f"Auth backend sent invalid JSON: {e}", request=response.request) from e
+        except httpx.HTTPError:
+            self.failures += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.exchanges += 1
+            self.seconds_total += elapsed
+            self.seconds_max = max(self.seconds_max, elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "exchanges": self.exchanges,
+            "retried": self.retried,
+            "failures": self.failures,
+            "seconds_avg": round(self.seconds_total / self.exchanges, 4) if self.exchanges else 0.0,
+            "seconds_max": round(self.seconds_max, 4),
+        }
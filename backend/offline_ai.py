@@ -0,0 +1,213 @@
+"""Offline roasts and icebreakers built from a small template grammar.
+
+Used when the LLM is not configured, too slow, or shedding load: no network,
+no model, just string assembly. Every suggested red flag and negative quality
+(what ``/api/red-flags/suggestions`` serves) has its own riffs; anything a user
+typed themselves gets a generic riff that quotes it.
+
+Riffs are bare verb phrases ("reply to texts on a geological timescale") so
+they read correctly after both "you" (roasts) and "I" (icebreakers).
+"""
+import random
+import re
+from typing import Dict, List, Optional
+
+RED_FLAG_RIFFS: Dict[str, List[str]] = {
+    "I reply to texts 3 days later": [
+        "reply to texts on a geological timescale",
+        "treat every text like a message in a bottle",
+    ],
+    "My ex is still my best friend": [
+        "keep your ex on speed dial for 'emotional support'",
+        "bring a built-in third wheel to every relationship",
+    ],
+    "I have a mattress on the floor": [
+        "sleep on a floor mattress and call it minimalism",
+        "own a bed frame in spirit only",
+    ],
+    "I say 'we should do this again' and never follow up": [
+        "say 'we should do this again' like a legally binding non-promise",
+        "schedule second dates exclusively in the hypothetical",
+    ],
+    "I've never watched The Office": [
+        "miss every single Office reference and nod anyway",
+        "treat 'that's what she said' like a foreign language",
+    ],
+    "I double text... a lot": [
+        "double text with the stamina of a marathon runner",
+        "turn one unanswered message into a group project",
+    ],
+    "My Spotify Wrapped was embarrassing": [
+        "hide your Spotify Wrapped like classified documents",
+        "let an algorithm expose your taste once a year",
+    ],
+    "I still use Internet Explorer": [
+        "still open Internet Explorer on purpose",
+        "browse the web at the speed of 2006",
+    ],
+    "I put milk before cereal": [
+        "pour milk before cereal and sleep just fine",
+        "commit breakfast crimes before 9am",
+    ],
+    "I think astrology is real": [
+        "blame your entire personality on Mercury",
+        "ask for a birth time before a last name",
+    ],
+    "I'm a reply guy on Twitter": [
+        "reply to celebrities like they asked for your input",
+        "treat every viral post as a personal invitation",
+    ],
+    "I use the word 'vibes' unironically": [
+        "say 'vibes' with a completely straight face",
+        "describe your whole life as a vibe check",
+    ],
+    "I own multiple swords": [
+        "own multiple swords for reasons you will not explain",
+        "keep a blade collection 'just in case'",
+    ],
+    "My love language is leaving people on read": [
+        "express affection exclusively through read receipts",
+        "leave people on read and call it intimacy",
+    ],
+    "I have 47 unread books": [
+        "collect books like trophies you never plan to open",
+        "keep 47 unread books as emotional support furniture",
+    ],
+}
+
+NEGATIVE_QUALITY_RIFFS: Dict[str, List[str]] = {
+    "Chronically late to everything": [
+        "treat every start time as a loose suggestion",
+        "arrive fashionably late to things that started yesterday",
+    ],
+    "Can't cook anything besides cereal": [
+        "consider cereal a full culinary repertoire",
+        "set off smoke alarms making toast",
+    ],
+    "Talks to plants more than people": [
+        "confide in houseplants more than humans",
+        "hold deeper conversations with a fern than with your friends",
+    ],
+    "Has strong opinions about fonts": [
+        "judge restaurants by their menu typography",
+        "start arguments about Comic Sans at parties",
+    ],
+    "Cries at commercials": [
+        "cry at insurance commercials",
+        "need a tissue for every dog food ad",
+    ],
+    "Still uses 'XD' in texts": [
+        "still end texts with 'XD'",
+        "text like it's a 2009 forum",
+    ],
+    "Finishes other people's sentences wrong": [
+        "finish other people's sentences with total confidence and zero accuracy",
+        "complete sentences nobody asked you to complete",
+    ],
+    "Gives unsolicited advice": [
+        "hand out advice like free samples nobody wanted",
+        "turn every venting session into a TED talk",
+    ],
+    "Can't keep a plant alive": [
+        "run a hospice for houseplants",
+        "kill succulents, the plants that are famously unkillable",
+    ],
+    "Still quotes Vine in 2024": [
+        "quote Vines like they're scripture",
+        "communicate mainly in six-second references",
+    ],
+    "Thinks pineapple belongs on pizza": [
+        "put pineapple on pizza and defend it to the death",
+        "start food fights over a tropical topping",
+    ],
+    "Has a finsta with 3 followers": [
+        "run a finsta with a tight inner circle of three",
+        "keep a secret account nobody asked to follow",
+    ],
+    "Watches movies on 1.5x speed": [
+        "watch movies at 1.5x like you're late for something",
+        "speedrun cinema",
+    ],
+    "Leaves cabinet doors open": [
+        "leave cabinet doors open like traps for your roommates",
+        "turn every kitchen into an obstacle course",
+    ],
+    "Over-explains simple things": [
+        "turn a yes-or-no question into a three-part lecture",
+        "explain the joke, then explain the explanation",
+    ],
+}
+
+GENERIC_RIFFS = [
+    "put \"{trait}\" on a dating profile on purpose",
+    "list \"{trait}\" like it's a selling point",
+    "admit \"{trait}\" with suspicious confidence",
+]
+
+ROAST_TEMPLATES = [
+    "You {a}, and somehow you also {b}. Honestly, it takes talent to be this much of a project. 🚩",
+    "Let's review: you {a} and you {b}. Therapists would call that a case study; we call it a personality. 🚩",
+    "You {a}. You also {b}. Nobody's perfect, but you seem to be going for the opposite on purpose. 🚩",
+    "Somewhere out there is a person who can handle someone who {a} and {b}. They're just very well hidden. 🚩",
+]
+
+SINGLE_ROAST_TEMPLATES = [
+    "You {a}, and you said it out loud on a dating app. That's either brave or a cry for help. 🚩",
+    "You {a}. At least you're upfront about it, which is more than most people manage. 🚩",
+]
+
+ICEBREAKER_TEMPLATES = [
+    "Hey {name}, I {a}, so I'm clearly not here to judge. Want to compare red flags? 🚩",
+    "{name}, full disclosure: I {a}. Your move, and please make it worse. 🚩",
+    "Hi {name}! I {a}. I'm hoping your red flags and mine can form a support group. 🚩",
+    "Hey {name}, I saw you {b} and honestly, respect. I {a}, so we're even. 🚩",
+]
+
+
+def _normalize(trait: str) -> str:
+    return re.sub(r"[^a-z0-9']+", " ", trait.lower()).strip()
+
+
+_KNOWN: Dict[str, List[str]] = {
+    _normalize(trait): riffs
+    for table in (RED_FLAG_RIFFS, NEGATIVE_QUALITY_RIFFS)
+    for trait, riffs in table.items()
+}
+
+
+def riff(trait: str, rng: random.Random) -> str:
+    """A verb phrase for ``trait``: a curated riff if it's a known suggestion."""
+    known = _KNOWN.get(_normalize(trait))
+    if known:
+        return rng.choice(known)
+    return rng.choice(GENERIC_RIFFS).format(trait=trait.strip())
+
+
+def _riffs(traits: List[str], count: int, rng: random.Random) -> List[str]:
+    # Prefer curated riffs; they're funnier than quoting the trait back
+    traits = [t for t in traits if t and t.strip()]
+    picked = sorted(rng.sample(traits, len(traits)), key=lambda t: _normalize(t) not in _KNOWN)[:count]
+    return [riff(t, rng) for t in picked]
+
+
+def roast(red_flags: List[str], negative_qualities: List[str], rng: Optional[random.Random] = None) -> str:
+    rng = rng or random.Random()
+    riffs = _riffs(list(red_flags) + list(negative_qualities), 2, rng)
+    if not riffs:
+        return "You haven't shared any red flags yet. Too perfect or too scared? 🚩"
+    if len(riffs) == 1:
+        return rng.choice(SINGLE_ROAST_TEMPLATES).format(a=riffs[0])
+    return rng.choice(ROAST_TEMPLATES).format(a=riffs[0], b=riffs[1])
+
+
+def icebreaker(
+    sender_red_flags: List[str],
+    recipient_red_flags: List[str],
+    recipient_name: str = "there",
+    rng: Optional[random.Random] = None,
+) -> str:
+    rng = rng or random.Random()
+    own = _riffs(sender_red_flags, 1, rng) or ["have red flags I'm still too shy to list"]
+    theirs = _riffs(recipient_red_flags, 1, rng)
+    templates = ICEBREAKER_TEMPLATES if theirs else [t for t in ICEBREAKER_TEMPLATES if "{b}" not in t]
+    return rng.choice(templates).format(name=recipient_name, a=own[0], b=theirs[0] if theirs else "")
@@ -1,20 +1,47 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Tuple
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
+from dataclasses import asdict
+import json
+import math
 import uuid
+import hmac
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
-import httpx
-import cloudinary
-import cloudinary.utils
+
+from admission import AdmissionClass, AdmissionController, AdmissionMiddleware
+from account_deletion import get_progress as get_deletion_progress, mark_failed as mark_deletion_failed, request_deletion, run_deletion
+from ai_cache import AIResponseCache, cache_key
+from ai_service import AIPrompt, AIService, compatibility_prompt, icebreaker_prompt, roast_prompt
+from cache import LocalCache, MongoBus, MongoSharedTier, TieredCache
+from change_streams import ChangeConsumer
+from concurrency import ConcurrencyLimiter, Hedge, QueueTimeout
+from db_indexes import ensure_indexes
+from etag import ETAG_STATS, PrecomputedJSON, conditional_get_middleware, make_etag, not_modified
+from field_selection import FieldSelector
+from job_queue import JobQueue
+from json_response import FastJSONResponse
+from llm import provider_from_env
+from maintenance import MaintenanceScheduler, PeriodicJob, purge_expired_sessions, rebuild_last_message_at, remove_orphans
+from metrics import REGISTRY, LoopLagMonitor, MongoCommandMetrics, MongoPoolMetrics, metrics_middleware, timed
+from migrate_datetimes import parse_timestamp
+from mongo_pool import client_options, stale_ok_read_preference
+from slow_log import SlowQueryListener, configure_slow_log, slow_log_middleware, slow_log_state
+from throttle import LoginThrottle, MemoryBucketStore, Throttled, client_ip
+from warmup import Readiness, open_pool
+from offline_ai import NEGATIVE_QUALITY_RIFFS, RED_FLAG_RIFFS, icebreaker as offline_icebreaker, roast as offline_roast
 
 
 ROOT_DIR = Path(__file__).parent
@@ -22,16 +49,189 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Command monitoring feeds per-route Mongo latency into /metrics and the slow log
+mongo_metrics = MongoCommandMetrics()
+mongo_pool_metrics = MongoPoolMetrics()
+# tz_aware: dates come back as UTC-aware datetimes; pool size, idle time,
+# wait-queue timeout and compression come from MONGO_* (see mongo_pool.py)
+client = AsyncIOMotorClient(
+    mongo_url,
+    tz_aware=True,
+    event_listeners=[mongo_metrics, mongo_pool_metrics, SlowQueryListener()],
+    **client_options(),
+)
 db = client[os.environ['DB_NAME']]
 
-# Configure Cloudinary (for image hosting)
-cloudinary.config(
-    cloud_name=os.environ.get("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.environ.get("CLOUDINARY_API_KEY"),
-    api_secret=os.environ.get("CLOUDINARY_API_SECRET"),
-    secure=True,
+# Listings that tolerate bounded staleness read from secondaries when the
+# deployment has them; auth, swipes and anything read-before-write use ``db``.
+STALE_OK_READS = stale_ok_read_preference()
+
+
+def stale_ok(collection: str):
+    return db.get_collection(collection, read_preference=STALE_OK_READS)
+
+
+def stale_ok_unless_changed(collection: str, cache_key: str):
+    """``stale_ok(collection)`` for filling ``cache_key``, except from the
+    primary while a secondary may still lack the write that last invalidated
+    it; otherwise a user's own change could be cached away for a whole TTL."""
+    window = STALE_OK_READS.max_staleness
+    if window > 0 and cache.invalidated_within(cache_key, window):
+        return db[collection]
+    return stale_ok(collection)
+
+# Optional integrations are imported on first use, keeping worker boot (and
+# ``import server``) cheap; tests/test_import_time.py holds the budget.
+
+@lru_cache(maxsize=None)
+def cloudinary_utils():
+    """Cloudinary (image hosting), configured on first use"""
+    import cloudinary
+    import cloudinary.utils
+
+    cloudinary.config(
+        cloud_name=os.environ.get("CLOUDINARY_CLOUD_NAME"),
+        api_key=os.environ.get("CLOUDINARY_API_KEY"),
+        api_secret=os.environ.get("CLOUDINARY_API_SECRET"),
+        secure=True,
+    )
+    return cloudinary.utils
+
+# Sessions, authenticated users, match lists and swiped sets, cached per worker for
+# CACHE_TTL_SECONDS; CACHE_SHARED_TIER=mongo adds a tier all workers share.
+# Invalidations reach the other workers over CACHE_BUS (a capped collection).
+def _build_cache(database) -> TieredCache:
+    return TieredCache(
+        LocalCache(max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))),
+        shared=MongoSharedTier(database.cache) if os.environ.get("CACHE_SHARED_TIER", "off") == "mongo" else None,
+        bus=MongoBus(database) if os.environ.get("CACHE_BUS", "mongo") == "mongo" else None,
+        local_ttl=float(os.environ.get("CACHE_TTL_SECONDS", "30")),
+    )
+
+
+cache = _build_cache(db)
+
+# AI: LLM service (LLM_PROVIDER=stub for offline use) and response cache
+ai_service = AIService(provider_from_env())
+ai_cache = AIResponseCache(db.ai_cache)
+# Bounded upstream concurrency so AI spikes can't starve the worker
+llm_limiter = ConcurrencyLimiter(
+    max_concurrency=int(os.environ.get("AI_MAX_CONCURRENCY", "16")),
+    max_per_key=int(os.environ.get("AI_MAX_PER_USER", "2")),
+    queue_timeout=float(os.environ.get("AI_QUEUE_TIMEOUT_SECONDS", "10")),
+)
+# Offline template fallback for roasts/icebreakers: "budget" serves it once the
+# LLM exceeds AI_LATENCY_BUDGET_SECONDS, "hedge" races it after a short head
+# start (AI_HEDGE_DELAY_SECONDS), "off" always waits for the LLM
+AI_FALLBACK = os.environ.get("AI_FALLBACK", "budget")
+ai_hedge = {
+    "budget": lambda: Hedge(float(os.environ.get("AI_LATENCY_BUDGET_SECONDS", "6"))),
+    "hedge": lambda: Hedge(float(os.environ.get("AI_HEDGE_DELAY_SECONDS", "0.5"))),
+    "off": lambda: None,
+}[AI_FALLBACK]()
+# Google OAuth session exchange over one pooled client (httpx is loaded with it)
+_session_exchange = None
+
+
+def session_exchange():
+    global _session_exchange
+    if _session_exchange is None:
+        from oauth_client import EMERGENT_AUTH_URL, SessionExchange
+
+        _session_exchange = SessionExchange(
+            os.environ.get("EMERGENT_AUTH_URL", EMERGENT_AUTH_URL),
+            timeout=float(os.environ.get("AUTH_HTTP_TIMEOUT_SECONDS", "10")),
+        )
+    return _session_exchange
+# Login attempts are throttled per IP and per email before bcrypt runs
+login_throttle = LoginThrottle(
+    MemoryBucketStore(max_keys=int(os.environ.get("LOGIN_THROTTLE_MAX_KEYS", "100000"))),
+    ip_burst=float(os.environ.get("LOGIN_IP_BURST", "20")),
+    ip_per_minute=float(os.environ.get("LOGIN_IP_PER_MINUTE", "20")),
+    email_burst=float(os.environ.get("LOGIN_EMAIL_BURST", "5")),
+    email_per_minute=float(os.environ.get("LOGIN_EMAIL_PER_MINUTE", "1")),
+)
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+# Admission control: each class gets its own slots and queue deadline, so an
+# AI pileup or login storm is shed (503) instead of stalling chat and swipes.
+# Limits are per worker; override with ADMISSION_<CLASS>_CONCURRENCY etc.
+admission = AdmissionController(
+    [
+        AdmissionClass.from_env("auth", max_concurrency=16, max_queue=64, deadline=2.0),
+        AdmissionClass.from_env("interactive", max_concurrency=64, max_queue=256, deadline=2.0, retry_after=1.0),
+        AdmissionClass.from_env("discover", max_concurrency=16, max_queue=64, deadline=1.5),
+        AdmissionClass.from_env("ai", max_concurrency=32, max_queue=32, deadline=0.5, retry_after=5.0),
+        AdmissionClass.from_env("admin", max_concurrency=4, max_queue=8, deadline=5.0),
+    ],
+    routes=[
+        ("/api/auth/", "auth"),
+        ("/api/swipe", "interactive"),
+        ("/api/matches", "interactive"),
+        ("/api/profile", "interactive"),
+        ("/api/discover", "discover"),
+        ("/api/ai/", "ai"),
+        ("/api/admin/", "admin"),
+        # Probes and scrapes are never queued
+        ("/api/health/", None),
+        ("/metrics", None),
+    ],
+    default="interactive",
+    enabled=os.environ.get("ADMISSION_ENABLED", "true").lower() == "true",
 )
+# Durable background jobs (AI precomputation runs here)
+job_queue = JobQueue(db.jobs, workers=int(os.environ.get("JOB_WORKERS", "2")))
+loop_lag_monitor = LoopLagMonitor()
+# Applies writes from every worker to derived state (last_message_at, cached
+# profiles/match lists); without a replica set it reconciles periodically.
+# CHANGE_STREAMS=off disables it.
+def _build_change_consumer(database, tiered_cache: TieredCache) -> ChangeConsumer:
+    return ChangeConsumer(
+        database,
+        tiered_cache,
+        reconcile_interval=float(os.environ.get("CHANGE_RECONCILE_SECONDS", "60")),
+    )
+
+
+change_consumer = _build_change_consumer(db, cache)
+CHANGE_STREAMS_ENABLED = os.environ.get("CHANGE_STREAMS", "auto") != "off"
+# Periodic cleanup, each job run by whichever worker holds its lease.
+# Intervals are MAINTENANCE_<JOB>_SECONDS; MAINTENANCE=off disables it.
+_maintenance_batches = {
+    "batch_size": int(os.environ.get("MAINTENANCE_BATCH_SIZE", "500")),
+    "max_batches": int(os.environ.get("MAINTENANCE_MAX_BATCHES", "20")),
+}
+def _build_maintenance(database) -> MaintenanceScheduler:
+    return MaintenanceScheduler(database, [
+        PeriodicJob(
+            name,
+            partial(fn, **_maintenance_batches),
+            interval=float(os.environ.get(f"MAINTENANCE_{name.upper()}_SECONDS", default)),
+        )
+        for name, fn, default in (
+            ("sessions", purge_expired_sessions, "3600"),
+            ("orphans", remove_orphans, "21600"),
+            ("last_message_at", rebuild_last_message_at, "86400"),
+        )
+    ])
+
+
+maintenance = _build_maintenance(db)
+MAINTENANCE_ENABLED = os.environ.get("MAINTENANCE", "on") != "off"
+
+
+def use_database(mongo_client, database) -> None:
+    """Rebind everything built on ``db`` at import to ``database``.
+
+    For running the app against a stand-in (loadgen's in-memory mode);
+    call before the lifespan starts anything.
+    """
+    global client, db, cache, ai_cache, change_consumer, maintenance
+    client, db = mongo_client, database
+    cache = _build_cache(database)
+    ai_cache = AIResponseCache(database.ai_cache)
+    job_queue.collection = database.jobs
+    change_consumer = _build_change_consumer(database, cache)
+    maintenance = _build_maintenance(database)
 
 # JWT Configuration
 # In production this MUST come from environment; no insecure fallback
@@ -39,8 +239,70 @@ JWT_SECRET = os.environ["JWT_SECRET"]
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
 
+# ==================== LIFESPAN ====================
+
+readiness = Readiness()
+# Pooled connections opened (and pinged) before the worker takes traffic
+MONGO_WARM_CONNECTIONS = int(os.environ.get("MONGO_WARM_CONNECTIONS", "4"))
+WARMUP_STEP_TIMEOUT_SECONDS = float(os.environ.get("WARMUP_STEP_TIMEOUT_SECONDS", "30"))
+
+
+async def warm_discovery():
+    """Run the discovery candidate scan once so its plan is cached and the
+    working set is in memory on whichever member serves it."""
+    await stale_ok("users").find(
+        {"profile_complete": True, "is_active": True},
+        {"_id": 0, "password_hash": 0},
+    ).to_list(200)
+
+
+async def warm_cloudinary():
+    """Import and configure Cloudinary before the first upload signature."""
+    cloudinary_utils()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    step = readiness.step
+    timeout = WARMUP_STEP_TIMEOUT_SECONDS
+    await step("mongo", lambda: open_pool(client, MONGO_WARM_CONNECTIONS), timeout=timeout)
+    await step("indexes", lambda: ensure_indexes(db), timeout=timeout)
+    # Imports the LLM integration and opens its HTTP pool
+    await step("llm", ai_service.start, required=False, timeout=timeout)
+    await step("discovery", warm_discovery, required=False, timeout=timeout)
+    # Lazy at import time, but loaded here before the first login/upload
+    await step("oauth", lambda: session_exchange().start(), required=False, timeout=timeout)
+    await step("cloudinary", warm_cloudinary, required=False, timeout=timeout)
+    await step("cache", cache.start, required=False, timeout=timeout)
+    if CHANGE_STREAMS_ENABLED:
+        await step("change_streams", change_consumer.start, required=False, timeout=timeout)
+    job_queue.start()
+    if MAINTENANCE_ENABLED:
+        maintenance.start()
+    loop_lag_monitor.start()
+    readiness.mark_ready()
+    try:
+        yield
+    finally:
+        readiness.mark_draining()
+        await loop_lag_monitor.stop()
+        await job_queue.stop()
+        await maintenance.stop()
+        await change_consumer.stop()
+        await cache.stop()
+        await ai_service.close()
+        if _session_exchange is not None:
+            await _session_exchange.close()
+        client.close()
+
+
 # Create the main app
-app = FastAPI(title="Unhinged API", description="Dating for the Flawed & Chaotic")
+app = FastAPI(
+    title="Unhinged API",
+    description="Dating for the Flawed & Chaotic",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -115,6 +377,9 @@ class UserProfile(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     profile_complete: bool = False
 
+# Whitelist for ?fields= selection on user reads
+USER_FIELDS = FieldSelector(UserProfile)
+
 class ProfileUpdate(BaseModel):
     # Identity & basics
     name: Optional[str] = None
@@ -223,88 +488,138 @@ def decode_jwt_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def get_current_user(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> dict:
+async def _session_user_id(session_token: str) -> Optional[str]:
+    async def load():
+        now = datetime.now(timezone.utc)
+        # expires_at is a BSON date, so Mongo does the expiry check. Sessions
+        # from before the date migration hold an ISO string, which compares
+        # in order against another UTC isoformat()
+        session = await db.user_sessions.find_one(
+            {
+                "session_token": session_token,
+                "$or": [
+                    {"expires_at": {"$gt": now}},
+                    {"expires_at": {"$type": "string", "$gt": now.isoformat()}},
+                ],
+            },
+            {"_id": 0, "user_id": 1, "expires_at": 1},
+        )
+        if session and isinstance(session["expires_at"], str):
+            session["expires_at"] = parse_timestamp(session["expires_at"])
+        return session
+
+    session = await cache.get_or_load(f"session:{session_token}", load)
+    # A cached session may have expired since it was loaded
+    if session and session["expires_at"] > datetime.now(timezone.utc):
+        return session["user_id"]
+    return None
+
+async def _authenticated_user_ids(request: Request, credentials: Optional[HTTPAuthorizationCredentials]):
+    """Each user_id the request's credentials vouch for, in the order they are tried"""
     # Check for session_token cookie first (Google Auth)
     session_token = request.cookies.get("session_token")
     if session_token:
-        session = await db.user_sessions.find_one({"session_token": session_token}, {"_id": 0})
-        if session:
-            expires_at = session.get("expires_at")
-            if isinstance(expires_at, str):
-                expires_at = datetime.fromisoformat(expires_at)
-            if expires_at.tzinfo is None:
-                expires_at = expires_at.replace(tzinfo=timezone.utc)
-            if expires_at > datetime.now(timezone.utc):
-                user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
-                if user:
-                    return user
+        user_id = await _session_user_id(session_token)
+        if user_id:
+            yield user_id
     
     # Check for Bearer token (JWT Auth)
     if credentials:
         payload = decode_jwt_token(credentials.credentials)
-        user = await db.users.find_one({"user_id": payload["sub"]}, {"_id": 0})
-        if user:
-            return user
+        yield payload["sub"]
     
     # Check Authorization header directly
     auth_header = request.headers.get("Authorization")
     if auth_header and auth_header.startswith("Bearer "):
         token = auth_header.split(" ")[1]
         try:
-            payload = decode_jwt_token(token)
-            user = await db.users.find_one({"user_id": payload["sub"]}, {"_id": 0})
-            if user:
-                return user
+            user_id = decode_jwt_token(token)["sub"]
         except Exception:
             # Try as session token
-            session = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
-            if session:
-                expires_at = session.get("expires_at")
-                if isinstance(expires_at, str):
-                    expires_at = datetime.fromisoformat(expires_at)
-                if expires_at.tzinfo is None:
-                    expires_at = expires_at.replace(tzinfo=timezone.utc)
-                if expires_at > datetime.now(timezone.utc):
-                    user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
-                    if user:
-                        return user
+            user_id = await _session_user_id(token)
+        if user_id:
+            yield user_id
+
+async def _load_user(user_id: str, projection: dict) -> Optional[dict]:
+    # Accounts being deleted are signed out immediately
+    return await db.users.find_one({"user_id": user_id, "deleted": {"$ne": True}}, projection)
+
+async def _authenticate(request: Request, credentials: Optional[HTTPAuthorizationCredentials], projection: Optional[dict] = None) -> dict:
+    """The authenticated user; the whole profile (cached) unless ``projection`` trims it"""
+    async for user_id in _authenticated_user_ids(request, credentials):
+        if projection is None:
+            user = await cache.get_or_load(f"user:{user_id}", lambda: _load_user(user_id, {"_id": 0, "password_hash": 0}))
+        else:
+            user = await _load_user(user_id, projection)
+        if user:
+            return user
     
     raise HTTPException(status_code=401, detail="Not authenticated")
 
-
-@api_router.delete("/users/me")
+async def get_current_user(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> dict:
+    """The signed-in user's profile; shared with other requests, so don't modify it"""
+    return await _authenticate(request, credentials)
+
+def require_admin(request: Request) -> None:
+    """Guard operational endpoints with the ADMIN_TOKEN shared secret"""
+    expected = os.environ.get("ADMIN_TOKEN")
+    provided = request.headers.get("X-Admin-Token", "")
+    if not expected or not hmac.compare_digest(provided, expected):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+def selected_user_fields(fields: Optional[str] = None) -> Optional[frozenset]:
+    """Parse ?fields=a,b,c against the UserProfile whitelist (None = all fields)"""
+    return USER_FIELDS.parse(fields)
+
+async def get_current_user_fields(
+    request: Request,
+    selected: Optional[frozenset] = Depends(selected_user_fields),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+) -> dict:
+    """Current user loaded with only the requested fields (plus what ETags need)"""
+    if selected is None:
+        return await _authenticate(request, credentials)
+    projection = USER_FIELDS.projection(selected, "user_id", "profile_version")
+    return await _authenticate(request, credentials, projection)
+
+
+@api_router.delete("/users/me", status_code=202)
 async def delete_account(current_user: dict = Depends(get_current_user)):
-    """Permanently delete the current user's account and related data"""
-    user_id = current_user["user_id"]
+    """Permanently delete the current user's account and related data.
 
-    # Delete messages
-    matches = await db.matches.find({
-        "$or": [{"user1_id": user_id}, {"user2_id": user_id}],
-    }, {"_id": 0, "match_id": 1}).to_list(500)
-    match_ids = [m["match_id"] for m in matches]
-    if match_ids:
-        await db.messages.delete_many({"match_id": {"$in": match_ids}})
-
-    # Delete matches involving user
-    await db.matches.delete_many({
-        "$or": [{"user1_id": user_id}, {"user2_id": user_id}],
-    })
-
-    # Delete swipes involving user
-    await db.swipes.delete_many({
-        "$or": [
-            {"swiper_id": user_id},
-            {"target_id": user_id},
-        ]
-    })
-
-    # Delete sessions
-    await db.user_sessions.delete_many({"user_id": user_id})
-
-    # Finally delete the user
-    await db.users.delete_one({"user_id": user_id})
-
-    return {"success": True}
+    The account is marked deleted immediately; messages, matches, swipes and
+    sessions are removed in the background (see /users/me/deletion-status).
+    """
+    user_id = current_user["user_id"]
+    progress = await request_deletion(db, user_id)
+    await cache.invalidate(f"user:{user_id}")
+    await job_queue.enqueue("account_deletion", {"user_id": user_id}, dedupe_key=f"delete:{user_id}")
+    return {"success": True, "status": progress["status"]}
+
+@api_router.get("/users/me/deletion-status")
+async def get_deletion_status(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    """Progress of the current user's account deletion (still readable with
+    the deleted account's token)"""
+    authenticated = False
+    async for user_id in _authenticated_user_ids(request, credentials):
+        authenticated = True
+        progress = await get_deletion_progress(db, user_id)
+        if progress:
+            return progress
+    if not authenticated:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    raise HTTPException(status_code=404, detail="No account deletion requested")
+
+async def run_account_deletion(payload: dict) -> None:
+    """Job handler: cascade-delete an account, then drop its cached entries"""
+    await run_deletion(db, payload["user_id"])
+    await cache.invalidate(f"user:{payload['user_id']}", f"matches:{payload['user_id']}", f"swiped:{payload['user_id']}")
+
+async def fail_account_deletion(payload: dict, error: Exception) -> None:
+    """Job failure hook: the deletion gave up, so report it as failed rather than running"""
+    await mark_deletion_failed(db, payload["user_id"], repr(error))
+
+job_queue.register("account_deletion", run_account_deletion, on_failure=fail_account_deletion)
 
 
 @api_router.post("/users/me/disable")
@@ -313,10 +628,15 @@ async def disable_account(current_user: dict = Depends(get_current_user)):
     user_id = current_user["user_id"]
 
     # Mark user as inactive
-    await db.users.update_one({"user_id": user_id}, {"$set": {"is_active": False}})
+    await db.users.update_one(
+        {"user_id": user_id},
+        {"$set": {"is_active": False}, "$inc": {"profile_version": 1}},
+    )
+    await cache.invalidate(f"user:{user_id}")
 
     # Optionally, prevent them from being matched further by clearing pending swipes
     await db.swipes.delete_many({"swiper_id": user_id})
+    await cache.invalidate(f"swiped:{user_id}")
 
     return {"success": True}
 
@@ -381,8 +701,9 @@ async def register(user_data: UserCreate):
         # Account status
         "is_active": True,
         # Meta
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": datetime.now(timezone.utc),
         "profile_complete": False,
+        "profile_version": 0,
     }
 
     await db.users.insert_one(user_doc)
@@ -421,7 +742,7 @@ async def get_cloudinary_signature(
     if not api_secret:
         raise HTTPException(status_code=500, detail="Cloudinary not configured")
 
-    signature = cloudinary.utils.api_sign_request(params_to_sign, api_secret)
+    signature = cloudinary_utils().api_sign_request(params_to_sign, api_secret)
 
     return CloudinarySignatureResponse(
         signature=signature,
@@ -433,9 +754,10 @@ async def get_cloudinary_signature(
     )
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(user_data: UserLogin):
+async def login(user_data: UserLogin, request: Request):
+    await login_throttle.check(client_ip(request, TRUSTED_PROXY_HOPS), user_data.email)
     user = await db.users.find_one({"email": user_data.email}, {"_id": 0})
-    if not user or not user.get("password_hash"):
+    if not user or not user.get("password_hash") or user.get("deleted"):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not verify_password(user_data.password, user["password_hash"]):
@@ -453,26 +775,31 @@ async def create_session_from_google(request: Request, response: Response):
         raise HTTPException(status_code=400, detail="Missing session ID")
     
     # Call Emergent Auth to get user data
-    async with httpx.AsyncClient() as http_client:
-        auth_response = await http_client.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id}
-        )
-        if auth_response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid session")
-        
-        auth_data = auth_response.json()
+    exchange = session_exchange()
+    try:
+        auth_data = await exchange.fetch(session_id)
+    except exchange.errors as e:
+        logger.error("Session exchange failed: %r", e)
+        raise HTTPException(status_code=502, detail="Auth service unavailable")
+    if auth_data is None:
+        raise HTTPException(status_code=401, detail="Invalid session")
     
     # Check if user exists
     existing_user = await db.users.find_one({"email": auth_data["email"]}, {"_id": 0})
+    if existing_user and existing_user.get("deleted"):
+        raise HTTPException(status_code=409, detail="Account deletion in progress")
     
     if existing_user:
         user_id = existing_user["user_id"]
         # Update user info if needed
         await db.users.update_one(
             {"user_id": user_id},
-            {"$set": {"name": auth_data["name"], "picture": auth_data.get("picture")}}
+            {
+                "$set": {"name": auth_data["name"], "picture": auth_data.get("picture")},
+                "$inc": {"profile_version": 1},
+            }
         )
+        await cache.invalidate(f"user:{user_id}")
     else:
         # Create new user
         user_id = f"user_{uuid.uuid4().hex[:12]}"
@@ -525,8 +852,9 @@ async def create_session_from_google(request: Request, response: Response):
             # Account status
             "is_active": True,
             # Meta
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "profile_complete": False
+            "created_at": datetime.now(timezone.utc),
+            "profile_complete": False,
+            "profile_version": 0
         }
         await db.users.insert_one(user_doc)
     
@@ -537,8 +865,9 @@ async def create_session_from_google(request: Request, response: Response):
     await db.user_sessions.insert_one({
         "user_id": user_id,
         "session_token": session_token,
-        "expires_at": expires_at.isoformat(),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        # Native datetime so the TTL index on expires_at can reap it
+        "expires_at": expires_at,
+        "created_at": datetime.now(timezone.utc)
     })
     
     # Set cookie
@@ -556,7 +885,19 @@ async def create_session_from_google(request: Request, response: Response):
     return {"session_token": session_token, "user": user}
 
 @api_router.get("/auth/me")
-async def get_me(current_user: dict = Depends(get_current_user)):
+async def get_me(
+    request: Request,
+    response: Response,
+    selected: Optional[frozenset] = Depends(selected_user_fields),
+    current_user: dict = Depends(get_current_user_fields),
+):
+    etag = make_etag("me", current_user["user_id"], current_user.get("profile_version", 0), *sorted(selected or ()))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    response.headers["ETag"] = etag
+    if selected is not None:
+        return {k: v for k, v in current_user.items() if k in selected}
     user_response = {k: v for k, v in current_user.items() if k != "password_hash"}
     return user_response
 
@@ -565,48 +906,74 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
+        await cache.invalidate(f"session:{session_token}")
     response.delete_cookie(key="session_token", path="/")
     return {"message": "Logged out successfully"}
 
 # ==================== PROFILE ROUTES ====================
 
+# Profile is complete if has at least one red flag, one photo, and basic info
+PROFILE_COMPLETE_EXPR = {
+    "$and": [
+        {"$gt": [{"$size": {"$ifNull": ["$red_flags", []]}}, 0]},
+        {"$gt": [{"$size": {"$ifNull": ["$photos", []]}}, 0]},
+        {"$ne": [{"$ifNull": ["$age", None]}, None]},
+        {"$ne": [{"$ifNull": ["$bio", None]}, None]},
+        {"$ne": ["$bio", ""]},
+    ]
+}
+
 @api_router.get("/profile", response_model=UserProfile)
-async def get_profile(current_user: dict = Depends(get_current_user)):
-    user_response = {k: v for k, v in current_user.items() if k != "password_hash"}
-    if isinstance(user_response.get("created_at"), str):
-        user_response["created_at"] = datetime.fromisoformat(user_response["created_at"])
-    return UserProfile(**user_response)
+async def get_profile(
+    request: Request,
+    selected: Optional[frozenset] = Depends(selected_user_fields),
+    current_user: dict = Depends(get_current_user_fields),
+):
+    etag = make_etag("profile", current_user["user_id"], current_user.get("profile_version", 0), *sorted(selected or ()))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    # Shape the stored document directly instead of building a UserProfile
+    return FastJSONResponse(USER_FIELDS.document(current_user, selected), headers={"ETag": etag})
 
 @api_router.put("/profile")
 async def update_profile(update: ProfileUpdate, current_user: dict = Depends(get_current_user)):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
     
-    if update_data:
-        # Check if profile is now complete
-        user = await db.users.find_one({"user_id": current_user["user_id"]}, {"_id": 0})
-        merged = {**user, **update_data}
-        
-        # Profile is complete if has at least one red flag, one photo, and basic info
-        is_complete = (
-            len(merged.get("red_flags", [])) > 0 and
-            len(merged.get("photos", [])) > 0 and
-            merged.get("age") is not None and
-            merged.get("bio") is not None and merged.get("bio") != ""
-        )
-        update_data["profile_complete"] = is_complete
-        
-        await db.users.update_one(
-            {"user_id": current_user["user_id"]},
-            {"$set": update_data}
-        )
-    
-    updated_user = await db.users.find_one({"user_id": current_user["user_id"]}, {"_id": 0, "password_hash": 0})
+    if not update_data:
+        return {k: v for k, v in current_user.items() if k != "password_hash"}
+
+    # Apply the update and recompute completeness in one atomic round trip.
+    # Values are wrapped in $literal so user text like "$bio" is never read as a field path.
+    updated_user = await db.users.find_one_and_update(
+        {"user_id": current_user["user_id"]},
+        [
+            {"$set": {k: {"$literal": v} for k, v in update_data.items()}},
+            {"$set": {
+                "profile_complete": PROFILE_COMPLETE_EXPR,
+                "profile_version": {"$add": [{"$ifNull": ["$profile_version", 0]}, 1]},
+            }},
+        ],
+        projection={"_id": 0, "password_hash": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    await cache.invalidate(f"user:{current_user['user_id']}")
+
     return updated_user
 
 # ==================== DISCOVERY ROUTES ====================
 
+# Candidate fields discover_profiles reads for filtering and scoring
+DISCOVER_FILTER_FIELDS = (
+    "user_id", "age", "gender_identity", "pref_age_min", "pref_age_max", "pref_genders",
+    "red_flags", "relationship_type", "wants_kids", "has_kids", "prompts",
+)
+
 @api_router.get("/discover")
-async def discover_profiles(current_user: dict = Depends(get_current_user)):
+async def discover_profiles(
+    selected: Optional[frozenset] = Depends(selected_user_fields),
+    current_user: dict = Depends(get_current_user),
+):
     """Get profiles to swipe on - excludes already swiped and self.
 
     Applies basic match preferences:
@@ -614,24 +981,33 @@ async def discover_profiles(current_user: dict = Depends(get_current_user)):
     - Respects your age range and gender preferences when set
     - Softly respects the other person's age range and gender prefs
     - Filters out profiles that hit your dealbreaker red flags
+
+    With ?fields=..., each card carries only those fields plus user_id and match_score.
     """
     user_id = current_user["user_id"]
 
     # Build list of user_ids to exclude (already swiped + self)
-    swiped = await db.swipes.find(
-        {"swiper_id": user_id}, {"_id": 0, "target_id": 1}
-    ).to_list(1000)
-    swiped_ids = [s["target_id"] for s in swiped]
-    swiped_ids.append(user_id)
+    async def load_swiped():
+        swiped = await db.swipes.find(
+            {"swiper_id": user_id}, {"_id": 0, "target_id": 1}
+        ).to_list(1000)
+        return [s["target_id"] for s in swiped]
+
+    swiped_ids = [*await cache.get_or_load(f"swiped:{user_id}", load_swiped), user_id]
+
+    if selected is None:
+        projection = {"_id": 0, "password_hash": 0}
+    else:
+        projection = USER_FIELDS.projection(selected, *DISCOVER_FILTER_FIELDS)
 
     # Base candidate set: complete, active profiles not yet swiped
-    candidates = await db.users.find(
+    candidates = await stale_ok("users").find(
         {
             "user_id": {"$nin": swiped_ids},
             "profile_complete": True,
             "is_active": True,
         },
-        {"_id": 0, "password_hash": 0},
+        projection,
     ).to_list(200)
 
     # Pull current user preferences
@@ -675,52 +1051,57 @@ async def discover_profiles(current_user: dict = Depends(get_current_user)):
 
         return score
 
-    for cand in candidates:
-        cand_age = cand.get("age")
-        cand_gender = cand.get("gender_identity")
-
-        # 1) Your age range preferences (if set)
-        if pref_age_min is not None:
-            if cand_age is None or cand_age < pref_age_min:
-                continue
-        if pref_age_max is not None:
-            if cand_age is None or cand_age > pref_age_max:
-                continue
-
-        # 2) Your gender preferences (if set)
-        if pref_genders:
-            if not cand_gender or cand_gender not in pref_genders:
-                continue
-
-        # 3) Their age range preferences (soft mutual filter)
-        cand_pref_min = cand.get("pref_age_min")
-        cand_pref_max = cand.get("pref_age_max")
-        if my_age is not None:
-            if cand_pref_min is not None and my_age < cand_pref_min:
-                continue
-            if cand_pref_max is not None and my_age > cand_pref_max:
-                continue
-
-        # 4) Their gender preferences (if they set any)
-        cand_pref_genders = cand.get("pref_genders") or []
-        if my_gender and cand_pref_genders:
-            if my_gender not in cand_pref_genders:
-                continue
-
-        # 5) Dealbreaker red flags (hard filter)
-        if dealbreakers:
-            cand_flags = cand.get("red_flags") or []
-            if any(flag in cand_flags for flag in dealbreakers):
-                continue
-
-        # Compute compatibility score and attach for sorting
-        match_score = compute_match_score(current_user, cand)
-        enriched = {**cand, "match_score": match_score}
-        filtered.append(enriched)
-
-    # Sort by descending compatibility score
-    filtered.sort(key=lambda x: x.get("match_score", 0), reverse=True)
-    return filtered
+    # Filtering and scoring, timed separately from the queries for /metrics
+    with timed("scoring"):
+        for cand in candidates:
+            cand_age = cand.get("age")
+            cand_gender = cand.get("gender_identity")
+
+            # 1) Your age range preferences (if set)
+            if pref_age_min is not None:
+                if cand_age is None or cand_age < pref_age_min:
+                    continue
+            if pref_age_max is not None:
+                if cand_age is None or cand_age > pref_age_max:
+                    continue
+
+            # 2) Your gender preferences (if set)
+            if pref_genders:
+                if not cand_gender or cand_gender not in pref_genders:
+                    continue
+
+            # 3) Their age range preferences (soft mutual filter)
+            cand_pref_min = cand.get("pref_age_min")
+            cand_pref_max = cand.get("pref_age_max")
+            if my_age is not None:
+                if cand_pref_min is not None and my_age < cand_pref_min:
+                    continue
+                if cand_pref_max is not None and my_age > cand_pref_max:
+                    continue
+
+            # 4) Their gender preferences (if they set any)
+            cand_pref_genders = cand.get("pref_genders") or []
+            if my_gender and cand_pref_genders:
+                if my_gender not in cand_pref_genders:
+                    continue
+
+            # 5) Dealbreaker red flags (hard filter)
+            if dealbreakers:
+                cand_flags = cand.get("red_flags") or []
+                if any(flag in cand_flags for flag in dealbreakers):
+                    continue
+
+            # Compute compatibility score and attach for sorting
+            match_score = compute_match_score(current_user, cand)
+            if selected is not None:
+                cand = {k: v for k, v in cand.items() if k in selected or k == "user_id"}
+            enriched = {**cand, "match_score": match_score}
+            filtered.append(enriched)
+
+        # Sort by descending compatibility score
+        filtered.sort(key=lambda x: x.get("match_score", 0), reverse=True)
+    # Plain Mongo documents: serialize directly, skipping jsonable_encoder
+    return FastJSONResponse(filtered)
 
 @api_router.post("/swipe")
 async def swipe(action: SwipeAction, current_user: dict = Depends(get_current_user)):
@@ -733,9 +1114,10 @@ async def swipe(action: SwipeAction, current_user: dict = Depends(get_current_us
         "swiper_id": user_id,
         "target_id": action.target_user_id,
         "action": action.action,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     await db.swipes.insert_one(swipe_doc)
+    await cache.invalidate(f"swiped:{user_id}")
     
     match_created = False
     match_data = None
@@ -755,10 +1137,11 @@ async def swipe(action: SwipeAction, current_user: dict = Depends(get_current_us
                 "match_id": match_id,
                 "user1_id": user_id,
                 "user2_id": action.target_user_id,
-                "created_at": datetime.now(timezone.utc).isoformat(),
+                "created_at": datetime.now(timezone.utc),
                 "last_message_at": None
             }
             await db.matches.insert_one(match_doc)
+            await cache.invalidate(f"matches:{user_id}", f"matches:{action.target_user_id}")
             match_created = True
             
             # Get matched user info
@@ -770,6 +1153,8 @@ async def swipe(action: SwipeAction, current_user: dict = Depends(get_current_us
                 "match_id": match_id,
                 "matched_user": matched_user
             }
+            if matched_user:
+                await _precompute_match_ai(current_user, matched_user)
     
     return {
         "success": True,
@@ -780,13 +1165,20 @@ async def swipe(action: SwipeAction, current_user: dict = Depends(get_current_us
 # ==================== MATCHES & CHAT ROUTES ====================
 
 @api_router.get("/matches")
-async def get_matches(current_user: dict = Depends(get_current_user)):
-    """Get all matches for the current user"""
+async def get_matches(
+    request: Request,
+    selected: Optional[frozenset] = Depends(selected_user_fields),
+    current_user: dict = Depends(get_current_user),
+):
+    """Get all matches for the current user (?fields=... trims matched_user)"""
     user_id = current_user["user_id"]
     
-    matches = await db.matches.find({
-        "$or": [{"user1_id": user_id}, {"user2_id": user_id}]
-    }, {"_id": 0}).to_list(100)
+    async def load_matches():
+        return await stale_ok_unless_changed("matches", f"matches:{user_id}").find({
+            "$or": [{"user1_id": user_id}, {"user2_id": user_id}]
+        }, {"_id": 0}).to_list(100)
+
+    matches = await cache.get_or_load(f"matches:{user_id}", load_matches)
 
     if not matches:
         return []
@@ -797,19 +1189,43 @@ async def get_matches(current_user: dict = Depends(get_current_user)):
         for m in matches
     ]
 
-    users = await db.users.find(
-        {"user_id": {"$in": other_ids}},
-        {"_id": 0, "password_hash": 0}
+    if selected is None:
+        projection = {"_id": 0, "password_hash": 0}
+    else:
+        projection = USER_FIELDS.projection(selected, "user_id", "profile_version")
+    users = await stale_ok("users").find(
+        {"user_id": {"$in": other_ids}, "deleted": {"$ne": True}},
+        projection
     ).to_list(len(other_ids))
     user_map = {u["user_id"]: u for u in users}
 
+    # The listing only changes with the match set, their last_message_at
+    # and the matched users' profiles, so skip the last-message lookups
+    # and serialization when the client already has this version.
+    etag = make_etag(
+        "matches",
+        user_id,
+        *sorted(selected or ()),
+        *(f"{m['match_id']}:{m.get('last_message_at')}" for m in matches),
+        *(f"{u['user_id']}:{u.get('profile_version', 0)}" for u in users),
+    )
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    if selected is not None:
+        user_map = {
+            uid: {k: v for k, v in u.items() if k in selected or k == "user_id"}
+            for uid, u in user_map.items()
+        }
+
     result = []
     for match in matches:
         other_user_id = match["user2_id"] if match["user1_id"] == user_id else match["user1_id"]
         other_user = user_map.get(other_user_id)
 
         # Get last message
-        last_msg = await db.messages.find_one(
+        last_msg = await stale_ok("messages").find_one(
             {"match_id": match["match_id"]},
             {"_id": 0},
             sort=[("created_at", -1)]
@@ -822,7 +1238,7 @@ async def get_matches(current_user: dict = Depends(get_current_user)):
             "last_message": last_msg
         })
 
-    return result
+    return FastJSONResponse(result, headers={"ETag": etag})
 
 @api_router.get("/matches/{match_id}/messages")
 async def get_messages(match_id: str, current_user: dict = Depends(get_current_user)):
@@ -841,7 +1257,7 @@ async def get_messages(match_id: str, current_user: dict = Depends(get_current_u
         {"_id": 0}
     ).sort("created_at", 1).to_list(500)
     
-    return messages
+    return FastJSONResponse(messages)
 
 @api_router.post("/matches/{match_id}/messages")
 async def send_message(match_id: str, msg: MessageCreate, current_user: dict = Depends(get_current_user)):
@@ -860,7 +1276,7 @@ async def send_message(match_id: str, msg: MessageCreate, current_user: dict = D
         "match_id": match_id,
         "sender_id": current_user["user_id"],
         "content": msg.content,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     await db.messages.insert_one(message_doc)
     
@@ -869,166 +1285,307 @@ async def send_message(match_id: str, msg: MessageCreate, current_user: dict = D
         {"match_id": match_id},
         {"$set": {"last_message_at": message_doc["created_at"]}}
     )
+    await cache.invalidate(f"matches:{match['user1_id']}", f"matches:{match['user2_id']}")
     
-    return {k: v for k, v in message_doc.items()}
+    return {k: v for k, v in message_doc.items() if k != "_id"}
 
 # ==================== AI FEATURES ====================
 
+NO_FLAGS_ROAST = "You haven't shared any red flags yet. Too perfect or too scared? 🚩"
+
+# Kinds with an offline generator; each takes the prompt's ``inputs`` as kwargs
+OFFLINE_GENERATORS: Dict[str, Callable[..., str]] = {
+    "roast": offline_roast,
+    "icebreaker": offline_icebreaker,
+}
+
+def _has_fallback(kind: str) -> bool:
+    return ai_hedge is not None and kind in OFFLINE_GENERATORS
+
+def _require_llm(kind: Optional[str] = None) -> None:
+    if not ai_service.configured and not (kind and _has_fallback(kind)):
+        raise HTTPException(status_code=500, detail="AI service not configured")
+
+def _require_streaming() -> None:
+    # A provider that only returns whole completions gets no SSE variant
+    if ai_service.configured and not ai_service.streams:
+        raise HTTPException(status_code=404, detail="AI streaming not available")
+
+async def _load_target(target_user_id: str) -> dict:
+    target_user = await db.users.find_one({"user_id": target_user_id, "deleted": {"$ne": True}}, {"_id": 0, "password_hash": 0})
+    if not target_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return target_user
+
+# Background generations share one per-key budget so they can't crowd out users
+BACKGROUND_LLM_KEY = "background"
+
+def _generation_job(spec: AIPrompt) -> Tuple[dict, str]:
+    """Payload and dedupe key of a background generation (one pending job per cache key)"""
+    return asdict(spec), f"ai:{cache_key(spec.kind, spec.inputs)}"
+
+async def _enqueue_generation(spec: AIPrompt) -> None:
+    """Queue a background generation of ``spec``"""
+    payload, dedupe_key = _generation_job(spec)
+    await job_queue.enqueue("ai_generate", payload, dedupe_key=dedupe_key)
+
+async def run_ai_generation(payload: dict) -> None:
+    """Job handler: add one variant to the AI cache unless it is already full"""
+    spec = AIPrompt(**payload)
+    if await ai_cache.variant_count(spec.kind, spec.inputs) >= ai_cache.variants:
+        return
+    async with llm_limiter.slot(BACKGROUND_LLM_KEY):
+        text = await ai_service.complete(spec)
+    await ai_cache.store(spec.kind, spec.inputs, text)
+
+job_queue.register("ai_generate", run_ai_generation)
+
+async def _precompute_match_ai(user: dict, other: dict) -> None:
+    """A new match is when people open chat: generate both sides' analyses and icebreakers now"""
+    if not ai_service.configured:
+        return
+    specs = [
+        prompt(a, b)
+        for a, b in ((user, other), (other, user))
+        for prompt in (compatibility_prompt, icebreaker_prompt)
+    ]
+    try:
+        # One insert for all four: this runs inside the swipe request
+        await job_queue.enqueue_many("ai_generate", [_generation_job(spec) for spec in specs])
+    except Exception:
+        logger.exception("Failed to enqueue AI precomputation for %s/%s", user["user_id"], other["user_id"])
+
+async def _generate_llm(spec: AIPrompt, user_id: str) -> str:
+    """Cached (or precomputed) response for ``spec``, generating within the
+    concurrency limits on a miss; remaining variants are filled in the background"""
+    async def complete() -> str:
+        async with llm_limiter.slot(user_id):
+            return await ai_service.complete(spec)
+
+    return await ai_cache.get_or_generate(
+        spec.kind, spec.inputs, complete,
+        refill=lambda: _enqueue_generation(spec),
+    )
+
+async def _generate(spec: AIPrompt, user_id: str) -> str:
+    """LLM response for ``spec``, or the offline template one if the LLM is
+    unavailable, over budget or out of slots. A generation that loses the race
+    keeps running (it is shielded in the cache's single flight) and is cached."""
+    if not _has_fallback(spec.kind):
+        return await _generate_llm(spec, user_id)
+    offline = OFFLINE_GENERATORS[spec.kind]
+    if not ai_service.configured:
+        return offline(**spec.inputs)
+
+    async def fallback() -> str:
+        return offline(**spec.inputs)
+
+    return await ai_hedge.run(lambda: _generate_llm(spec, user_id), fallback)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream(spec: Optional[AIPrompt], user_id: str, result: Callable[[str], dict], fixed_text: Optional[str] = None) -> StreamingResponse:
+    """Server-Sent Events: ``token`` events as text arrives, then ``done`` with the full result.
+
+    A cached variant (or ``fixed_text``) is sent as a single token. Freshly
+    streamed text is stored in the AI cache once complete. Kinds with an
+    offline generator stream its text instead of failing when the LLM is
+    unconfigured, out of slots, or fails before sending any text; otherwise
+    a failure ends the stream with an ``error`` event.
+    """
+    offline = OFFLINE_GENERATORS[spec.kind] if spec is not None and _has_fallback(spec.kind) else None
+
+    async def events():
+        text = fixed_text
+        if text is None and offline is not None and not ai_service.configured:
+            text = offline(**spec.inputs)
+        if text is None:
+            text = await ai_cache.lookup(spec.kind, spec.inputs, partial=True)
+            if text is not None and await ai_cache.variant_count(spec.kind, spec.inputs) < ai_cache.variants:
+                await _enqueue_generation(spec)
+        if text is not None:
+            yield _sse("token", {"text": text})
+            yield _sse("done", result(text))
+            return
+
+        parts = []
+        detail = None
+        try:
+            async with llm_limiter.slot(user_id):
+                async for token in ai_service.stream(spec):
+                    parts.append(token)
+                    yield _sse("token", {"text": token})
+        except QueueTimeout as e:
+            logger.warning("AI stream shed: %s", e)
+            detail = "AI service busy, try again shortly"
+        except Exception:
+            # The response has already started: report it in the stream, not as a 5xx
+            logger.exception("AI stream failed for %s", spec.kind)
+            detail = "AI service error, try again shortly"
+        text = "".join(parts)
+        if detail is None and not text:
+            logger.warning("AI stream for %s ended without text", spec.kind)
+            detail = "AI service returned nothing, try again shortly"
+        if detail is not None:
+            if offline is None or text:
+                yield _sse("error", {"detail": detail})
+                return
+            text = offline(**spec.inputs)
+            yield _sse("token", {"text": text})
+            yield _sse("done", result(text))
+            return
+        await ai_cache.store(spec.kind, spec.inputs, text)
+        yield _sse("done", result(text))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @api_router.post("/ai/roast")
 async def generate_roast(current_user: dict = Depends(get_current_user)):
     """Generate an AI roast based on user's red flags"""
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    _require_llm("roast")
     
-    api_key = os.environ.get("EMERGENT_LLM_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="AI service not configured")
-    
-    red_flags = current_user.get("red_flags", [])
-    negative_qualities = current_user.get("negative_qualities", [])
-    
-    if not red_flags and not negative_qualities:
-        return {"roast": "You haven't shared any red flags yet. Too perfect or too scared? 🚩"}
+    if not current_user.get("red_flags") and not current_user.get("negative_qualities"):
+        return {"roast": NO_FLAGS_ROAST}
     
-    prompt = f"""You are a witty comedian on a dating app called "Unhinged" where people share their red flags.
-    Generate a short, funny, self-deprecating roast (2-3 sentences) based on these traits:
-    Red Flags: {', '.join(red_flags) if red_flags else 'None shared'}
-    Negative Qualities: {', '.join(negative_qualities) if negative_qualities else 'None shared'}
-    
-    Keep it playful and not mean-spirited. Make it something the person would laugh at and want to share."""
+    response = await _generate(roast_prompt(current_user), current_user["user_id"])
+    return {"roast": response}
+
+@api_router.post("/ai/roast/stream")
+async def stream_roast(current_user: dict = Depends(get_current_user)):
+    """Stream an AI roast as Server-Sent Events"""
+    _require_llm("roast")
+    _require_streaming()
     
-    chat = LlmChat(
-        api_key=api_key,
-        session_id=f"roast_{current_user['user_id']}_{uuid.uuid4().hex[:8]}",
-        system_message="You are a witty, playful comedian who writes self-deprecating roasts."
-    ).with_model("openai", "gpt-4o")
+    if not current_user.get("red_flags") and not current_user.get("negative_qualities"):
+        return _stream(None, current_user["user_id"], lambda text: {"roast": text}, fixed_text=NO_FLAGS_ROAST)
     
-    response = await chat.send_message(UserMessage(text=prompt))
-    return {"roast": response}
+    return _stream(roast_prompt(current_user), current_user["user_id"], lambda text: {"roast": text})
 
 @api_router.post("/ai/analyze-compatibility/{target_user_id}")
 async def analyze_compatibility(target_user_id: str, current_user: dict = Depends(get_current_user)):
     """AI analysis of red flag compatibility between two users"""
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
-    
-    api_key = os.environ.get("EMERGENT_LLM_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="AI service not configured")
-    
-    target_user = await db.users.find_one({"user_id": target_user_id}, {"_id": 0, "password_hash": 0})
-    if not target_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    prompt = f"""You're an AI dating coach on "Unhinged" - a satirical app matching people by red flags.
-    
-    Person A's Red Flags: {', '.join(current_user.get('red_flags', ['None listed']))}
-    Person A's Negative Qualities: {', '.join(current_user.get('negative_qualities', ['None listed']))}
-    
-    Person B's Red Flags: {', '.join(target_user.get('red_flags', ['None listed']))}
-    Person B's Negative Qualities: {', '.join(target_user.get('negative_qualities', ['None listed']))}
-    
-    Generate a funny "compatibility analysis" (3-4 sentences) explaining why their flaws might work together or hilariously clash.
-    Include a made-up "Chaos Compatibility Score" percentage.
-    Keep it playful and entertaining."""
+    _require_llm()
     
-    chat = LlmChat(
-        api_key=api_key,
-        session_id=f"compat_{current_user['user_id']}_{uuid.uuid4().hex[:8]}",
-        system_message="You are a comedic dating analyst who finds humor in human flaws."
-    ).with_model("openai", "gpt-4o")
-    
-    response = await chat.send_message(UserMessage(text=prompt))
+    target_user = await _load_target(target_user_id)
+    response = await _generate(compatibility_prompt(current_user, target_user), current_user["user_id"])
     return {"analysis": response, "target_user": target_user.get("name", "Unknown")}
 
+@api_router.post("/ai/analyze-compatibility/{target_user_id}/stream")
+async def stream_compatibility(target_user_id: str, current_user: dict = Depends(get_current_user)):
+    """Stream an AI compatibility analysis as Server-Sent Events"""
+    _require_llm()
+    _require_streaming()
+    
+    target_user = await _load_target(target_user_id)
+    target_name = target_user.get("name", "Unknown")
+    return _stream(
+        compatibility_prompt(current_user, target_user),
+        current_user["user_id"],
+        lambda text: {"analysis": text, "target_user": target_name},
+    )
+
 @api_router.post("/ai/icebreaker/{target_user_id}")
 async def generate_icebreaker(target_user_id: str, current_user: dict = Depends(get_current_user)):
     """Generate an AI icebreaker message based on both users' red flags"""
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    _require_llm("icebreaker")
     
-    api_key = os.environ.get("EMERGENT_LLM_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="AI service not configured")
-    
-    target_user = await db.users.find_one({"user_id": target_user_id}, {"_id": 0, "password_hash": 0})
-    if not target_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    prompt = f"""Generate a funny, self-aware icebreaker message for a dating app called "Unhinged" where people embrace their flaws.
-    
-    Sender's Red Flags: {', '.join(current_user.get('red_flags', ['mysterious']))}
-    Recipient's Red Flags: {', '.join(target_user.get('red_flags', ['mysterious']))}
-    Recipient's Name: {target_user.get('name', 'there')}
-    
-    Create ONE short, witty opening message that acknowledges their shared chaos.
-    Keep it under 2 sentences. Make it memorable and conversation-starting."""
-    
-    chat = LlmChat(
-        api_key=api_key,
-        session_id=f"ice_{current_user['user_id']}_{uuid.uuid4().hex[:8]}",
-        system_message="You write clever, self-deprecating icebreaker messages."
-    ).with_model("openai", "gpt-4o")
-    
-    response = await chat.send_message(UserMessage(text=prompt))
+    target_user = await _load_target(target_user_id)
+    response = await _generate(icebreaker_prompt(current_user, target_user), current_user["user_id"])
     return {"icebreaker": response}
 
+@api_router.post("/ai/icebreaker/{target_user_id}/stream")
+async def stream_icebreaker(target_user_id: str, current_user: dict = Depends(get_current_user)):
+    """Stream an AI icebreaker as Server-Sent Events"""
+    _require_llm("icebreaker")
+    _require_streaming()
+    
+    target_user = await _load_target(target_user_id)
+    return _stream(
+        icebreaker_prompt(current_user, target_user),
+        current_user["user_id"],
+        lambda text: {"icebreaker": text},
+    )
+
+@api_router.get("/admin/stats", dependencies=[Depends(require_admin)])
+async def admin_stats():
+    """Cache effectiveness counters for this worker"""
+    return {
+        "ai_cache": ai_cache.stats(),
+        "llm": ai_service.stats(),
+        "llm_limiter": llm_limiter.stats(),
+        "ai_fallback": {"mode": AI_FALLBACK, **(ai_hedge.stats() if ai_hedge else {})},
+        "jobs": await job_queue.stats(),
+        "oauth": _session_exchange.stats() if _session_exchange else {"loaded": False},
+        "mongo_pool": mongo_pool_metrics.stats(),
+        "login_throttle": login_throttle.stats(),
+        "admission": admission.stats(),
+        "cache": cache.stats(),
+        "change_streams": change_consumer.stats(),
+        "maintenance": maintenance.stats(),
+        "conditional_get": ETAG_STATS,
+    }
+
+class SlowLogUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    request_threshold_seconds: Optional[float] = Field(None, ge=0)
+    query_threshold_seconds: Optional[float] = Field(None, ge=0)
+    profile_sample_rate: Optional[float] = Field(None, ge=0, le=1)
+
+@api_router.get("/admin/slow-log", dependencies=[Depends(require_admin)])
+async def get_slow_log():
+    """Slow log settings and the most recent slow requests/queries on this worker"""
+    return slow_log_state()
+
+@api_router.put("/admin/slow-log", dependencies=[Depends(require_admin)])
+async def update_slow_log(update: SlowLogUpdate):
+    """Change slow log thresholds or profiling at runtime (this worker only)"""
+    configure_slow_log(**update.model_dump(exclude_none=True))
+    return slow_log_state()["config"]
+
 # ==================== UTILITY ROUTES ====================
 
+# Constant bodies, serialized once and cacheable by clients and proxies
+# The suggestion lists live with their offline roast riffs (offline_ai.py)
+RED_FLAG_SUGGESTIONS = PrecomputedJSON({
+    "red_flags": list(RED_FLAG_RIFFS),
+    "negative_qualities": list(NEGATIVE_QUALITY_RIFFS),
+})
+
+PROMPT_SUGGESTIONS = PrecomputedJSON({
+    "prompts": [
+        {"id": "worst_trait", "question": "My most toxic trait is..."},
+        {"id": "dealbreaker", "question": "I'll immediately lose interest if you..."},
+        {"id": "embarrassing", "question": "My most embarrassing moment was..."},
+        {"id": "guilty_pleasure", "question": "My guilty pleasure is..."},
+        {"id": "hot_take", "question": "My hottest take is..."},
+        {"id": "red_flag_excuse", "question": "I justify my red flags by saying..."},
+        {"id": "worst_date", "question": "My worst date story involves..."},
+        {"id": "3am_thought", "question": "At 3am, I'm usually..."},
+        {"id": "dealmaker", "question": "I'm a walking red flag but at least I..."},
+        {"id": "self_aware", "question": "I know I'm problematic because..."}
+    ]
+})
+
 @api_router.get("/red-flags/suggestions")
-async def get_red_flag_suggestions():
+async def get_red_flag_suggestions(request: Request):
     """Get suggested red flags for profile creation"""
-    return {
-        "red_flags": [
-            "I reply to texts 3 days later",
-            "My ex is still my best friend",
-            "I have a mattress on the floor",
-            "I say 'we should do this again' and never follow up",
-            "I've never watched The Office",
-            "I double text... a lot",
-            "My Spotify Wrapped was embarrassing",
-            "I still use Internet Explorer",
-            "I put milk before cereal",
-            "I think astrology is real",
-            "I'm a reply guy on Twitter",
-            "I use the word 'vibes' unironically",
-            "I own multiple swords",
-            "My love language is leaving people on read",
-            "I have 47 unread books"
-        ],
-        "negative_qualities": [
-            "Chronically late to everything",
-            "Can't cook anything besides cereal",
-            "Talks to plants more than people",
-            "Has strong opinions about fonts",
-            "Cries at commercials",
-            "Still uses 'XD' in texts",
-            "Finishes other people's sentences wrong",
-            "Gives unsolicited advice",
-            "Can't keep a plant alive",
-            "Still quotes Vine in 2024",
-            "Thinks pineapple belongs on pizza",
-            "Has a finsta with 3 followers",
-            "Watches movies on 1.5x speed",
-            "Leaves cabinet doors open",
-            "Over-explains simple things"
-        ]
-    }
+    return RED_FLAG_SUGGESTIONS.respond(request)
 
 @api_router.get("/prompts/suggestions")
-async def get_prompt_suggestions():
+async def get_prompt_suggestions(request: Request):
     """Get prompt suggestions for profile"""
-    return {
-        "prompts": [
-            {"id": "worst_trait", "question": "My most toxic trait is..."},
-            {"id": "dealbreaker", "question": "I'll immediately lose interest if you..."},
-            {"id": "embarrassing", "question": "My most embarrassing moment was..."},
-            {"id": "guilty_pleasure", "question": "My guilty pleasure is..."},
-            {"id": "hot_take", "question": "My hottest take is..."},
-            {"id": "red_flag_excuse", "question": "I justify my red flags by saying..."},
-            {"id": "worst_date", "question": "My worst date story involves..."},
-            {"id": "3am_thought", "question": "At 3am, I'm usually..."},
-            {"id": "dealmaker", "question": "I'm a walking red flag but at least I..."},
-            {"id": "self_aware", "question": "I know I'm problematic because..."}
-        ]
-    }
+    return PROMPT_SUGGESTIONS.respond(request)
+
+@api_router.get("/health/ready")
+async def health_ready():
+    """503 until warm-up has finished (and again while shutting down), so a
+    load balancer only routes to warm workers"""
+    return FastJSONResponse(readiness.stats(), status_code=200 if readiness.ready else 503)
 
 @api_router.get("/")
 async def root():
@@ -1037,6 +1594,36 @@ async def root():
 # Include the router
 app.include_router(api_router)
 
+app.middleware("http")(conditional_get_middleware)
+app.middleware("http")(slow_log_middleware)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+# Outermost, so it times everything below it
+app.middleware("http")(metrics_middleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition for this worker (not under /api, so the
+    public ingress does not route it)"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.exception_handler(QueueTimeout)
+async def ai_queue_timeout_handler(request: Request, exc: QueueTimeout):
+    logger.warning("AI request shed: %s", exc)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "AI service busy, try again shortly"},
+        headers={"Retry-After": "5"},
+    )
+
+@app.exception_handler(Throttled)
+async def login_throttled_handler(request: Request, exc: Throttled):
+    logger.warning("Login throttled (%s): %s", exc.scope, exc)
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many login attempts, try again later"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1044,7 +1631,3 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -0,0 +1,238 @@
+"""Slow request / slow query log with sampled stack profiles.
+
+``slow_log_middleware`` gives each request a ``RequestProfile``; the
+``SlowQueryListener`` (a pymongo command listener on the Motor client) adds
+every Mongo round trip to it. When a request takes longer than
+``request_threshold_seconds`` a structured entry (route, status, duration,
+Mongo round trips and time per command) is logged as JSON on the
+``slow_log`` logger and kept in memory for ``GET /api/admin/slow-log``.
+Single commands over ``query_threshold_seconds`` get their own entry.
+
+With ``profile_sample_rate`` > 0, that fraction of requests also runs a
+``StackSampler`` on the event loop thread; if the request turns out slow the
+samples are written in folded-stack format (``flamegraph.pl`` /
+speedscope input) under ``profile_dir``. The loop thread is shared, so a
+profile also contains whatever else the loop ran meanwhile.
+
+Settings can be changed at runtime through ``PUT /api/admin/slow-log``.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from pymongo import monitoring
+
+from metrics import current_route
+
+logger = logging.getLogger("slow_log")
+
+
+@dataclass
+class SlowLogConfig:
+    enabled: bool = True
+    request_threshold_seconds: float = 1.0
+    query_threshold_seconds: float = 0.1
+    profile_sample_rate: float = 0.0
+    profile_interval_seconds: float = 0.005
+    profile_dir: str = "/tmp/unhinged-profiles"
+
+    @classmethod
+    def from_env(cls) -> "SlowLogConfig":
+        return cls(
+            enabled=os.environ.get("SLOW_LOG_ENABLED", "true").lower() == "true",
+            request_threshold_seconds=float(os.environ.get("SLOW_REQUEST_SECONDS", "1.0")),
+            query_threshold_seconds=float(os.environ.get("SLOW_QUERY_SECONDS", "0.1")),
+            profile_sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+            profile_dir=os.environ.get("PROFILE_DIR", "/tmp/unhinged-profiles"),
+        )
+
+
+@dataclass
+class RequestProfile:
+    mongo_calls: int = 0
+    mongo_seconds: float = 0.0
+    # "collection.command" -> [calls, seconds]
+    commands: Dict[str, List[float]] = field(default_factory=dict)
+
+    def add(self, name: str, seconds: float) -> None:
+        with _profile_lock:
+            self.mongo_calls += 1
+            self.mongo_seconds += seconds
+            entry = self.commands.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+
+_profile_lock = threading.Lock()
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+config = SlowLogConfig.from_env()
+recent: Deque[Dict[str, Any]] = deque(maxlen=200)
+
+
+def _emit(entry: Dict[str, Any]) -> None:
+    entry = {"at": datetime.now(timezone.utc).isoformat(), **entry}
+    recent.append(entry)
+    logger.warning(json.dumps(entry, default=str))
+
+
+def configure_slow_log(**changes: Any) -> SlowLogConfig:
+    for key, value in changes.items():
+        if not hasattr(config, key):
+            raise AttributeError(key)
+        setattr(config, key, value)
+    return config
+
+
+def slow_log_state() -> Dict[str, Any]:
+    return {"config": asdict(config), "recent": list(recent)}
+
+
+# ==================== MONGO ====================
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Adds each command to the request's profile and logs slow ones."""
+
+    def __init__(self):
+        # request_id -> (profile, name, filter keys, route)
+        self._pending: Dict[int, tuple] = {}
+
+    def started(self, event) -> None:
+        if not config.enabled:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        name = f"{collection}.{event.command_name}" if isinstance(collection, str) else event.command_name
+        query = event.command.get("filter") or event.command.get("query") or {}
+        shape = sorted(query) if isinstance(query, dict) else []
+        self._pending[event.request_id] = (current_profile.get(), name, shape, current_route.get())
+
+    def succeeded(self, event) -> None:
+        self._finish(event)
+
+    def failed(self, event) -> None:
+        self._finish(event)
+
+    def _finish(self, event) -> None:
+        pending = self._pending.pop(event.request_id, None)
+        if pending is None:
+            return
+        profile, name, shape, route = pending
+        seconds = event.duration_micros / 1e6
+        if profile is not None:
+            profile.add(name, seconds)
+        if seconds >= config.query_threshold_seconds:
+            _emit({"type": "slow_query", "route": route, "command": name, "filter_keys": shape, "seconds": round(seconds, 4)})
+
+
+# ==================== PROFILING ====================
+
+class StackSampler:
+    """Samples one thread's Python stack every ``interval`` seconds from a
+    background thread, counting folded stacks (root;...;leaf)."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+_sampling = threading.Lock()  # one profile at a time
+
+
+def _profile_path(route: str) -> str:
+    os.makedirs(config.profile_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    return os.path.join(config.profile_dir, f"{stamp}-{route}.folded")
+
+
+def _finish_sampling(sampler: StackSampler, route: Optional[str]) -> Optional[str]:
+    """Stop ``sampler`` and, for a ``route`` that was slow, write its profile.
+
+    Joins a thread and writes a file, so it runs off the event loop.
+    """
+    sampler.stop()
+    if route is None or not sampler.samples:
+        return None
+    path = _profile_path(route)
+    sampler.write(path)
+    return path
+
+
+# ==================== MIDDLEWARE ====================
+
+async def slow_log_middleware(request, call_next):
+    if not config.enabled:
+        return await call_next(request)
+    profile = RequestProfile()
+    token = current_profile.set(profile)
+    sampler = None
+    if config.profile_sample_rate and random.random() < config.profile_sample_rate and _sampling.acquire(blocking=False):
+        sampler = StackSampler(threading.get_ident(), config.profile_interval_seconds).start()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        current_profile.reset(token)
+        profile_file = None
+        if sampler is not None:
+            slow_route = current_route.get() if elapsed >= config.request_threshold_seconds else None
+            try:
+                profile_file = await asyncio.to_thread(_finish_sampling, sampler, slow_route)
+            finally:
+                _sampling.release()
+        if elapsed >= config.request_threshold_seconds:
+            _emit({
+                "type": "slow_request",
+                "route": current_route.get(),
+                "method": request.method,
+                "path": request.url.path,
+                "status": status,
+                "seconds": round(elapsed, 4),
+                "mongo_calls": profile.mongo_calls,
+                "mongo_seconds": round(profile.mongo_seconds, 4),
+                "commands": {k: {"calls": c, "seconds": round(s, 4)} for k, (c, s) in profile.commands.items()},
+                "profile": profile_file,
+            })
@@ -0,0 +1,116 @@
+"""Token-bucket throttling for login attempts.
+
+Every ``/api/auth/login`` attempt costs a bcrypt check, so it takes a token
+from a per-IP and a per-email bucket first; an empty bucket rejects the
+attempt with 429 before any hashing happens.
+
+Bucket state lives behind ``BucketStore``. ``MemoryBucketStore`` keeps it per
+worker in a bounded LRU; a shared backend (so all workers see one budget)
+only has to implement ``take``.
+"""
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request
+
+
+class Throttled(Exception):
+    """Raised when a bucket has no token for this attempt."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Too many attempts for this {scope}, retry in {retry_after:.0f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class BucketStore:
+    """Interface: atomically refill and take from the bucket at ``key``."""
+
+    async def take(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Returns (allowed, seconds until ``cost`` tokens are available)."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryBucketStore(BucketStore):
+    """Buckets in this process, at most ``max_keys`` of them (least recently
+    used are dropped first; those have usually refilled anyway)."""
+
+    def __init__(self, max_keys: int = 100_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [tokens, updated]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.evictions = 0
+
+    async def take(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_second)
+            bucket[1] = now
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return True, 0.0
+        return False, (cost - bucket[0]) / refill_per_second
+
+    def stats(self) -> Dict[str, Any]:
+        # Key strings, the bucket lists and their floats, plus the dict's own table
+        approx = sys.getsizeof(self._buckets) + sum(
+            sys.getsizeof(k) + sys.getsizeof(b) + 2 * sys.getsizeof(0.0) for k, b in self._buckets.items()
+        )
+        return {"keys": len(self._buckets), "max_keys": self.max_keys, "evictions": self.evictions, "approx_bytes": approx}
+
+
+def client_ip(request: Request, trusted_proxy_hops: int = 0) -> str:
+    """The caller's address; behind ``trusted_proxy_hops`` proxies, the
+    X-Forwarded-For entry the outermost trusted proxy appended."""
+    if trusted_proxy_hops:
+        forwarded = [h.strip() for h in request.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+        if len(forwarded) >= trusted_proxy_hops:
+            return forwarded[-trusted_proxy_hops]
+    return request.client.host if request.client else "unknown"
+
+
+class LoginThrottle:
+    """Per-IP and per-email buckets: ``burst`` attempts at once, refilled at
+    ``per_minute``."""
+
+    def __init__(
+        self,
+        store: Optional[BucketStore] = None,
+        ip_burst: float = 20,
+        ip_per_minute: float = 20,
+        email_burst: float = 5,
+        email_per_minute: float = 1,
+    ):
+        self.store = store or MemoryBucketStore()
+        self.limits = {
+            "ip": (ip_burst, ip_per_minute / 60),
+            "email": (email_burst, email_per_minute / 60),
+        }
+        self.allowed = 0
+        self.rejected = {"ip": 0, "email": 0}
+
+    async def check(self, ip: str, email: str) -> None:
+        """Take one attempt from both buckets or raise ``Throttled``."""
+        for scope, value in (("ip", ip), ("email", email.strip().lower())):
+            capacity, rate = self.limits[scope]
+            ok, retry_after = await self.store.take(f"login:{scope}:{value}", capacity, rate)
+            if not ok:
+                self.rejected[scope] += 1
+                raise Throttled(scope, retry_after)
+        self.allowed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"allowed": self.allowed, "rejected": dict(self.rejected), "store": self.store.stats()}
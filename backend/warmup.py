@@ -0,0 +1,63 @@
+"""Startup warm-up and readiness.
+
+The lifespan handler runs each warm-up step through ``Readiness.step`` before
+the worker accepts traffic, so the first requests after a deploy don't pay
+for connection setup, lazy imports or cold caches. ``GET /api/health/ready``
+reports the result: 503 while starting or draining, 200 once every required
+step has finished. A failing optional step (e.g. the LLM provider) is
+recorded and logged but doesn't keep the worker out of rotation; a failing
+required step aborts startup.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STARTING = "starting"
+READY = "ready"
+DRAINING = "draining"
+
+
+class Readiness:
+    def __init__(self):
+        self.state = STARTING
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._started = time.perf_counter()
+        self.startup_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    async def step(self, name: str, fn: Callable[[], Awaitable[Any]], required: bool = True, timeout: Optional[float] = None) -> None:
+        """Run one warm-up step and record how long it took."""
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(fn(), timeout)
+        except Exception as exc:
+            self.steps[name] = {"ok": False, "seconds": round(time.perf_counter() - started, 4), "error": repr(exc)}
+            if required:
+                logger.error("Warm-up step %s failed: %r", name, exc)
+                raise
+            logger.warning("Optional warm-up step %s failed: %r", name, exc)
+            return
+        self.steps[name] = {"ok": True, "seconds": round(time.perf_counter() - started, 4)}
+
+    def mark_ready(self) -> None:
+        self.state = READY
+        self.startup_seconds = round(time.perf_counter() - self._started, 4)
+        logger.info("Worker ready after %.2fs: %s", self.startup_seconds, {k: v["seconds"] for k, v in self.steps.items()})
+
+    def mark_draining(self) -> None:
+        self.state = DRAINING
+
+    def stats(self) -> Dict[str, Any]:
+        return {"status": self.state, "startup_seconds": self.startup_seconds, "steps": self.steps}
+
+
+async def open_pool(client, connections: int = 1) -> None:
+    """Ping the deployment over ``connections`` concurrent checkouts, so that
+    many pooled connections (handshake, auth, TLS) exist before traffic."""
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(1, connections))))
@@ -0,0 +1,11 @@
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py reads these at import time; the Motor client connects lazily
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "unhinged_test")
+os.environ.setdefault("JWT_SECRET", "test-secret")
@@ -0,0 +1,144 @@
+import asyncio
+
+import httpx
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import account_deletion  # noqa: E402
+import server  # noqa: E402
+from account_deletion import request_deletion, run_deletion  # noqa: E402
+from ai_cache import AIResponseCache  # noqa: E402
+from job_queue import JobQueue  # noqa: E402
+
+MATCHES = 2500
+
+
+async def _seed(db, user_id="heavy", matches=MATCHES, messages_per_match=2):
+    await db.users.insert_one({"user_id": user_id, "email": f"{user_id}@example.com", "name": user_id, "is_active": True})
+    await db.users.insert_one({"user_id": "bystander", "email": "b@example.com", "name": "b", "is_active": True})
+    await db.matches.insert_many([
+        {"match_id": f"m{i}", "user1_id": user_id if i % 2 else f"other{i}", "user2_id": f"other{i}" if i % 2 else user_id}
+        for i in range(matches)
+    ] + [{"match_id": "keep", "user1_id": "bystander", "user2_id": "other1"}])
+    await db.messages.insert_many([
+        {"message_id": f"msg{i}_{j}", "match_id": f"m{i}", "content": "hi"}
+        for i in range(matches) for j in range(messages_per_match)
+    ] + [{"message_id": "keep", "match_id": "keep", "content": "hi"}])
+    await db.swipes.insert_many(
+        [{"swiper_id": user_id, "target_id": f"other{i}", "action": "like"} for i in range(matches)]
+        + [{"swiper_id": f"other{i}", "target_id": user_id, "action": "like"} for i in range(matches)]
+        + [{"swiper_id": "bystander", "target_id": "other1", "action": "like"}]
+    )
+    await db.user_sessions.insert_one({"user_id": user_id, "session_token": "s1"})
+
+
+def test_deletes_every_thread_for_users_with_thousands_of_matches():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        await _seed(db)
+        await request_deletion(db, "heavy")
+        assert (await db.users.find_one({"user_id": "heavy"}))["deleted"] is True
+
+        await run_deletion(db, "heavy", batch_size=500)
+
+        assert await db.users.count_documents({"user_id": "heavy"}) == 0
+        assert await db.matches.count_documents({}) == 1
+        assert await db.messages.count_documents({}) == 1
+        assert await db.swipes.count_documents({}) == 1
+        assert await db.user_sessions.count_documents({}) == 0
+        progress = await db.account_deletions.find_one({"user_id": "heavy"}, {"_id": 0})
+        assert progress["status"] == "done" and progress["phase"] == "user"
+        assert progress["deleted"] == {
+            "messages": MATCHES * 2, "matches": MATCHES, "swipes": MATCHES * 2, "sessions": 1, "user": 1,
+        }
+
+    asyncio.run(run())
+
+
+def test_interrupted_deletion_resumes_where_it_stopped(monkeypatch):
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        await _seed(db, matches=1200)
+        await request_deletion(db, "heavy")
+
+        # Die after the first batch of swipes
+        real_delete_batch = account_deletion._delete_batch
+        swipe_batches = 0
+
+        async def flaky_delete_batch(collection, query, batch_size):
+            nonlocal swipe_batches
+            if collection.name == "swipes":
+                swipe_batches += 1
+                if swipe_batches == 2:
+                    raise ConnectionError("primary stepped down")
+            return await real_delete_batch(collection, query, batch_size)
+
+        monkeypatch.setattr(account_deletion, "_delete_batch", flaky_delete_batch)
+        with pytest.raises(ConnectionError):
+            await run_deletion(db, "heavy", batch_size=500)
+        progress = await db.account_deletions.find_one({"user_id": "heavy"})
+        assert (progress["status"], progress["phase"]) == ("running", "swipes")
+        assert progress["deleted"]["matches"] == 1200
+        assert progress["deleted"]["swipes"] == 500
+
+        monkeypatch.undo()
+        await run_deletion(db, "heavy", batch_size=500)
+        progress = await db.account_deletions.find_one({"user_id": "heavy"})
+        assert progress["status"] == "done"
+        assert progress["deleted"]["swipes"] == 2400
+        assert await db.swipes.count_documents({}) == 1
+
+    asyncio.run(run())
+
+
+def test_delete_endpoint_signs_out_and_reports_progress(monkeypatch):
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        monkeypatch.setattr(server, "db", db)
+        monkeypatch.setattr(server, "job_queue", JobQueue(db.jobs))
+        monkeypatch.setattr(server, "ai_cache", AIResponseCache(db.ai_cache))
+        server.job_queue.register("account_deletion", server.run_account_deletion)
+        await _seed(db, matches=50)
+        headers = {"Authorization": f"Bearer {server.create_jwt_token('heavy', 'heavy@example.com')}"}
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.get("/api/users/me/deletion-status", headers=headers)).status_code == 404
+
+            response = await client.delete("/api/users/me", headers=headers)
+            assert response.status_code == 202
+            assert response.json() == {"success": True, "status": "pending"}
+            assert (await client.get("/api/auth/me", headers=headers)).status_code == 401
+            assert (await client.get("/api/users/me/deletion-status", headers=headers)).json()["status"] == "pending"
+
+            assert await server.job_queue.run_once()
+            status = (await client.get("/api/users/me/deletion-status", headers=headers)).json()
+            assert status["status"] == "done"
+            assert status["deleted"]["matches"] == 50
+
+    asyncio.run(run())
+
+
+def test_a_deletion_the_queue_gives_up_on_is_reported_as_failed(monkeypatch):
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        monkeypatch.setattr(server, "db", db)
+        monkeypatch.setattr(server, "job_queue", JobQueue(db.jobs, max_attempts=1))
+        server.job_queue.register("account_deletion", server.run_account_deletion, on_failure=server.fail_account_deletion)
+        await _seed(db, matches=5)
+
+        async def broken_delete_batch(collection, query, batch_size):
+            raise ConnectionError("primary stepped down")
+
+        monkeypatch.setattr(account_deletion, "_delete_batch", broken_delete_batch)
+        await request_deletion(db, "heavy")
+        await server.job_queue.enqueue("account_deletion", {"user_id": "heavy"})
+        assert await server.job_queue.run_once()
+
+        progress = await db.account_deletions.find_one({"user_id": "heavy"})
+        assert progress["status"] == "failed"
+        assert "primary stepped down" in progress["error"]
+        assert progress["finished_at"] is not None
+
+    asyncio.run(run())
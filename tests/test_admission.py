@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+import metrics
+from admission import AdmissionClass, AdmissionController, AdmissionGate, AdmissionMiddleware, Shed
+
+
+def test_gate_sheds_on_full_queue_and_on_deadline():
+    async def run():
+        gate = AdmissionGate(AdmissionClass("t_gate", max_concurrency=1, max_queue=1, deadline=0.05))
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Shed) as full:
+            await gate.acquire()
+        assert full.value.reason == "queue_full"
+        with pytest.raises(Shed) as late:
+            await waiter
+        assert late.value.reason == "deadline"
+        assert gate.stats()["shed"] == {"queue_full": 1, "deadline": 1}
+        assert gate.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_gate_hands_slots_over_in_order():
+    async def run():
+        gate = AdmissionGate(AdmissionClass("t_order", max_concurrency=1, max_queue=10, deadline=1.0))
+        await gate.acquire()
+        order = []
+
+        async def worker(i):
+            await gate.acquire()
+            order.append(i)
+            gate.release()
+
+        tasks = [asyncio.create_task(worker(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2]
+        assert gate.active == 0
+
+    asyncio.run(run())
+
+
+def _app(controller):
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/api/ai/slow")
+    async def slow():
+        await release.wait()
+        return {"ok": True}
+
+    @app.get("/api/swipe")
+    async def swipe():
+        return {"ok": True}
+
+    @app.get("/api/ai/stream")
+    async def stream():
+        async def body():
+            yield b"a"
+            await release.wait()
+            yield b"b"
+        return StreamingResponse(body())
+
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    return app, release
+
+
+def test_overloaded_class_is_shed_without_blocking_other_classes():
+    controller = AdmissionController(
+        [
+            AdmissionClass("t_ai", max_concurrency=1, max_queue=0, deadline=0.1, retry_after=5),
+            AdmissionClass("t_interactive", max_concurrency=4, max_queue=4, deadline=1.0),
+        ],
+        routes=[("/api/ai/", "t_ai")],
+        default="t_interactive",
+    )
+
+    async def run():
+        app, release = _app(controller)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            slow = asyncio.create_task(http.get("/api/ai/slow"))
+            await asyncio.sleep(0.05)
+            shed = await http.get("/api/ai/slow")
+            assert shed.status_code == 503
+            assert shed.headers["Retry-After"] == "5"
+            assert (await http.get("/api/swipe")).status_code == 200
+            release.set()
+            assert (await slow).status_code == 200
+        assert metrics.ADMISSION_SHED.value(**{"class": "t_ai", "reason": "queue_full"}) == 1
+        assert controller.gates["t_ai"].active == 0
+
+    asyncio.run(run())
+
+
+def test_streaming_response_holds_its_slot_until_the_body_ends():
+    controller = AdmissionController(
+        [AdmissionClass("t_stream", max_concurrency=1, max_queue=0, deadline=0.1)],
+        routes=[],
+        default="t_stream",
+    )
+
+    async def run():
+        app, release = _app(controller)
+        # ASGITransport buffers the body, so the request completes only once the stream ends
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            request = asyncio.create_task(http.get("/api/ai/stream"))
+            await asyncio.sleep(0.05)
+            assert controller.gates["t_stream"].active == 1
+            assert (await http.get("/api/ai/stream")).status_code == 503
+            release.set()
+            assert (await request).content == b"ab"
+        assert controller.gates["t_stream"].active == 0
+
+    asyncio.run(run())
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from ai_cache import AIResponseCache, cache_key
+from llm import StubLLMProvider
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def _cache(**kwargs):
+    return AIResponseCache(mongomock_motor.AsyncMongoMockClient()["test"].ai_cache, **kwargs)
+
+
+def test_cache_key_normalizes_inputs():
+    a = cache_key("roast", {"red_flags": ["I own multiple swords", "I double text... a lot"]})
+    b = cache_key("roast", {"red_flags": ["i double  text... a lot", " I own multiple SWORDS"]})
+    assert a == b
+    assert a != cache_key("icebreaker", {"red_flags": ["I own multiple swords", "I double text... a lot"]})
+
+
+def test_fills_variants_then_serves_hits():
+    async def run():
+        cache = _cache(variants=2)
+        llm = StubLLMProvider()
+        inputs = {"red_flags": ["I think astrology is real"]}
+
+        def generate():
+            return llm.complete("system", "prompt", session_id="s")
+
+        served = [await cache.get_or_generate("roast", inputs, generate) for _ in range(6)]
+        assert llm.calls == 2
+        assert set(served) == set(served[:2])
+        assert cache.stats()["hits"] == 4
+        assert cache.stats()["hit_rate"] == round(4 / 6, 4)
+
+        # Another worker (empty memory tier) reads the written-through entry
+        other = AIResponseCache(cache.collection, variants=2)
+        assert await other.get_or_generate("roast", inputs, generate) in served
+        assert llm.calls == 2
+
+    asyncio.run(run())
+
+
+def test_changed_inputs_get_a_new_entry_and_leave_the_old_one_shared():
+    async def run():
+        cache = _cache(variants=1)
+        llm = StubLLMProvider()
+
+        def generate():
+            return llm.complete("system", "prompt", session_id="s")
+
+        before = await cache.get_or_generate("roast", {"red_flags": ["z"]}, generate)
+        # One user edits their flags; another still has the old ones
+        await cache.get_or_generate("roast", {"red_flags": ["z", "new"]}, generate)
+        assert await cache.get_or_generate("roast", {"red_flags": ["z"]}, generate) == before
+        assert llm.calls == 2
+
+    asyncio.run(run())
+
+
+def test_lru_eviction_is_bounded():
+    async def run():
+        cache = _cache(max_entries=2, variants=1)
+        for i in range(5):
+            await cache.store("roast", {"i": i}, f"text {i}")
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["evictions"] == 3
+
+    asyncio.run(run())
+
+
+def test_refill_serves_partial_entries_and_fills_in_background():
+    async def run():
+        cache = _cache(variants=3)
+        llm = StubLLMProvider()
+        inputs = {"red_flags": ["I own multiple swords"]}
+        refills = []
+
+        def generate():
+            return llm.complete("system", "prompt", session_id="s")
+
+        async def refill():
+            refills.append(1)
+
+        # A precomputed variant (e.g. from a background job) is served as-is
+        await cache.store("icebreaker", inputs, "precomputed")
+        for _ in range(3):
+            assert await cache.get_or_generate("icebreaker", inputs, generate, refill=refill) == "precomputed"
+        assert llm.calls == 0
+        assert len(refills) == 3
+
+    asyncio.run(run())
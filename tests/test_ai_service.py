@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from ai_service import AIService, PromptTemplate, icebreaker_prompt, roast_prompt
+from llm import StubLLMProvider
+
+
+def test_prompt_template_checks_fields():
+    template = PromptTemplate("system", "Flags: {red_flags} / {negative_qualities}")
+    assert template.fields == {"red_flags", "negative_qualities"}
+    assert template.render(red_flags="a", negative_qualities="b") == "Flags: a / b"
+    with pytest.raises(KeyError):
+        template.render(red_flags="a")
+
+
+def test_prompt_builders_fill_defaults():
+    spec = roast_prompt({"user_id": "u1"})
+    assert spec.kind == "roast"
+    assert "Red Flags: None shared" in spec.prompt
+
+    spec = icebreaker_prompt({"user_id": "u1", "red_flags": ["texts back in 3 days"]}, {"user_id": "u2"})
+    assert "Recipient's Name: there" in spec.prompt
+    assert spec.inputs["sender_red_flags"] == ["texts back in 3 days"]
+
+
+def test_service_times_calls_per_kind():
+    async def run():
+        service = AIService(StubLLMProvider())
+        await service.start()
+        spec = roast_prompt({"user_id": "u1", "red_flags": ["ghosts"]})
+        assert await service.complete(spec)
+        tokens = [t async for t in service.stream(spec)]
+        assert tokens
+        await service.close()
+        return service.stats()
+
+    stats = asyncio.run(run())
+    assert stats["provider"] == "stub" and stats["started"] is False
+    roast = stats["calls"]["roast"]
+    assert roast["calls"] == 2 and roast["errors"] == 0
+    assert roast["first_token_seconds_avg"] is not None
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import sys
+import time
+import types
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server  # noqa: E402
+from ai_cache import AIResponseCache  # noqa: E402
+from ai_service import AIService  # noqa: E402
+from concurrency import Hedge  # noqa: E402
+from llm import EmergentLLMProvider, LLMProvider, StubLLMProvider  # noqa: E402
+
+TOKEN_DELAY = 0.02
+
+
+class CountingStub(StubLLMProvider):
+    """Counts the tokens the model has produced so far."""
+
+    def __init__(self, token_delay=0.0):
+        super().__init__(token_delay)
+        self.produced = 0
+
+    async def complete(self, system_message, prompt, session_id):
+        text = await super().complete(system_message, prompt, session_id)
+        self.produced += len(text.split(" "))
+        return text
+
+    async def stream(self, system_message, prompt, session_id):
+        async for token in super().stream(system_message, prompt, session_id):
+            self.produced += 1
+            yield token
+
+
+class FailingStub(StubLLMProvider):
+    """Raises like an upstream 5xx after ``fail_after`` tokens."""
+
+    def __init__(self, fail_after):
+        super().__init__()
+        self.fail_after = fail_after
+
+    async def stream(self, system_message, prompt, session_id):
+        sent = 0
+        async for token in super().stream(system_message, prompt, session_id):
+            if sent == self.fail_after:
+                raise RuntimeError("upstream returned 500")
+            sent += 1
+            yield token
+
+
+class WholeCompletions(LLMProvider):
+    name = "whole"
+
+    async def complete(self, system_message, prompt, session_id):
+        return "all at once"
+
+
+@pytest.fixture
+def app_env(monkeypatch):
+    db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+    llm = CountingStub(token_delay=TOKEN_DELAY)
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "ai_service", AIService(llm))
+    monkeypatch.setattr(server, "ai_cache", AIResponseCache(db.ai_cache, variants=1))
+    return db, llm
+
+
+async def _call(method, path, token):
+    """Drive the ASGI app directly, noting how many tokens the model had
+    produced when each body chunk was sent."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "server": ("test", 80), "client": ("test", 1),
+        "headers": [(b"host", b"test"), (b"authorization", f"Bearer {token}".encode())],
+    }
+    received = False
+    start = time.perf_counter()
+    chunks = []
+    status = {}
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            chunks.append((getattr(server.ai_service.provider, "produced", None), message["body"]))
+
+    await server.app(scope, receive, send)
+    return status["code"], chunks, time.perf_counter() - start
+
+
+def _events(chunks):
+    events = []
+    for block in b"".join(c for _, c in chunks).decode().strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+async def _user(db, user_id, red_flags):
+    await db.users.insert_one({"user_id": user_id, "email": f"{user_id}@example.com", "name": user_id, "red_flags": red_flags})
+    return server.create_jwt_token(user_id, f"{user_id}@example.com")
+
+
+def test_roast_streams_tokens_then_serves_cached_text(app_env):
+    db, llm = app_env
+
+    async def run():
+        token = await _user(db, "user_a", ["I own multiple swords"])
+        code, chunks, _ = await _call("POST", "/api/ai/roast/stream", token)
+        assert code == 200
+        events = _events(chunks)
+        assert [e for e, _ in events[:-1]] == ["token"] * (len(events) - 1)
+        streamed = "".join(d["text"] for _, d in events[:-1])
+        assert events[-1] == ("done", {"roast": streamed})
+
+        # The finished text was stored: the next call is a single cached token
+        code, chunks, _ = await _call("POST", "/api/ai/roast/stream", token)
+        assert _events(chunks) == [("token", {"text": streamed}), ("done", {"roast": streamed})]
+        assert llm.calls == 1
+
+    asyncio.run(run())
+
+
+def test_streaming_sends_the_first_token_before_the_rest_is_generated(app_env):
+    db, llm = app_env
+
+    async def run():
+        await _user(db, "user_b", ["I double text... a lot"])
+        token = await _user(db, "user_a", ["I think astrology is real"])
+
+        _, blocking_chunks, _ = await _call("POST", "/api/ai/icebreaker/user_b", token)
+        produced = llm.produced
+        assert blocking_chunks[0][0] == produced
+
+        _, stream_chunks, _ = await _call("POST", "/api/ai/analyze-compatibility/user_b/stream", token)
+        assert stream_chunks[0][0] == produced + 1
+        assert llm.produced - produced == len(stream_chunks) - 1  # tokens, then done
+
+    asyncio.run(run())
+
+
+def test_providers_without_streaming_have_no_sse_routes(app_env, monkeypatch):
+    db, _ = app_env
+    monkeypatch.setattr(server, "ai_service", AIService(WholeCompletions()))
+
+    async def run():
+        token = await _user(db, "user_a", ["I own multiple swords"])
+        code, _, _ = await _call("POST", "/api/ai/roast/stream", token)
+        assert code == 404
+        code, chunks, _ = await _call("POST", "/api/ai/roast", token)
+        assert code == 200 and json.loads(b"".join(c for _, c in chunks)) == {"roast": "all at once"}
+
+    asyncio.run(run())
+
+
+def test_a_provider_failing_mid_stream_falls_back_or_reports_an_error(app_env, monkeypatch):
+    db, _ = app_env
+
+    async def stream_with(fail_after, path, token):
+        monkeypatch.setattr(server, "ai_service", AIService(FailingStub(fail_after)))
+        code, chunks, _ = await _call("POST", path, token)
+        assert code == 200
+        return _events(chunks)
+
+    async def run():
+        await _user(db, "user_b", ["I double text... a lot"])
+        token = await _user(db, "user_a", ["I own multiple swords"])
+
+        # Nothing sent yet: the offline roast takes over
+        events = await stream_with(0, "/api/ai/roast/stream", token)
+        assert [e for e, _ in events] == ["token", "done"]
+        assert "sword" in events[-1][1]["roast"] or "blade" in events[-1][1]["roast"]
+
+        # Part of the answer was sent: the client is told it failed
+        events = await stream_with(2, "/api/ai/roast/stream", token)
+        assert [e for e, _ in events] == ["token", "token", "error"]
+
+        # No offline generator for compatibility
+        events = await stream_with(0, "/api/ai/analyze-compatibility/user_b/stream", token)
+        assert [e for e, _ in events] == ["error"]
+
+        # Neither the fallback nor a partial answer was cached as the LLM's
+        assert await server.ai_cache.collection.count_documents({}) == 0
+
+    asyncio.run(run())
+
+
+def test_emergent_provider_streams_through_litellm(monkeypatch):
+    requests = []
+
+    def chunk(text):
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=text))])
+
+    async def acompletion(**kwargs):
+        requests.append(kwargs)
+
+        async def chunks():
+            for text in ("Hello", None, " there"):
+                yield chunk(text)
+            yield types.SimpleNamespace(choices=[])
+
+        return chunks()
+
+    class LlmChat:
+        def __init__(self, **kwargs):
+            pass
+
+        def with_model(self, provider, model):
+            return self
+
+        async def send_message(self, message):
+            return "whole completion"
+
+    chat = types.ModuleType("emergentintegrations.llm.chat")
+    chat.LlmChat, chat.UserMessage = LlmChat, lambda text: text
+    monkeypatch.setitem(sys.modules, "emergentintegrations", types.ModuleType("emergentintegrations"))
+    monkeypatch.setitem(sys.modules, "emergentintegrations.llm", types.ModuleType("emergentintegrations.llm"))
+    monkeypatch.setitem(sys.modules, "emergentintegrations.llm.chat", chat)
+    monkeypatch.setitem(sys.modules, "litellm", types.SimpleNamespace(acompletion=acompletion))
+
+    async def run():
+        provider = EmergentLLMProvider("key", api_base="https://llm.example.com")
+        assert not provider.streams
+        tokens = [t async for t in provider.stream("system", "prompt", session_id="s")]
+        await provider.close()
+        assert provider.streams
+        assert tokens == ["Hello", " there"]
+        assert requests[0]["stream"] is True
+        assert requests[0]["model"] == "openai/gpt-4o"
+        assert requests[0]["api_base"] == "https://llm.example.com"
+        assert requests[0]["messages"][1] == {"role": "user", "content": "prompt"}
+
+        # Without the proxy's base URL the key can't go to litellm directly
+        provider = EmergentLLMProvider("key")
+        tokens = [t async for t in provider.stream("system", "prompt", session_id="s")]
+        await provider.close()
+        assert not provider.streams
+        assert tokens == ["whole completion"] and len(requests) == 1
+
+    asyncio.run(run())
+
+
+def test_slow_llm_falls_back_to_offline_roast(app_env, monkeypatch):
+    db, llm = app_env
+    monkeypatch.setattr(server, "ai_hedge", Hedge(TOKEN_DELAY))
+
+    async def run():
+        token = await _user(db, "user_a", ["I own multiple swords"])
+        code, chunks, total = await _call("POST", "/api/ai/roast", token)
+        assert code == 200
+        roast = json.loads(b"".join(c for _, c in chunks))["roast"]
+        assert "sword" in roast or "blade" in roast
+        assert total < TOKEN_DELAY * 5
+
+        # The LLM call kept running and filled the cache for next time
+        await asyncio.sleep(TOKEN_DELAY * 20)
+        assert llm.calls == 1
+        assert await server.ai_cache.variant_count("roast", server.roast_prompt({"user_id": "user_a", "red_flags": ["I own multiple swords"]}).inputs) == 1
+
+    asyncio.run(run())
+
+
+def test_a_new_match_queues_all_four_generations_in_one_insert(app_env, monkeypatch):
+    db, _ = app_env
+    jobs = db.jobs
+    monkeypatch.setattr(server.job_queue, "collection", jobs)
+    batches = []
+    real_insert_many = jobs.insert_many
+
+    async def insert_many(docs, **kwargs):
+        batches.append(len(docs))
+        return await real_insert_many(docs, **kwargs)
+
+    monkeypatch.setattr(jobs, "insert_many", insert_many)
+
+    async def run():
+        user = {"user_id": "user_a", "name": "A", "red_flags": ["I own multiple swords"]}
+        other = {"user_id": "user_b", "name": "B", "red_flags": ["I double text... a lot"]}
+        await server._precompute_match_ai(user, other)
+        await server._precompute_match_ai(user, other)  # already pending
+        assert batches == [4]
+        assert await db.jobs.count_documents({"type": "ai_generate"}) == 4
+
+    asyncio.run(run())
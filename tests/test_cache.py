@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from cache import LocalBus, LocalCache, MemorySharedTier, MongoSharedTier, TieredCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_local_cache_expires_and_evicts_least_recently_used():
+    clock = FakeClock()
+    local = LocalCache(max_entries=2, clock=clock)
+    local.set("a", 1, ttl=10)
+    local.set("b", 2, ttl=10)
+    assert local.get("a") == (True, 1)
+    local.set("c", 3, ttl=10)  # evicts b, the least recently used
+    assert local.get("b") == (False, None)
+    clock.now = 11
+    assert local.get("a") == (False, None)
+    assert local.evictions == 1
+
+
+def test_local_cache_remembers_when_a_key_was_invalidated():
+    clock = FakeClock()
+    local = LocalCache(clock=clock)
+    assert not local.invalidated_within("a", 90)
+    local.invalidate("a")
+    clock.now = 89
+    assert local.invalidated_within("a", 90) and local.generation("a") == 1
+    clock.now = 90
+    assert not local.invalidated_within("a", 90)
+
+
+def test_invalidation_reaches_other_workers_and_the_shared_tier():
+    shared, bus = MemorySharedTier(), LocalBus()
+    worker_a = TieredCache(shared=shared, bus=bus)
+    worker_b = TieredCache(shared=shared, bus=bus)
+    loads = []
+
+    async def load(value):
+        loads.append(value)
+        return value
+
+    async def run():
+        assert await worker_a.get_or_load("user:1", lambda: load("v1")) == "v1"
+        # B finds it in the shared tier, then in its own local tier
+        assert await worker_b.get_or_load("user:1", lambda: load("unused")) == "v1"
+        assert await worker_b.get_or_load("user:1", lambda: load("unused")) == "v1"
+        assert worker_b.hits == {"local": 1, "shared": 1}
+
+        await worker_a.invalidate("user:1")
+        assert await worker_b.get_or_load("user:1", lambda: load("v2")) == "v2"
+        assert await worker_a.get_or_load("user:1", lambda: load("unused")) == "v2"
+
+    asyncio.run(run())
+    assert loads == ["v1", "v2"]
+
+
+def test_value_loaded_before_an_invalidation_is_not_cached():
+    cache = TieredCache(shared=MemorySharedTier())
+
+    async def run():
+        loading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_load():
+            loading.set()
+            await release.wait()
+            return "stale"
+
+        task = asyncio.create_task(cache.get_or_load("matches:1", slow_load))
+        await loading.wait()
+        await cache.invalidate("matches:1")
+        release.set()
+        assert await task == "stale"  # served once to the caller that read it
+
+        async def fresh():
+            return "fresh"
+
+        assert await cache.get_or_load("matches:1", fresh) == "fresh"
+        assert cache.stale_writes == 1
+
+    asyncio.run(run())
+
+
+def test_callers_after_an_invalidation_do_not_join_the_earlier_load():
+    cache = TieredCache()
+
+    async def run():
+        loading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_load():
+            loading.set()
+            await release.wait()
+            return "before write"
+
+        async def load_after_write():
+            return "after write"
+
+        early = asyncio.create_task(cache.get_or_load("user:1", slow_load))
+        await loading.wait()
+        # e.g. PUT /profile commits and invalidates while a GET is loading
+        await cache.invalidate("user:1")
+        assert await cache.get_or_load("user:1", load_after_write) == "after write"
+        release.set()
+        assert await early == "before write"
+        assert await cache.get_or_load("user:1", slow_load) == "after write"
+
+    asyncio.run(run())
+
+
+def test_mongo_shared_tier_rejects_writes_from_an_old_generation():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    tier = MongoSharedTier(mongomock_motor.AsyncMongoMockClient()["unhinged_test"].cache)
+
+    async def run():
+        assert await tier.get("k") == (None, 0)
+        assert await tier.set("k", {"a": 1}, ttl=30, generation=0)
+        assert await tier.get("k") == ({"a": 1}, 0)
+        assert await tier.invalidate("k") == 1
+        assert await tier.get("k") == (None, 1)
+        assert not await tier.set("k", {"a": "stale"}, ttl=30, generation=0)
+        assert await tier.set("k", {"a": 2}, ttl=30, generation=1)
+        assert await tier.get("k") == ({"a": 2}, 1)
+
+    asyncio.run(run())
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from cache import LocalBus, TieredCache
+from change_streams import ChangeConsumer
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+class NoReplicaSet:
+    """A database whose server refuses $changeStream, like a standalone mongod."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+
+class ScriptedStream:
+    """A change stream that yields ``changes`` (None: nothing new) and then closes."""
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    def alive(self):
+        return bool(self.changes)
+
+    async def try_next(self):
+        change = self.changes.pop(0)
+        self.resume_token = {"_data": f"token-{len(self.changes)}"}
+        return change
+
+
+class ScriptedDatabase(NoReplicaSet):
+    def __init__(self, db, changes):
+        super().__init__(db)
+        self.stream = ScriptedStream(changes)
+
+    def watch(self, *args, **kwargs):
+        return self.stream
+
+
+def event(coll, operation, doc, updated=None):
+    change = {"ns": {"db": "unhinged_test", "coll": coll}, "operationType": operation, "fullDocument": doc}
+    if updated is not None:
+        change["updateDescription"] = {"updatedFields": updated, "removedFields": []}
+    return change
+
+
+def test_apply_updates_derived_state_without_rebroadcasting():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+        cache = TieredCache(bus=LocalBus())
+        consumer = ChangeConsumer(db, cache)
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        await db.matches.insert_one({"match_id": "m1", "user1_id": "u1", "user2_id": "u2", "last_message_at": None})
+
+        async def load():
+            return ["cached"]
+
+        for key in ("matches:u1", "matches:u2", "user:u1", "swiped:u1"):
+            await cache.get_or_load(key, load)
+
+        await consumer.apply(event("messages", "insert", {"match_id": "m1", "created_at": now}))
+        # An older message replayed later doesn't move it back
+        await consumer.apply(event("messages", "insert", {"match_id": "m1", "created_at": now - timedelta(hours=1)}))
+        match = await db.matches.find_one({"match_id": "m1"})
+        assert match["last_message_at"].replace(tzinfo=timezone.utc) == now
+
+        await consumer.apply(event("matches", "insert", {"match_id": "m1", "user1_id": "u1", "user2_id": "u2"}))
+        await consumer.apply(event("swipes", "insert", {"swiper_id": "u1", "target_id": "u3"}))
+        await consumer.apply(event("users", "update", {"user_id": "u1"}, updated={"bio": "new"}))
+        await consumer.apply({"ns": {"coll": "users"}, "operationType": "delete", "documentKey": {"_id": "x"}})
+
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["invalidations"]["sent"] == 0
+        assert consumer.stats()["events"] == {"users": 2, "swipes": 1, "matches": 1, "messages": 2}
+
+    asyncio.run(run())
+
+
+def test_falls_back_to_reconciliation_without_a_replica_set():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+        cache = TieredCache(bus=LocalBus())
+        consumer = ChangeConsumer(NoReplicaSet(db), cache, reconcile_interval=60)
+        sent = datetime.now(timezone.utc).replace(microsecond=0)
+        await db.matches.insert_one({"match_id": "m1", "user1_id": "u1", "user2_id": "u2", "last_message_at": None})
+        await db.messages.insert_many([
+            {"message_id": "a", "match_id": "m1", "created_at": sent - timedelta(minutes=5)},
+            {"message_id": "b", "match_id": "m1", "created_at": sent},
+        ])
+
+        await consumer.start()
+        for _ in range(100):
+            if consumer.reconciles:
+                break
+            await asyncio.sleep(0.01)
+        assert consumer.stats()["mode"] == "reconcile"
+        await consumer.stop()
+
+        match = await db.matches.find_one({"match_id": "m1"})
+        assert match["last_message_at"].replace(tzinfo=timezone.utc) == sent
+        # The next pass starts from the checkpoint and finds nothing new
+        assert await consumer.reconcile() == {"matches_updated": 0}
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(not os.environ.get("MONGO_REPLICA_SET_URL"), reason="set MONGO_REPLICA_SET_URL to a replica set (a single node is enough)")
+def test_stream_applies_writes_and_saves_the_resume_token():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ["MONGO_REPLICA_SET_URL"], tz_aware=True)
+        db = client[f"unhinged_changes_{uuid.uuid4().hex[:8]}"]
+        consumer = ChangeConsumer(db, TieredCache(bus=LocalBus()))
+        try:
+            await db.matches.insert_one({"match_id": "m1", "user1_id": "u1", "user2_id": "u2", "last_message_at": None})
+            await consumer.start()
+            while consumer.mode != "stream":
+                await asyncio.sleep(0.05)
+            sent = datetime.now(timezone.utc).replace(microsecond=0)
+            await db.messages.insert_one({"match_id": "m1", "created_at": sent})
+            for _ in range(100):
+                match = await db.matches.find_one({"match_id": "m1"})
+                if match["last_message_at"] is not None:
+                    break
+                await asyncio.sleep(0.05)
+            assert match["last_message_at"] == sent
+            for _ in range(100):
+                state = await db.change_stream_state.find_one({"_id": consumer.name})
+                if state and state.get("token"):
+                    break
+                await asyncio.sleep(0.05)
+            assert state["token"]
+        finally:
+            await consumer.stop()
+            await client.drop_database(db.name)
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_a_malformed_event_is_skipped_and_the_stream_moves_on():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+        sent = datetime.now(timezone.utc).replace(microsecond=0)
+        await db.matches.insert_one({"match_id": "m1", "user1_id": "u1", "user2_id": "u2", "last_message_at": None})
+        changes = [
+            # e.g. an admin script's insert without created_at
+            event("messages", "insert", {"match_id": "m1"}),
+            event("messages", "insert", {"match_id": "m1", "created_at": sent}),
+            None,  # caught up
+        ]
+        consumer = ChangeConsumer(ScriptedDatabase(db, changes), TieredCache(bus=LocalBus()))
+
+        await consumer._watch()
+
+        assert consumer.stats()["errors"] == 1
+        match = await db.matches.find_one({"match_id": "m1"})
+        assert match["last_message_at"].replace(tzinfo=timezone.utc) == sent
+        state = await db.change_stream_state.find_one({"_id": consumer.name})
+        assert state["token"] == {"_data": "token-0"}
+
+    asyncio.run(run())
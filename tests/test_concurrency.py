@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+from concurrency import ConcurrencyLimiter, Hedge, QueueTimeout, SingleFlight
+
+
+def test_single_flight_shares_one_call():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "analysis"
+
+        results = await asyncio.gather(*(flight.do("target", upstream) for _ in range(25)))
+        assert results == ["analysis"] * 25
+        assert calls == 1
+        assert (flight.calls, flight.coalesced, flight.in_flight) == (1, 24, 0)
+
+        # Finished calls are not reused
+        assert await flight.do("target", upstream) == "analysis"
+        assert calls == 2
+
+    asyncio.run(run())
+
+
+def test_single_flight_propagates_errors_to_every_caller():
+    async def run():
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(run())
+
+
+def test_limiter_enforces_per_key_and_global_limits():
+    async def run():
+        limiter = ConcurrencyLimiter(max_concurrency=3, max_per_key=1, queue_timeout=1)
+        peak = {"a": 0, "total": 0}
+        current = {"a": 0, "total": 0}
+
+        async def call(key):
+            async with limiter.slot(key):
+                current["total"] += 1
+                current[key] = current.get(key, 0) + 1
+                peak["total"] = max(peak["total"], current["total"])
+                peak[key] = max(peak.get(key, 0), current[key])
+                await asyncio.sleep(0.01)
+                current["total"] -= 1
+                current[key] -= 1
+
+        await asyncio.gather(*(call(k) for k in ["a"] * 4 + ["b", "c", "d", "e"]))
+        assert peak["a"] == 1
+        assert peak["total"] == 3
+        stats = limiter.stats()
+        assert stats["acquired"] == 8
+        assert stats["queue_depth"] == 0
+        assert stats["tracked_keys"] == 0
+        assert stats["wait_seconds_max"] > 0
+
+    asyncio.run(run())
+
+
+def test_limiter_times_out_queued_callers():
+    async def run():
+        limiter = ConcurrencyLimiter(max_concurrency=1, max_per_key=1, queue_timeout=0.02)
+
+        async def hold():
+            async with limiter.slot("a"):
+                await asyncio.sleep(0.1)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueTimeout) as exc:
+            async with limiter.slot("b"):
+                pass
+        assert exc.value.scope == "global"
+        assert limiter.stats()["timeouts"] == 1
+        await holder
+        async with limiter.slot("b"):
+            assert limiter.stats()["active"] == 1
+
+    asyncio.run(run())
+
+
+def test_hedge_prefers_fast_primary_and_falls_back_when_slow_or_failing():
+    async def run():
+        hedge = Hedge(delay=0.02)
+
+        async def fast():
+            return "llm"
+
+        async def slow():
+            await asyncio.sleep(1)
+            return "llm"
+
+        async def broken():
+            raise RuntimeError("upstream down")
+
+        async def offline():
+            return "template"
+
+        assert await hedge.run(fast, offline) == "llm"
+        started = time.monotonic()
+        assert await hedge.run(slow, offline) == "template"
+        assert time.monotonic() - started < 0.5
+        assert await hedge.run(broken, offline) == "template"
+        assert hedge.stats() == {
+            "delay_seconds": 0.02, "calls": 3, "primary_wins": 1, "fallback_wins": 2, "primary_errors": 1,
+        }
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from db_indexes import INDEXES, QUERY_SHAPES, is_covered, plan_stages
+
+
+def _explain(winning_plan):
+    return {"queryPlanner": {"winningPlan": winning_plan}}
+
+
+def test_plan_stages_walks_nested_plans():
+    plan = {
+        "stage": "SUBPLAN",
+        "inputStage": {
+            "stage": "FETCH",
+            "inputStage": {
+                "stage": "OR",
+                "inputStages": [
+                    {"stage": "IXSCAN", "indexName": "user1_id"},
+                    {"stage": "IXSCAN", "indexName": "user2_id"},
+                ],
+            },
+        },
+    }
+    assert plan_stages(plan) == ["SUBPLAN", "FETCH", "OR", "IXSCAN", "IXSCAN"]
+
+
+def test_is_covered_rejects_collscan_and_blocking_sort():
+    assert is_covered(_explain({"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}))
+    assert not is_covered(_explain({"stage": "COLLSCAN"}))
+    assert not is_covered(_explain({"stage": "SORT", "inputStage": {"stage": "IXSCAN"}}))
+
+
+def test_every_query_shape_targets_an_indexed_collection():
+    for collection, _query, _sort in QUERY_SHAPES:
+        assert INDEXES.get(collection), collection
+
+
+def test_session_ttl_index():
+    ttl = [m.document for m in INDEXES["user_sessions"] if "expireAfterSeconds" in m.document]
+    assert ttl == [{"key": {"expires_at": 1}, "name": "expires_at_ttl", "expireAfterSeconds": 0}]
+
+
+def _shape(value):
+    """A filter with its values blanked out: what decides the index it needs."""
+    if isinstance(value, dict):
+        return tuple(sorted(
+            (key, "?" if key in ("$in", "$nin") else _shape(v)) for key, v in value.items()
+        ))
+    if isinstance(value, list):
+        return tuple(_shape(v) for v in value)
+    return "?"
+
+
+def test_every_query_the_app_issues_is_a_listed_shape(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from mongomock.collection import Collection
+
+    import server
+    from loadgen import run_load
+
+    issued = set()
+    recording = True
+
+    def record(method):
+        real = getattr(Collection, method)
+
+        def wrapper(self, *args, **kwargs):
+            query = args[0] if args else kwargs.get("filter", kwargs.get("pipeline"))
+            if method == "aggregate":
+                query = query[0].get("$match") if query else None
+            # Lookups by _id are served by the index every collection has
+            if recording and isinstance(query, dict) and "_id" not in query:
+                issued.add((self.name, _shape(query)))
+            return real(self, *args, **kwargs)
+
+        monkeypatch.setattr(Collection, method, wrapper)
+
+    for method in ("find", "find_one_and_update", "update_one", "update_many", "replace_one",
+                   "delete_one", "delete_many", "count_documents", "aggregate", "distinct"):
+        record(method)
+    for name in ("client", "db", "cache", "ai_cache", "change_consumer", "maintenance"):
+        monkeypatch.setattr(server, name, getattr(server, name))
+    monkeypatch.setattr(server.job_queue, "collection", server.job_queue.collection)
+    client = mongomock_motor.AsyncMongoMockClient(tz_aware=True)
+    server.use_database(client, client["unhinged_test"])
+    db = server.db
+
+    async def run():
+        nonlocal recording
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            assert (await run_load(http, users=3, iterations=2, like_ratio=1.0, seed=7)).report()["matches"]
+
+            recording = False
+            user_id = (await db.users.find_one({}))["user_id"]
+            recording = True
+            await db.user_sessions.insert_one({
+                "user_id": user_id, "session_token": "s", "expires_at": datetime.now(timezone.utc) + timedelta(days=1),
+            })
+            http.cookies.set("session_token", "s")
+            assert (await http.get("/api/auth/me")).status_code == 200
+            assert (await http.put("/api/profile", json={"bio": "new"})).status_code == 200
+            assert (await http.delete("/api/users/me")).status_code == 202
+            while await server.job_queue.run_once():
+                pass
+            assert (await http.get("/api/users/me/deletion-status")).json()["status"] == "done"
+
+        await server.job_queue.stats()
+        await server.change_consumer.reconcile()
+        for name in server.maintenance.jobs:
+            assert await server.maintenance.run_once(name)
+        server.maintenance.start()
+        await server.maintenance.stop()
+
+    asyncio.run(run())
+
+    listed = {(collection, _shape(query)) for collection, query, _sort in QUERY_SHAPES}
+    missing = sorted(issued - listed, key=repr)
+    assert not missing, "add these to db_indexes.QUERY_SHAPES:\n" + "\n".join(map(repr, missing))
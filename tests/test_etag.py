@@ -0,0 +1,48 @@
+from starlette.requests import Request
+
+import etag
+from etag import PrecomputedJSON, etag_matches, make_etag, not_modified, record_response
+
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_weak_comparison_and_lists():
+    tag = make_etag("profile", "user_1", 3)
+    assert tag.startswith('W/"')
+    assert etag_matches(_request(tag), tag)
+    assert etag_matches(_request(tag[2:]), tag)
+    assert etag_matches(_request(f'"other", {tag}'), tag)
+    assert etag_matches(_request("*"), tag)
+    assert not etag_matches(_request(make_etag("profile", "user_1", 4)), tag)
+    assert not etag_matches(_request(), tag)
+
+
+def test_precomputed_json_serves_304_with_cache_headers():
+    body = PrecomputedJSON({"prompts": [{"id": "hot_take"}]}, max_age=60)
+    fresh = body.respond(_request())
+    assert fresh.status_code == 200
+    assert fresh.body == b'{"prompts":[{"id":"hot_take"}]}'
+    assert fresh.headers["cache-control"] == "public, max-age=60"
+
+    cached = body.respond(_request(body.etag))
+    assert cached.status_code == 304
+    assert cached.body == b""
+    assert cached.headers["etag"] == body.etag
+
+
+def test_bytes_saved_accounting(monkeypatch):
+    monkeypatch.setattr(etag, "ETAG_STATS", {k: 0 for k in etag.ETAG_STATS})
+    tag = make_etag("matches", "user_1")
+    record_response(200, tag, 4096)
+    assert not_modified(_request(tag), tag).status_code == 304
+    record_response(304, tag, 0)
+    record_response(304, tag, 0)
+    assert etag.ETAG_STATS == {
+        "responses_200": 1,
+        "responses_304": 2,
+        "bytes_sent": 4096,
+        "bytes_saved": 8192,
+    }
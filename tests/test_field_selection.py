@@ -0,0 +1,41 @@
+from typing import List, Optional
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict
+
+from field_selection import FieldSelector
+
+
+class Profile(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    user_id: str
+    name: str
+    age: Optional[int] = None
+    photos: List[str] = []
+
+
+SELECTOR = FieldSelector(Profile)
+
+
+def test_parse_validates_against_whitelist():
+    assert SELECTOR.parse(None) is None
+    assert SELECTOR.parse(" name, photos ,") == frozenset({"name", "photos"})
+    with pytest.raises(HTTPException) as exc:
+        SELECTOR.parse("name,password_hash")
+    assert exc.value.status_code == 400
+    assert "password_hash" in exc.value.detail
+    with pytest.raises(HTTPException):
+        SELECTOR.parse(",")
+
+
+def test_projection_includes_extra_fields():
+    assert SELECTOR.projection({"name"}, "user_id") == {"_id": 0, "name": 1, "user_id": 1}
+
+
+def test_document_shapes_like_the_model_without_building_it():
+    doc = {"photos": ["p.jpg"], "name": "Sam", "user_id": "u1", "password_hash": "x", "profile_version": 3}
+    assert SELECTOR.document(doc) == {"user_id": "u1", "name": "Sam", "age": None, "photos": ["p.jpg"]}
+    assert list(SELECTOR.document(doc)) == list(Profile.model_fields)
+    assert SELECTOR.document(doc, frozenset({"age"})) == {"age": None}
+    assert SELECTOR.document({})["name"] is None
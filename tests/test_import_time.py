@@ -0,0 +1,24 @@
+import os
+
+from import_report import by_package, measure, total_seconds
+
+# Generous for slow CI machines; locally ``import server`` takes ~0.25s.
+# Run ``python backend/import_report.py`` to see what a regression added.
+IMPORT_BUDGET_SECONDS = float(os.environ.get("IMPORT_BUDGET_SECONDS", "1.0"))
+
+# Loaded on first use, never by ``import server``
+LAZY_MODULES = ("cloudinary", "httpx", "oauth_client", "emergentintegrations", "litellm")
+
+
+def test_cold_import_stays_within_budget():
+    # Best of three, to ride out a noisy neighbour
+    runs = [measure("server") for _ in range(3)]
+    best = min(runs, key=total_seconds)
+    seconds = total_seconds(best)
+    top = list(by_package(best).items())[:10]
+    assert seconds <= IMPORT_BUDGET_SECONDS, f"import server took {seconds:.3f}s; slowest packages (us): {top}"
+
+
+def test_optional_integrations_are_not_imported_eagerly():
+    imported = {t.module.split(".")[0] for t in measure("server")}
+    assert not imported & set(LAZY_MODULES), sorted(imported & set(LAZY_MODULES))
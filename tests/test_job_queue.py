@@ -0,0 +1,201 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from job_queue import JobQueue
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def _queue(**kwargs):
+    return JobQueue(mongomock_motor.AsyncMongoMockClient()["test"].jobs, **kwargs)
+
+
+def test_enqueue_dedupes_pending_jobs_and_runs_them():
+    async def run():
+        queue = _queue()
+        seen = []
+
+        async def handler(payload):
+            seen.append(payload["n"])
+
+        queue.register("work", handler)
+        assert await queue.enqueue("work", {"n": 1}, dedupe_key="k")
+        assert await queue.enqueue("work", {"n": 2}, dedupe_key="k") is None
+        assert await queue.enqueue("work", {"n": 3})
+        assert (await queue.stats())["queue_depth"] == 2
+
+        assert await queue.run_once()
+        assert await queue.run_once()
+        assert not await queue.run_once()
+        assert seen == [1, 3]
+
+        # Finished jobs no longer block their dedupe key
+        assert await queue.enqueue("work", {"n": 4}, dedupe_key="k")
+        stats = await queue.stats()
+        assert stats["completed"] == 2
+        assert stats["deduplicated"] == 1
+        assert stats["queue_depth"] == 1
+
+    asyncio.run(run())
+
+
+def test_failures_retry_with_backoff_then_fail():
+    async def run():
+        queue = _queue(max_attempts=2, backoff_seconds=60)
+
+        gave_up = []
+
+        async def handler(payload):
+            raise RuntimeError("upstream down")
+
+        async def on_failure(payload, error):
+            gave_up.append((payload, str(error)))
+
+        queue.register("work", handler, on_failure=on_failure)
+        await queue.enqueue("work", {"n": 1})
+        assert await queue.run_once()
+        job = await queue.collection.find_one({})
+        assert job["status"] == "queued"
+        assert gave_up == []
+        assert job["run_at"].replace(tzinfo=timezone.utc) > datetime.now(timezone.utc) + timedelta(seconds=40)
+        assert not await queue.run_once()  # backing off
+
+        await queue.collection.update_one({}, {"$set": {"run_at": datetime.now(timezone.utc)}})
+        assert await queue.run_once()
+        job = await queue.collection.find_one({})
+        assert job["status"] == "failed"
+        assert "active" not in job
+        assert "upstream down" in job["error"]
+        stats = await queue.stats()
+        assert (stats["retried"], stats["failed"]) == (1, 1)
+        assert gave_up == [({"n": 1}, "upstream down")]
+
+    asyncio.run(run())
+
+
+def test_expired_lease_is_reclaimed():
+    async def run():
+        queue = _queue()
+        seen = []
+
+        async def handler(payload):
+            seen.append(payload)
+
+        queue.register("work", handler)
+        await queue.enqueue("work", {"n": 1})
+        # Simulate a worker that claimed the job and died
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await queue.collection.update_one({}, {"$set": {"status": "running", "locked_until": past}})
+        assert await queue.run_once()
+        assert seen == [{"n": 1}]
+
+    asyncio.run(run())
+
+
+def test_workers_pick_up_enqueued_jobs():
+    async def run():
+        queue = _queue(workers=2, poll_interval=5)
+        done = asyncio.Event()
+
+        async def handler(payload):
+            done.set()
+
+        queue.register("work", handler)
+        queue.start()
+        try:
+            await queue.enqueue("work", {})
+            await asyncio.wait_for(done.wait(), timeout=1)
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
+
+
+def test_a_job_that_keeps_killing_its_worker_fails_after_max_attempts():
+    async def run():
+        queue = _queue(max_attempts=2)
+        seen = []
+
+        async def handler(payload):
+            seen.append(payload)
+
+        queue.register("work", handler)
+        await queue.enqueue("work", {})
+        # Two workers claimed it and died
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await queue.collection.update_one({}, {"$set": {"status": "running", "attempts": 2, "locked_until": past}})
+        assert await queue.run_once()
+        job = await queue.collection.find_one({})
+        assert job["status"] == "failed" and "lease expired" in job["error"]
+        assert seen == []
+        assert not await queue.run_once()
+
+    asyncio.run(run())
+
+
+def test_long_jobs_keep_their_lease_and_stop_when_it_is_taken_over():
+    async def run():
+        queue = _queue(lease_seconds=0.06)
+        renewed = asyncio.Event()
+
+        async def handler(payload):
+            first = (await queue.collection.find_one({}))["locked_until"]
+            while True:
+                await asyncio.sleep(0.01)
+                if (await queue.collection.find_one({}))["locked_until"] > first:
+                    renewed.set()
+
+        queue.register("work", handler)
+        await queue.enqueue("work", {})
+        running = asyncio.create_task(queue.run_once())
+        await asyncio.wait_for(renewed.wait(), 5)
+        # Another worker reclaimed it (e.g. this one stalled past the lease)
+        await queue.collection.update_one({}, {"$set": {"claim_id": "someone else"}})
+        assert await asyncio.wait_for(running, 5)
+        job = await queue.collection.find_one({})
+        assert job["status"] == "running" and job["claim_id"] == "someone else"
+        assert (await queue.stats())["lease_lost"] == 1
+
+    asyncio.run(run())
+
+
+def test_enqueue_many_inserts_once_and_dedupes_like_enqueue():
+    async def run():
+        queue = _queue()
+        queue.register("work", lambda payload: asyncio.sleep(0))
+        assert await queue.enqueue("work", {"n": 0}, dedupe_key="a")
+        inserts = []
+        real_insert_many = queue.collection.insert_many
+
+        async def insert_many(docs, **kwargs):
+            inserts.append(len(docs))
+            return await real_insert_many(docs, **kwargs)
+
+        queue.collection.insert_many = insert_many
+        ids = await queue.enqueue_many("work", [({"n": 1}, "a"), ({"n": 2}, "b"), ({"n": 3}, "b"), ({"n": 4}, None)])
+        assert [i is not None for i in ids] == [False, True, False, True]
+        assert inserts == [2]
+        assert await queue.collection.count_documents({"status": "queued"}) == 3
+        stats = await queue.stats()
+        assert (stats["enqueued"], stats["deduplicated"]) == (3, 2)
+
+    asyncio.run(run())
+
+
+def test_enqueue_many_treats_a_racing_duplicate_as_deduplicated():
+    async def run():
+        queue = _queue()
+        await queue.collection.create_index("dedupe_key", unique=True, sparse=True)
+        # Another worker queued "a" after this one checked
+        await queue.collection.insert_one({"dedupe_key": "a", "active": True})
+        real_find = queue.collection.find
+        queue.collection.find = lambda query, *args: real_find({"dedupe_key": "none"}, *args)
+
+        ids = await queue.enqueue_many("work", [({"n": 1}, "a"), ({"n": 2}, "b")])
+        assert ids[0] is None and ids[1] is not None
+        assert (await queue.collection.find_one({"dedupe_key": "b"}))["payload"] == {"n": 2}
+        assert queue.counters["deduplicated"] == 1 and queue.counters["enqueued"] == 1
+
+    asyncio.run(run())
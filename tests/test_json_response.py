@@ -0,0 +1,85 @@
+import json
+import random
+from datetime import datetime
+
+import fastapi.routing
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from json_response import FastJSONResponse
+
+CARDS = 100
+
+
+def _discover_cards():
+    rng = random.Random(0)
+    return [
+        {
+            "user_id": f"user_{i:012x}",
+            "email": f"user{i}@example.com",
+            "name": f"User {i}",
+            "display_name": f"User {i}",
+            "picture": f"https://cdn.example.com/{i}.jpg",
+            "age": rng.randint(18, 60),
+            "bio": "Professional overthinker. " * 4,
+            "gender_identity": "woman",
+            "interested_in": ["men", "women"],
+            "city": "Berlin",
+            "red_flags": rng.sample(["I own multiple swords", "I double text... a lot", "I think astrology is real",
+                                     "I have 47 unread books", "I put milk before cereal"], 3),
+            "negative_qualities": ["Cries at commercials", "Leaves cabinet doors open"],
+            "photos": [f"https://cdn.example.com/{i}/{n}.jpg" for n in range(4)],
+            "prompts": [{"id": "hot_take", "answer": "Cereal is soup"}, {"id": "3am_thought", "answer": "Asleep"}],
+            "pref_genders": ["man"],
+            "is_active": True,
+            "profile_complete": True,
+            "created_at": datetime(2024, 5, 1, 12, 30, i % 60),
+            "match_score": rng.randint(0, 20),
+        }
+        for i in range(CARDS)
+    ]
+
+
+def _stdlib(content):
+    # FastAPI's default path for a returned list: jsonable_encoder, then stdlib json
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def test_orjson_matches_stdlib_output():
+    cards = _discover_cards()
+    fast = FastJSONResponse(cards).body
+    slow = _stdlib(cards)
+    decoded_fast, decoded_slow = json.loads(fast), json.loads(slow)
+    # Naive (Motor) datetimes are marked as UTC; everything else is identical
+    assert decoded_fast[0]["created_at"] == decoded_slow[0]["created_at"] + "+00:00"
+    for card in decoded_fast + decoded_slow:
+        card.pop("created_at")
+    assert decoded_fast == decoded_slow
+
+
+def test_returning_the_response_skips_jsonable_encoder(monkeypatch):
+    encoded = []
+
+    def counting_encoder(obj, *args, **kwargs):
+        encoded.append(obj)
+        return jsonable_encoder(obj, *args, **kwargs)
+
+    monkeypatch.setattr(fastapi.routing, "jsonable_encoder", counting_encoder)
+    app = FastAPI()
+
+    @app.get("/plain")
+    async def plain():
+        return _discover_cards()
+
+    @app.get("/fast")
+    async def fast():
+        return FastJSONResponse(_discover_cards())
+
+    client = TestClient(app)
+    assert client.get("/plain").status_code == 200
+    assert len(encoded) == 1
+    assert len(client.get("/fast").json()) == CARDS
+    assert len(encoded) == 1
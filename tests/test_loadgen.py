@@ -0,0 +1,61 @@
+import asyncio
+from contextlib import AsyncExitStack
+
+import httpx
+import pytest
+
+from loadgen import _in_process_app, endpoint_name, percentile, run_load
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server  # noqa: E402
+from ai_cache import AIResponseCache  # noqa: E402
+
+
+def test_percentile_and_endpoint_names():
+    values = sorted([0.1 * i for i in range(1, 11)])
+    assert percentile(values, 50) == pytest.approx(0.5)
+    assert percentile(values, 99) == pytest.approx(1.0)
+    assert endpoint_name("POST", "/api/matches/match_abc/messages") == "POST /api/matches/{match_id}/messages"
+
+
+def test_virtual_users_run_the_whole_flow_in_process(monkeypatch):
+    db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "ai_cache", AIResponseCache(db.ai_cache))
+    monkeypatch.setattr(server.job_queue, "collection", db.jobs)
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await run_load(http, users=4, iterations=2, like_ratio=1.0, seed=7)
+
+    report = asyncio.run(run()).report()
+    assert report["users"] == 4 and report["users_failed"] == 0
+    assert report["error_rate"] == 0.0
+    assert report["matches"] > 0
+    endpoints = report["endpoints"]
+    assert endpoints["POST /api/auth/register"]["requests"] == 4
+    assert "POST /api/matches/{match_id}/messages" in endpoints
+    assert endpoints["GET /api/discover"]["p50_ms"] > 0
+
+
+def test_memory_mode_rebinds_everything_built_on_the_database(monkeypatch):
+    for name in ("client", "db", "cache", "ai_cache", "change_consumer", "maintenance"):
+        monkeypatch.setattr(server, name, getattr(server, name))
+    monkeypatch.setattr(server.job_queue, "collection", server.job_queue.collection)
+    real = server.db
+
+    async def run():
+        async with AsyncExitStack() as stack:
+            await _in_process_app(stack, "memory")
+
+    asyncio.run(run())
+    memory = server.db
+    assert memory is not real and memory.client is server.client
+    if server.cache.bus is not None:
+        assert server.cache.bus.db is memory
+    assert server.ai_cache.collection.database is memory
+    assert server.job_queue.collection.database is memory
+    assert server.change_consumer.db is memory and server.change_consumer.cache is server.cache
+    assert server.maintenance.db is memory
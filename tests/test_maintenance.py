@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from maintenance import MaintenanceScheduler, PeriodicJob, purge_expired_sessions, rebuild_last_message_at, remove_orphans
+from metrics import MAINTENANCE_ITEMS, MAINTENANCE_RUNS
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def test_a_job_runs_once_per_interval_across_workers_and_survives_a_crashed_runner():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+        runs = []
+
+        async def job(db, state):
+            state["n"] = state.get("n", 0) + 1
+            runs.append(state["n"])
+            return {"things": 1}
+
+        def scheduler(owner):
+            return MaintenanceScheduler(db, [PeriodicJob("demo", job, interval=3600)], owner=owner)
+
+        async def make_due():
+            await db.maintenance_leases.update_one({"_id": "demo"}, {"$set": {"next_run_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+
+        a, b = scheduler("a"), scheduler("b")
+        before = MAINTENANCE_RUNS.value(job="demo", outcome="ok")
+        assert await a.run_once("demo")
+        # Not due again for an interval, on any worker
+        assert not await b.run_once("demo")
+        assert not await a.run_once("demo")
+
+        # a dies mid-run: its lease blocks the job only until it lapses
+        await make_due()
+        await db.maintenance_leases.update_one({"_id": "demo"}, {"$set": {"owner": "a", "expires_at": datetime.now(timezone.utc) + timedelta(seconds=60)}})
+        assert not await b.run_once("demo")
+        await db.maintenance_leases.update_one({"_id": "demo"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+        assert await b.run_once("demo")  # picks up a's state
+
+        assert runs == [1, 2]
+        assert b.stats()["jobs"]["demo"]["runs"] == 1
+        assert a.stats()["jobs"]["demo"]["skipped"] == 1
+        assert MAINTENANCE_RUNS.value(job="demo", outcome="ok") == before + 2
+        lease = await db.maintenance_leases.find_one({"_id": "demo"})
+        assert lease["state"] == {"n": 2} and lease["last_run_at"] is not None
+
+    asyncio.run(run())
+
+
+def test_the_lease_is_renewed_during_a_long_run_and_a_lost_lease_stops_it():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+        heartbeats = asyncio.Event()
+
+        async def long_job(db, state):
+            lease = await db.maintenance_leases.find_one({"_id": "long"})
+            while True:
+                await asyncio.sleep(0.01)
+                renewed = await db.maintenance_leases.find_one({"_id": "long"})
+                if renewed["expires_at"] > lease["expires_at"]:
+                    heartbeats.set()
+                    await asyncio.sleep(3600)
+
+        scheduler = MaintenanceScheduler(db, [PeriodicJob("long", long_job, interval=3600, lease_seconds=0.06)], owner="a")
+        running = asyncio.create_task(scheduler.run_once("long"))
+        await asyncio.wait_for(heartbeats.wait(), 5)
+        # Another worker took over (e.g. this one stalled past the lease)
+        await db.maintenance_leases.update_one({"_id": "long"}, {"$set": {"owner": "b"}})
+        assert await asyncio.wait_for(running, 5)
+        stats = scheduler.stats()["jobs"]["long"]
+        assert stats["errors"] == 1 and "LeaseLost" in stats["last"]["error"]
+        assert (await db.maintenance_leases.find_one({"_id": "long"}))["owner"] == "b"
+
+    asyncio.run(run())
+
+
+def test_jobs_clean_up_in_bounded_batches():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+        now = datetime.now(timezone.utc)
+        await db.users.insert_many([{"user_id": "u1"}, {"user_id": "u2"}])
+        await db.user_sessions.insert_many([
+            {"session_token": "expired", "expires_at": now - timedelta(days=1)},
+            {"session_token": "legacy", "expires_at": (now - timedelta(days=1)).isoformat()},
+            {"session_token": "live", "expires_at": now + timedelta(days=1)},
+        ])
+        await db.swipes.insert_many([
+            {"swiper_id": "u1", "target_id": "u2"},
+            {"swiper_id": "u1", "target_id": "gone"},
+            {"swiper_id": "gone", "target_id": "u2"},
+        ])
+        await db.matches.insert_many([
+            {"match_id": "m1", "user1_id": "u1", "user2_id": "u2", "last_message_at": None},
+            {"match_id": "m2", "user1_id": "gone", "user2_id": "u2", "last_message_at": None},
+        ])
+        await db.messages.insert_many([
+            {"match_id": "m1", "created_at": now - timedelta(minutes=1)},
+            {"match_id": "m2", "created_at": now},
+        ])
+
+        assert await purge_expired_sessions(db, {}, batch_size=1, max_batches=10) == {"sessions": 2}
+        assert [s["session_token"] async for s in db.user_sessions.find()] == ["live"]
+
+        # One batch per run: the scan continues from the saved position
+        state = {}
+        first = await remove_orphans(db, state, batch_size=2, max_batches=1)
+        assert first == {"swipes": 1, "matches": 1, "messages": 1}
+        assert state["swipes_after"] is not None
+        second = await remove_orphans(db, state, batch_size=2, max_batches=1)
+        assert second == {"swipes": 1, "matches": 0, "messages": 0}
+        assert state == {"swipes_after": None, "matches_after": None}
+        assert await db.swipes.count_documents({}) == 1
+        assert [m["match_id"] async for m in db.matches.find()] == ["m1"]
+
+        assert await rebuild_last_message_at(db, {}) == {"matches": 1}
+        match = await db.matches.find_one({"match_id": "m1"})
+        assert match["last_message_at"] is not None
+        assert await rebuild_last_message_at(db, {}) == {"matches": 0}
+
+        # A thread with only unmigrated string timestamps keeps a date (or nothing)
+        await db.matches.insert_one({"match_id": "legacy", "user1_id": "u1", "user2_id": "u2", "last_message_at": None})
+        await db.messages.insert_one({"match_id": "legacy", "created_at": now.isoformat()})
+        await rebuild_last_message_at(db, {})
+        assert (await db.matches.find_one({"match_id": "legacy"}))["last_message_at"] is None
+
+    asyncio.run(run())
+
+
+def test_scheduler_records_items_and_survives_a_failing_job():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+
+        async def broken(db, state):
+            raise RuntimeError("boom")
+
+        scheduler = MaintenanceScheduler(db, [
+            PeriodicJob("broken", broken, interval=60),
+            PeriodicJob("sessions", purge_expired_sessions, interval=60),
+        ])
+        await db.user_sessions.insert_one({"session_token": "t", "expires_at": datetime.now(timezone.utc) - timedelta(hours=1)})
+        before = MAINTENANCE_ITEMS.value(job="sessions", item="sessions")
+        assert await scheduler.run_once("broken")
+        assert await scheduler.run_once("sessions")
+        stats = scheduler.stats()["jobs"]
+        assert stats["broken"]["errors"] == 1 and "boom" in stats["broken"]["last"]["error"]
+        assert stats["sessions"]["last"]["result"] == {"sessions": 1}
+        assert MAINTENANCE_ITEMS.value(job="sessions", item="sessions") == before + 1
+
+    asyncio.run(run())
@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, MongoCommandMetrics, MongoPoolMetrics, current_route
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1))
+    for v in (0.05, 0.5, 5):
+        h.observe(v, route='a"b')
+    lines = h.render()
+    assert lines[:2] == ["# HELP t_seconds test", "# TYPE t_seconds histogram"]
+    assert 't_seconds_bucket{route="a\\"b",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{route="a\\"b",le="1"} 2' in lines
+    assert 't_seconds_bucket{route="a\\"b",le="+Inf"} 3' in lines
+    assert 't_seconds_count{route="a\\"b"} 3' in lines
+
+
+def test_mongo_listener_labels_commands_with_the_route():
+    listener = MongoCommandMetrics()
+    labels = {"route": "test_route", "collection": "users", "command": "find"}
+    before = (metrics.MONGO_SECONDS.count(**labels), metrics.MONGO_DOCUMENTS.value(**labels))
+
+    token = current_route.set("test_route")
+    try:
+        listener.started(SimpleNamespace(request_id=1, command_name="find", command={"find": "users"}))
+    finally:
+        current_route.reset(token)
+    listener.succeeded(SimpleNamespace(
+        request_id=1, command_name="find", duration_micros=2500,
+        reply={"cursor": {"firstBatch": [{}, {}, {}]}},
+    ))
+
+    assert metrics.MONGO_SECONDS.count(**labels) == before[0] + 1
+    assert metrics.MONGO_DOCUMENTS.value(**labels) == before[1] + 3
+    assert not listener._pending
+
+
+def test_pool_listener_records_wait_and_timeouts():
+    from pymongo.monitoring import ConnectionCheckOutFailedReason
+
+    listener = MongoPoolMetrics()
+    before = metrics.POOL_WAIT_SECONDS.count(route="pool_route")
+    token = current_route.set("pool_route")
+    try:
+        listener.connection_check_out_started(SimpleNamespace())
+        listener.connection_checked_out(SimpleNamespace())
+    finally:
+        current_route.reset(token)
+    assert metrics.POOL_WAIT_SECONDS.count(route="pool_route") == before + 1
+    assert listener.stats()["checked_out"] == 1
+
+    listener.connection_checked_in(SimpleNamespace())
+    listener.connection_check_out_started(SimpleNamespace())
+    listener.connection_check_out_failed(SimpleNamespace(reason=ConnectionCheckOutFailedReason.TIMEOUT))
+
+    stats = listener.stats()
+    assert stats["checked_out"] == 0
+    assert stats["checkouts"] == 1
+    assert stats["wait_queue_timeouts"] == 1
+
+
+def test_metrics_endpoint_reports_route_latency_and_scoring(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        monkeypatch.setattr(server, "db", db)
+        await db.users.insert_many([
+            {"user_id": f"u{i}", "email": f"u{i}@example.com", "name": f"u{i}",
+             "profile_complete": True, "is_active": True, "red_flags": ["I own multiple swords"]}
+            for i in range(5)
+        ])
+        headers = {"Authorization": f"Bearer {server.create_jwt_token('u0', 'u0@example.com')}"}
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.get("/api/discover", headers=headers)).status_code == 200
+            response = await client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        return response.text
+
+    text = asyncio.run(run())
+    assert 'http_request_duration_seconds_count{route="discover_profiles",method="GET",status="200"}' in text
+    assert 'app_phase_duration_seconds_count{route="discover_profiles",phase="scoring"}' in text
+    assert 'http_requests_in_flight{route="discover_profiles"} 0' in text
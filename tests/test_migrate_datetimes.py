@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from migrate_datetimes import migrate, parse_timestamp
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server  # noqa: E402
+from cache import LocalBus, TieredCache  # noqa: E402
+
+
+def test_parse_timestamp_handles_offsets_and_naive_values():
+    assert parse_timestamp("2024-05-01T12:00:00+00:00") == datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+    assert parse_timestamp("2024-05-01T12:00:00Z") == datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+    assert parse_timestamp("2024-05-01T12:00:00").tzinfo is timezone.utc
+
+
+def test_migration_converts_strings_in_batches_and_is_idempotent():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        native = datetime(2024, 1, 1)
+        await db.messages.insert_many(
+            [{"message_id": f"m{i}", "created_at": f"2024-05-01T12:{i // 60:02d}:{i % 60:02d}.123000+00:00"} for i in range(2500)]
+            + [{"message_id": "native", "created_at": native}]
+        )
+        await db.matches.insert_many([
+            {"match_id": "a", "created_at": "2024-05-01T12:00:00+00:00", "last_message_at": None},
+            {"match_id": "b", "created_at": "2024-05-01T12:00:00+00:00", "last_message_at": "2024-05-02T08:00:00+00:00"},
+            {"match_id": "c", "created_at": "not a date"},
+        ])
+
+        assert (await migrate(db, batch_size=1000, dry_run=True))["messages.created_at"] == 2500
+        assert await db.messages.count_documents({"created_at": {"$type": "string"}}) == 2500
+
+        counts = await migrate(db, batch_size=1000)
+        assert counts["messages.created_at"] == 2500
+        assert counts["matches.created_at"] == 2 and counts["matches.last_message_at"] == 1
+        assert await db.messages.count_documents({"created_at": {"$type": "string"}}) == 0
+        first = await db.messages.find_one({"message_id": "m0"})
+        assert first["created_at"] == datetime(2024, 5, 1, 12, 0, 0, 123000)
+        # Dates now sort chronologically on the server
+        latest = await db.messages.find({}, {"message_id": 1}).sort("created_at", -1).limit(1).to_list(1)
+        assert latest[0]["message_id"] == "m2499"
+        assert (await db.matches.find_one({"match_id": "a"}))["last_message_at"] is None
+
+        assert sum((await migrate(db)).values()) == 0
+
+    asyncio.run(run())
+
+
+def test_sessions_with_string_expiries_still_sign_in_before_the_migration(monkeypatch):
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        monkeypatch.setattr(server, "db", db)
+        monkeypatch.setattr(server, "cache", TieredCache(bus=LocalBus()))
+        now = datetime.now(timezone.utc)
+        await db.users.insert_one({"user_id": "legacy", "email": "legacy@example.com", "name": "Legacy", "is_active": True})
+        await db.user_sessions.insert_many([
+            {"user_id": "legacy", "session_token": "live", "expires_at": (now + timedelta(days=1)).isoformat()},
+            {"user_id": "legacy", "session_token": "stale", "expires_at": (now - timedelta(days=1)).isoformat()},
+        ])
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            client.cookies.set("session_token", "live")
+            response = await client.get("/api/auth/me")
+            assert response.status_code == 200
+            assert response.json()["user_id"] == "legacy"
+            client.cookies.set("session_token", "stale")
+            assert (await client.get("/api/auth/me")).status_code == 401
+
+    asyncio.run(run())
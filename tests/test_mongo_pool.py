@@ -0,0 +1,118 @@
+import asyncio
+import os
+
+import pytest
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from mongo_pool import client_options, stale_ok_read_preference
+
+
+def test_client_options_only_sets_what_is_configured():
+    assert client_options({}) == {}
+    assert client_options({
+        "MONGO_MAX_POOL_SIZE": "50",
+        "MONGO_MIN_POOL_SIZE": "5",
+        "MONGO_MAX_IDLE_TIME_MS": "60000",
+        "MONGO_WAIT_QUEUE_TIMEOUT_MS": "2000",
+    }) == {"maxPoolSize": 50, "minPoolSize": 5, "maxIdleTimeMS": 60000, "waitQueueTimeoutMS": 2000}
+
+
+def test_compressors_skip_unknown_and_uninstalled_codecs(monkeypatch):
+    import mongo_pool
+
+    monkeypatch.setattr(mongo_pool.importlib.util, "find_spec", lambda name: None)
+    assert client_options({"MONGO_COMPRESSORS": "zstd, snappy, zlib, lz4"}) == {"compressors": ["zlib"]}
+    assert client_options({"MONGO_COMPRESSORS": "zstd"}) == {}
+
+
+def test_stale_ok_reads_default_to_secondaries_with_bounded_staleness():
+    pref = stale_ok_read_preference({})
+    assert isinstance(pref, SecondaryPreferred)
+    assert pref.max_staleness == 90
+
+    assert stale_ok_read_preference({"MONGO_MAX_STALENESS_SECONDS": "120"}).max_staleness == 120
+    assert isinstance(stale_ok_read_preference({"MONGO_STALE_READ_MODE": "primary"}), Primary)
+    with pytest.raises(ValueError):
+        stale_ok_read_preference({"MONGO_STALE_READ_MODE": "secondaryOnly"})
+
+
+@pytest.mark.skipif(not os.environ.get("MONGO_REPLICA_SET_URL"), reason="set MONGO_REPLICA_SET_URL to a local replica set")
+def test_stale_ok_reads_are_served_by_a_secondary():
+    """e.g. MONGO_REPLICA_SET_URL=mongodb://localhost:27017,localhost:27018/?replicaSet=rs0"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import monitoring
+
+    class Servers(monitoring.CommandListener):
+        def __init__(self):
+            self.finds = []
+
+        def started(self, event):
+            if event.command_name == "find":
+                self.finds.append(event.connection_id)
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    async def run():
+        listener = Servers()
+        client = AsyncIOMotorClient(
+            os.environ["MONGO_REPLICA_SET_URL"], event_listeners=[listener], **client_options({"MONGO_MAX_POOL_SIZE": "4"}),
+        )
+        try:
+            db = client["unhinged_pool_test"]
+            await db.users.insert_one({"user_id": "u1"})
+            primary = client.primary
+            await db.get_collection("users", read_preference=Primary()).find_one({"user_id": "u1"})
+            await db.get_collection("users", read_preference=stale_ok_read_preference({})).find_one({})
+            assert listener.finds[0] == primary
+            assert listener.finds[1] != primary
+        finally:
+            await client.drop_database("unhinged_pool_test")
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_a_match_list_changed_by_the_user_is_refilled_from_the_primary(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import httpx
+
+    import server
+    from cache import LocalBus, TieredCache
+
+    db = mongomock_motor.AsyncMongoMockClient(tz_aware=True)["unhinged_test"]
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "cache", TieredCache(bus=LocalBus()))
+    monkeypatch.setattr(server.job_queue, "collection", db.jobs)
+    monkeypatch.setattr(server, "STALE_OK_READS", SecondaryPreferred(max_staleness=90))
+    secondary_reads = []
+    real_stale_ok = server.stale_ok
+
+    def stale_ok(collection):
+        secondary_reads.append(collection)
+        return real_stale_ok(collection)
+
+    monkeypatch.setattr(server, "stale_ok", stale_ok)
+
+    async def run():
+        await db.users.insert_many([
+            {"user_id": u, "email": f"{u}@example.com", "name": u, "is_active": True} for u in ("u1", "u2")
+        ])
+        await db.swipes.insert_one({"swiper_id": "u2", "target_id": "u1", "action": "like"})
+        headers = {"Authorization": f"Bearer {server.create_jwt_token('u1', 'u1@example.com')}"}
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as client:
+            assert (await client.get("/api/matches")).json() == []
+            assert "matches" in secondary_reads
+
+            assert (await client.post("/api/swipe", json={"target_user_id": "u2", "action": "like"})).json()["match"]
+            secondary_reads.clear()
+            # A secondary may not have the new match yet: don't cache its answer
+            assert len((await client.get("/api/matches")).json()) == 1
+            assert "matches" not in secondary_reads
+
+    asyncio.run(run())
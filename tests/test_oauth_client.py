@@ -0,0 +1,158 @@
+import asyncio
+
+import httpx
+import pytest
+
+from oauth_client import SessionExchange
+
+
+class HandshakeTransport(httpx.AsyncBaseTransport):
+    """Local stand-in for the auth backend that counts handshakes: the first
+    request on a transport (a fresh connection) needs one, later ones don't.
+    A ``statuses`` entry that is an exception is raised instead of answering."""
+
+    def __init__(self, statuses=None):
+        self.connected = False
+        self.handshakes = 0
+        self.requests = 0
+        self.statuses = list(statuses or [])
+
+    async def handle_async_request(self, request):
+        if not self.connected:
+            self.connected = True
+            self.handshakes += 1
+        self.requests += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        if isinstance(status, Exception):
+            raise status
+        if status == "garbage":
+            return httpx.Response(200, content=b"<html>maintenance</html>")
+        body = {"email": "a@example.com", "name": request.headers["X-Session-ID"]} if status == 200 else {}
+        return httpx.Response(status, json=body)
+
+
+def test_pooled_exchange_skips_repeat_handshakes():
+    logins = 10
+
+    async def unpooled():
+        # What the endpoint used to do: a new client (and connection) per login
+        handshakes = 0
+        for i in range(logins):
+            transport = HandshakeTransport()
+            async with httpx.AsyncClient(transport=transport) as client:
+                response = await client.get("http://auth.test/session", headers={"X-Session-ID": f"s{i}"})
+                assert response.status_code == 200
+            handshakes += transport.handshakes
+        return handshakes
+
+    async def pooled():
+        transport = HandshakeTransport()
+        exchange = SessionExchange("http://auth.test/session", transport=transport)
+        await exchange.start()
+        for i in range(logins):
+            assert (await exchange.fetch(f"s{i}"))["name"] == f"s{i}"
+        await exchange.close()
+        return transport.handshakes
+
+    assert asyncio.run(unpooled()) == logins
+    assert asyncio.run(pooled()) == 1
+
+
+def test_exchange_retries_transient_errors_only():
+    async def run():
+        transport = HandshakeTransport(statuses=[503, 200, 401])
+        exchange = SessionExchange("http://auth.test/session", backoff_seconds=0, transport=transport)
+        assert (await exchange.fetch("s1"))["email"] == "a@example.com"
+        assert await exchange.fetch("bad") is None
+        assert transport.requests == 3
+
+        transport.statuses = [503, 503, 503]
+        with pytest.raises(httpx.HTTPStatusError):
+            await exchange.fetch("s2")
+        await exchange.close()
+        return exchange.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["exchanges"], stats["retried"], stats["failures"]) == (3, 3, 1)
+
+
+def test_connection_errors_share_the_retry_budget_and_bad_json_is_an_upstream_error():
+    async def run():
+        transport = HandshakeTransport(statuses=[httpx.ConnectError("refused"), 503, 200])
+        exchange = SessionExchange("http://auth.test/session", backoff_seconds=0, transport=transport)
+        assert (await exchange.fetch("s1"))["email"] == "a@example.com"
+        assert transport.requests == 3
+
+        transport.statuses = [httpx.ConnectError("refused")] * 3
+        with pytest.raises(exchange.errors):
+            await exchange.fetch("s2")
+        assert transport.requests == 6
+
+        transport.statuses = ["garbage"]
+        with pytest.raises(exchange.errors):
+            await exchange.fetch("s3")
+        await exchange.close()
+        return exchange.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["exchanges"], stats["retried"], stats["failures"]) == (3, 4, 2)
+
+
+class KeepAliveServer:
+    """A minimal HTTP/1.1 auth backend on localhost that counts the TCP
+    connections it accepts and the requests it answers."""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.url = "http://127.0.0.1:%d/session" % self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                self.requests += 1
+                await asyncio.sleep(0.005)  # so concurrent calls overlap
+                body = b'{"email": "a@example.com", "name": "n"}'
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def test_concurrent_exchanges_reuse_the_pooled_connections():
+    async def run():
+        async with KeepAliveServer() as backend:
+            exchange = SessionExchange(backend.url, max_connections=4)
+            await exchange.start()
+            for _ in range(3):
+                results = await asyncio.gather(*(exchange.fetch(f"s{i}") for i in range(20)))
+                assert all(r["email"] == "a@example.com" for r in results)
+            await exchange.close()
+            return backend.requests, backend.connections
+
+    async def unpooled():
+        async with KeepAliveServer() as backend:
+            async def login(i):
+                async with httpx.AsyncClient() as client:
+                    return await client.get(backend.url, headers={"X-Session-ID": f"s{i}"})
+
+            await asyncio.gather(*(login(i) for i in range(20)))
+            return backend.connections
+
+    requests, connections = asyncio.run(run())
+    # 60 logins, at most one handshake per pooled connection
+    assert requests == 60
+    assert connections <= 4
+    # A client per login (what the endpoint used to do) connects every time
+    assert asyncio.run(unpooled()) == 20
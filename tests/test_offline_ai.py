@@ -0,0 +1,28 @@
+import random
+
+from offline_ai import NEGATIVE_QUALITY_RIFFS, RED_FLAG_RIFFS, icebreaker, roast
+
+
+def test_every_suggestion_has_riffs():
+    for riffs in list(RED_FLAG_RIFFS.values()) + list(NEGATIVE_QUALITY_RIFFS.values()):
+        assert riffs and all("{" not in r for r in riffs)
+
+
+def test_roast_uses_curated_riffs_for_known_flags():
+    rng = random.Random(7)
+    text = roast(["i own multiple SWORDS"], ["Cries at commercials"], rng=rng)
+    assert any(r in text for r in RED_FLAG_RIFFS["I own multiple swords"])
+    assert any(r in text for r in NEGATIVE_QUALITY_RIFFS["Cries at commercials"])
+
+
+def test_roast_quotes_custom_traits_and_handles_empty_input():
+    text = roast(["I alphabetize my cereal"], [], rng=random.Random(1))
+    assert '"I alphabetize my cereal"' in text
+    assert "red flags" in roast([], [])
+
+
+def test_icebreaker_addresses_recipient():
+    for seed in range(20):
+        text = icebreaker(["I think astrology is real"], ["Has strong opinions about fonts"], "Sam", rng=random.Random(seed))
+        assert "Sam" in text and "{" not in text
+    assert "there" in icebreaker([], [], rng=random.Random(0))
@@ -0,0 +1,42 @@
+import asyncio
+
+import httpx
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server  # noqa: E402
+from cache import LocalBus, TieredCache  # noqa: E402
+
+
+def test_update_profile_recomputes_completeness_and_stores_values_literally(monkeypatch):
+    db = mongomock_motor.AsyncMongoMockClient()["unhinged_test"]
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "cache", TieredCache(bus=LocalBus()))
+
+    async def run():
+        await db.users.insert_one({
+            "user_id": "u1", "email": "u1@example.com", "name": "Sam", "password_hash": "x",
+            "red_flags": ["I own multiple swords"], "photos": ["p.jpg"], "profile_complete": False,
+        })
+        token = server.create_jwt_token("u1", "u1@example.com")
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers={"Authorization": f"Bearer {token}"}) as client:
+            response = await client.put("/api/profile", json={"age": 29})
+            assert response.status_code == 200
+            assert response.json()["profile_complete"] is False
+            assert response.json()["profile_version"] == 1
+
+            # The last required field completes the profile; "$name" is text, not a field path
+            response = await client.put("/api/profile", json={"bio": "$name", "city": "$$ROOT"})
+            body = response.json()
+            assert body["profile_complete"] is True
+            assert body["bio"] == "$name" and body["city"] == "$$ROOT"
+            assert body["profile_version"] == 2
+            assert "password_hash" not in body
+
+        stored = await db.users.find_one({"user_id": "u1"})
+        assert stored["bio"] == "$name" and stored["profile_complete"] is True
+
+    asyncio.run(run())
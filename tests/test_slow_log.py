@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+
+import slow_log
+from metrics import current_route
+from slow_log import RequestProfile, SlowQueryListener, current_profile, slow_log_middleware
+
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    monkeypatch.setattr(slow_log, "config", slow_log.SlowLogConfig(profile_dir=str(tmp_path)))
+    monkeypatch.setattr(slow_log, "recent", slow_log.deque(maxlen=10))
+    return slow_log.config
+
+
+def test_listener_adds_round_trips_to_the_request_profile(config):
+    config.query_threshold_seconds = 0.05
+    listener = SlowQueryListener()
+    profile = RequestProfile()
+    token = current_profile.set(profile)
+    try:
+        for request_id, micros in ((1, 2000), (2, 80000)):
+            listener.started(SimpleNamespace(
+                request_id=request_id, command_name="find",
+                command={"find": "users", "filter": {"user_id": "x", "is_active": True}},
+            ))
+            listener.succeeded(SimpleNamespace(request_id=request_id, command_name="find", duration_micros=micros))
+    finally:
+        current_profile.reset(token)
+
+    assert profile.mongo_calls == 2
+    assert profile.commands["users.find"] == [2, pytest.approx(0.082)]
+    (entry,) = slow_log.recent
+    assert entry["type"] == "slow_query" and entry["filter_keys"] == ["is_active", "user_id"]
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_slow_request_is_logged_with_a_folded_profile(config, monkeypatch):
+    config.request_threshold_seconds = 0.05
+    config.profile_sample_rate = 1.0
+    config.profile_interval_seconds = 0.001
+
+    async def call_next(request):
+        current_profile.get().add("matches.find", 0.01)
+        _busy(0.1)
+        return Response("ok")
+
+    async def run():
+        token = current_route.set("get_matches")
+        try:
+            request = Request({"type": "http", "method": "GET", "path": "/api/matches", "headers": [], "query_string": b""})
+            return await slow_log_middleware(request, call_next)
+        finally:
+            current_route.reset(token)
+
+    loop_thread = threading.get_ident()
+    blocking_calls = []
+    for name in ("stop", "write"):
+        def record(self, *args, _name=name, _real=getattr(slow_log.StackSampler, name)):
+            blocking_calls.append((_name, threading.get_ident() != loop_thread))
+            return _real(self, *args)
+        monkeypatch.setattr(slow_log.StackSampler, name, record)
+
+    assert asyncio.run(run()).status_code == 200
+    # Joining the sampler and writing the profile happen off the event loop
+    assert blocking_calls == [("stop", True), ("write", True)]
+    (entry,) = slow_log.recent
+    assert entry["type"] == "slow_request" and entry["route"] == "get_matches"
+    assert entry["mongo_calls"] == 1 and entry["commands"] == {"matches.find": {"calls": 1, "seconds": 0.01}}
+    with open(entry["profile"]) as f:
+        folded = f.read().splitlines()
+    assert any("_busy" in line.rsplit(" ", 1)[0].split(";")[-1] for line in folded)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in folded)
+
+
+def test_admin_endpoint_toggles_at_runtime(config, monkeypatch):
+    pytest.importorskip("mongomock_motor")
+    import server
+
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.put("/api/admin/slow-log", json={"enabled": False})).status_code == 403
+            response = await client.put(
+                "/api/admin/slow-log", json={"enabled": False, "profile_sample_rate": 0.25},
+                headers={"X-Admin-Token": "secret"},
+            )
+            assert response.status_code == 200
+            assert (await client.put(
+                "/api/admin/slow-log", json={"profile_sample_rate": 2}, headers={"X-Admin-Token": "secret"},
+            )).status_code == 422
+            return response.json()
+
+    body = asyncio.run(run())
+    assert body["enabled"] is False and body["profile_sample_rate"] == 0.25
+    assert slow_log.config.enabled is False
@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+
+from throttle import BucketStore, LoginThrottle, MemoryBucketStore, Throttled
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills():
+    async def run():
+        clock = FakeClock()
+        store = MemoryBucketStore(clock=clock)
+        results = [await store.take("k", capacity=3, refill_per_second=0.5) for _ in range(4)]
+        assert [ok for ok, _ in results] == [True, True, True, False]
+        assert results[-1][1] == pytest.approx(2.0)
+
+        clock.now = 2.0
+        assert (await store.take("k", 3, 0.5))[0]
+        assert not (await store.take("k", 3, 0.5))[0]
+
+    asyncio.run(run())
+
+
+def test_memory_store_is_bounded():
+    async def run():
+        store = MemoryBucketStore(max_keys=100)
+        for i in range(1000):
+            await store.take(f"login:ip:10.0.{i // 256}.{i % 256}", 5, 1)
+        return store.stats()
+
+    stats = asyncio.run(run())
+    assert stats["keys"] == 100 and stats["evictions"] == 900
+    assert 0 < stats["approx_bytes"] < 100 * 1024
+
+
+class SharedStandIn(BucketStore):
+    """Stands in for a shared backend: one MemoryBucketStore behind an await."""
+
+    def __init__(self):
+        self.backend = MemoryBucketStore()
+        self.round_trips = 0
+
+    async def take(self, key, capacity, refill_per_second, cost=1.0):
+        self.round_trips += 1
+        await asyncio.sleep(0)
+        return await self.backend.take(key, capacity, refill_per_second, cost)
+
+
+def test_workers_sharing_a_backend_share_the_budget():
+    async def run():
+        shared = SharedStandIn()
+        workers = [LoginThrottle(shared, email_burst=4) for _ in range(2)]
+        outcomes = []
+        for i in range(6):
+            try:
+                await workers[i % 2].check(f"10.0.0.{i}", "Victim@Example.com ")
+                outcomes.append(True)
+            except Throttled as e:
+                assert e.scope == "email"
+                outcomes.append(False)
+        assert outcomes == [True] * 4 + [False] * 2
+        assert shared.round_trips == 12
+        assert workers[0].stats()["rejected"]["email"] + workers[1].stats()["rejected"]["email"] == 2
+
+    asyncio.run(run())
+
+
+def test_login_is_rejected_before_bcrypt(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        monkeypatch.setattr(server, "db", db)
+        monkeypatch.setattr(server, "login_throttle", LoginThrottle(ip_burst=3, email_burst=100))
+        await db.users.insert_one({
+            "user_id": "u1", "email": "a@example.com", "name": "a",
+            "password_hash": server.hash_password("correct horse"),
+        })
+        checks = 0
+        real_verify = server.verify_password
+
+        def counting_verify(password, hashed):
+            nonlocal checks
+            checks += 1
+            return real_verify(password, hashed)
+
+        monkeypatch.setattr(server, "verify_password", counting_verify)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            codes = [
+                (await client.post("/api/auth/login", json={"email": "a@example.com", "password": "guess"})).status_code
+                for _ in range(5)
+            ]
+            throttled = await client.post("/api/auth/login", json={"email": "a@example.com", "password": "correct horse"})
+        assert codes == [401, 401, 401, 429, 429]
+        assert throttled.status_code == 429 and int(throttled.headers["Retry-After"]) >= 1
+        assert checks == 3
+        assert server.login_throttle.stats()["rejected"] == {"ip": 3, "email": 0}
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+import asyncio
+
+import httpx
+import pytest
+
+from warmup import Readiness
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server  # noqa: E402
+from ai_service import AIService  # noqa: E402
+from cache import LocalBus, TieredCache  # noqa: E402
+from change_streams import ChangeConsumer  # noqa: E402
+from llm import StubLLMProvider  # noqa: E402
+from oauth_client import SessionExchange  # noqa: E402
+
+
+def test_optional_step_failure_is_recorded_but_required_failure_raises():
+    async def broken():
+        raise RuntimeError("boom")
+
+    async def run():
+        readiness = Readiness()
+        await readiness.step("optional", broken, required=False)
+        assert readiness.steps["optional"]["ok"] is False
+        with pytest.raises(RuntimeError):
+            await readiness.step("required", broken)
+        assert readiness.stats()["status"] == "starting"
+
+    asyncio.run(run())
+
+
+def test_lifespan_warms_up_then_reports_ready_and_draining(monkeypatch):
+    client = mongomock_motor.AsyncMongoMockClient()
+    db = client["unhinged_test"]
+    pings = []
+
+    async def open_pool(c, connections):
+        pings.append(connections)
+
+    monkeypatch.setattr(server, "client", client)
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "open_pool", open_pool)
+    monkeypatch.setattr(server, "readiness", Readiness())
+    monkeypatch.setattr(server, "ai_service", AIService(StubLLMProvider()))
+    monkeypatch.setattr(server.job_queue, "collection", db.jobs)
+    monkeypatch.setattr(server, "cache", TieredCache(bus=LocalBus()))
+    monkeypatch.setattr(server, "change_consumer", ChangeConsumer(db, server.cache))
+    monkeypatch.setattr(server.maintenance, "db", db)
+    exchange = SessionExchange(transport=httpx.MockTransport(lambda request: httpx.Response(404)))
+    monkeypatch.setattr(server, "_session_exchange", exchange)
+    cloudinary_loads = []
+    monkeypatch.setattr(server, "cloudinary_utils", lambda: cloudinary_loads.append(1))
+
+    async def ready_status():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            response = await http.get("/api/health/ready")
+            return response.status_code, response.json()
+
+    async def run():
+        assert (await ready_status())[0] == 503
+        async with server.lifespan(server.app):
+            status, body = await ready_status()
+            assert status == 200
+            assert set(body["steps"]) == {"mongo", "indexes", "llm", "discovery", "oauth", "cloudinary", "cache", "change_streams"}
+            assert all(step["ok"] for step in body["steps"].values())
+            assert exchange._client is not None and cloudinary_loads == [1]
+        status, body = await ready_status()
+        assert (status, body["status"]) == (503, "draining")
+        assert pings == [server.MONGO_WARM_CONNECTIONS]
+        assert exchange._client is None
+
+    asyncio.run(run())